@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from app.db.database import get_db
-from app.services import product_service
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from itertools import islice
+import json
+from app.db.database import get_async_db, get_primary_read_db
+from app.db import query_stats
+from app.logging_config import get_logger
+from app.services import product_service_async as product_service, result_cache
 from app.schemas.product import (
     Product, ProductCreate, ProductDetail,
     PartType, PartTypeCreate,
@@ -10,44 +15,43 @@ from app.schemas.product import (
     OptionDependency, OptionDependencyCreate,
     ConditionalPrice, ConditionalPriceCreate
 )
-from app.models.product import PartOption as PartOptionModel, OptionDependency as OptionDependencyModel
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # Routes for managing products
 @router.post("/admin/products", response_model=Product, status_code=201)
-def create_product(product: ProductCreate, db: Session = Depends(get_db)):
+async def create_product(product: ProductCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Creates a new product.
     """
-    return product_service.create_product(db=db, product=product)
+    return await product_service.create_product(db=db, product=product)
 
 @router.post("/admin/products/{product_id}/part-types", response_model=PartType, status_code=201)
-def create_part_type(product_id: int, part_type: PartTypeCreate, db: Session = Depends(get_db)):
+async def create_part_type(product_id: int, part_type: PartTypeCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Adds a new part type to a product.
     """
-    db_product = product_service.get_product(db, product_id=product_id)
-    if db_product is None:
+    if not await product_service.product_exists(db, product_id=product_id):
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return product_service.create_part_type(db=db, part_type=part_type, product_id=product_id)
+    return await product_service.create_part_type(db=db, part_type=part_type, product_id=product_id)
 
 @router.post("/admin/part-types/{part_type_id}/options", response_model=PartOption, status_code=201)
-def create_part_option(part_type_id: int, part_option: PartOptionCreate, db: Session = Depends(get_db)):
+async def create_part_option(part_type_id: int, part_option: PartOptionCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Adds a new option to a part type.
     """
-    return product_service.create_part_option(db=db, part_option=part_option, part_type_id=part_type_id)
+    return await product_service.create_part_option(db=db, part_option=part_option, part_type_id=part_type_id)
 
 @router.post("/admin/options/{option_id}/dependencies", response_model=OptionDependency, status_code=201)
-def create_option_dependency(option_id: int, dependency: OptionDependencyCreate, db: Session = Depends(get_db)):
+async def create_option_dependency(option_id: int, dependency: OptionDependencyCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Adds a dependency to an option.
     """
-    return product_service.create_option_dependency(db=db, dependency=dependency, option_id=option_id)
+    return await product_service.create_option_dependency(db=db, dependency=dependency, option_id=option_id)
 
 @router.post("/admin/products/{product_id}/dependencies", response_model=OptionDependency, status_code=201)
-def create_product_dependency(product_id: int, dependency: dict, db: Session = Depends(get_db)):
+async def create_product_dependency(product_id: int, dependency: dict, db: AsyncSession = Depends(get_async_db)):
     """
     Adds a dependency through product ID.
     """
@@ -57,90 +61,119 @@ def create_product_dependency(product_id: int, dependency: dict, db: Session = D
         type=dependency["type"]
     )
     
-    # Crear la dependencia y obtener el resultado
-    result = product_service.create_option_dependency(db=db, dependency=dependency_create, option_id=dependency["optionId"])
-    
-    # Convertir el tipo de dependencia de enum a string para evitar errores de serialización
-    if hasattr(result.type, 'value'):
-        result.type = result.type.value
-    
-    return result
+    # El esquema OptionDependency convierte el tipo de dependencia a string al serializar
+    return await product_service.create_option_dependency(db=db, dependency=dependency_create, option_id=dependency["optionId"])
 
 @router.post("/admin/options/{option_id}/conditional-prices", response_model=ConditionalPrice, status_code=201)
-def create_conditional_price(option_id: int, conditional_price: ConditionalPriceCreate, db: Session = Depends(get_db)):
+async def create_conditional_price(option_id: int, conditional_price: ConditionalPriceCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Adds a conditional price to an option.
     """
-    return product_service.create_conditional_price(db=db, conditional_price=conditional_price, option_id=option_id)
+    return await product_service.create_conditional_price(db=db, conditional_price=conditional_price, option_id=option_id)
 
 # Routes for updating stock
 @router.put("/admin/options/{option_id}/stock")
-def update_option_stock(option_id: int, in_stock: bool, db: Session = Depends(get_db)):
+async def update_option_stock(option_id: int, in_stock: bool, db: AsyncSession = Depends(get_async_db)):
     """
     Updates the stock status of an option.
     """
-    option = db.query(PartOptionModel).filter(PartOptionModel.id == option_id).first()
+    option = await product_service.update_option_stock(db, option_id=option_id, in_stock=in_stock)
     if not option:
         raise HTTPException(status_code=404, detail="Opción no encontrada")
     
-    option.in_stock = in_stock
-    db.commit()
-    db.refresh(option)
     return {"message": f"Stock actualizado para {option.name}", "in_stock": option.in_stock}
 
 @router.delete("/admin/part-types/{part_type_id}", status_code=204)
-def delete_part_type(part_type_id: int, db: Session = Depends(get_db)):
+async def delete_part_type(part_type_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Deletes a part type and all its associated options.
     """
     try:
-        product_service.delete_part_type(db, part_type_id=part_type_id)
+        await product_service.delete_part_type(db, part_type_id=part_type_id)
         return None
     except HTTPException as e:
         raise e
     except Exception as e:
-        print(f"Error al eliminar tipo de parte {part_type_id}:", str(e))
+        logger.exception("admin.part_type_delete_failed", part_type_id=part_type_id)
         raise HTTPException(status_code=500, detail=f"Error al eliminar tipo de parte: {str(e)}")
 
 @router.delete("/admin/part-types/{part_type_id}/options/{option_id}", status_code=204)
-def delete_part_option(part_type_id: int, option_id: int, db: Session = Depends(get_db)):
+async def delete_part_option(part_type_id: int, option_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Deletes an option from a part type.
     """
     try:
-        product_service.delete_part_option(db, part_type_id=part_type_id, option_id=option_id)
+        await product_service.delete_part_option(db, part_type_id=part_type_id, option_id=option_id)
         return None
     except HTTPException as e:
         raise e
     except Exception as e:
-        print(f"Error al eliminar opción {option_id} del tipo de parte {part_type_id}:", str(e))
+        logger.exception("admin.part_option_delete_failed", part_type_id=part_type_id, option_id=option_id)
         raise HTTPException(status_code=500, detail=f"Error al eliminar opción: {str(e)}")
 
 @router.delete("/admin/dependencies/{dependency_id}", status_code=204)
-def delete_dependency(dependency_id: int, db: Session = Depends(get_db)):
+async def delete_dependency(dependency_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Deletes a dependency between options.
     """
     try:
-        # Find the dependency
-        dependency = db.query(OptionDependencyModel).filter(OptionDependencyModel.id == dependency_id).first()
-        
-        if not dependency:
-            raise HTTPException(status_code=404, detail="Dependencia no encontrada")
-        
         # Delete the dependency
-        db.delete(dependency)
-        db.commit()
+        if not await product_service.delete_option_dependency(db, dependency_id=dependency_id):
+            raise HTTPException(status_code=404, detail="Dependencia no encontrada")
         return None
     except HTTPException as e:
         raise e
     except Exception as e:
-        print(f"Error al eliminar dependencia {dependency_id}:", str(e))
+        logger.exception("admin.dependency_delete_failed", dependency_id=dependency_id)
         raise HTTPException(status_code=500, detail=f"Error al eliminar dependencia: {str(e)}")
 
 @router.get("/admin/products/{product_id}/dependencies", response_model=List[OptionDependency])
-def get_product_dependencies(product_id: int, db: Session = Depends(get_db)):
+async def get_product_dependencies(product_id: int, db: AsyncSession = Depends(get_primary_read_db)):
     """
     Gets all dependencies of a product.
     """
-    return product_service.get_product_dependencies(db=db, product_id=product_id) 
\ No newline at end of file
+    return await product_service.get_product_dependencies(db=db, product_id=product_id) 
+
+@router.get("/admin/products/{product_id}/configurations/count")
+async def count_product_configurations(product_id: int, db: AsyncSession = Depends(get_primary_read_db)):
+    """
+    Counts the valid configurations of a product (one in-stock option per part type
+    satisfying every requires/excludes rule) without materializing them.
+    """
+    count = await product_service.count_configurations(db, product_id)
+    if count is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    return {"product_id": product_id, "count": count}
+
+@router.get("/admin/products/{product_id}/configurations")
+async def stream_product_configurations(
+    product_id: int,
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of configurations to return"),
+    db: AsyncSession = Depends(get_primary_read_db)
+):
+    """
+    Streams the valid configurations of a product as newline-delimited JSON, one
+    configuration per line, generated lazily.
+    """
+    configurations = await product_service.iter_configurations(db, product_id)
+    if configurations is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    if limit is not None:
+        configurations = islice(configurations, limit)
+
+    lines = (json.dumps({"options": options}) + "\n" for options in configurations)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@router.get("/admin/cache/stats")
+def get_cache_stats():
+    """
+    Gets the hit, miss and eviction counters of the validation and price result caches.
+    """
+    return result_cache.get_stats()
+
+@router.get("/admin/db/stats")
+def get_db_stats():
+    """
+    Gets the number of requests, SQL statements and database time accumulated per route.
+    """
+    return query_stats.route_stats.snapshot()
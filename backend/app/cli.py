@@ -0,0 +1,89 @@
+"""
+Comandos de administración de Marcus Bikes.
+
+Uso:
+    python -m app.cli count-configurations <product_id>
+    python -m app.cli enumerate-configurations <product_id> [--limit N]
+    python -m app.cli sweep-carts [--ttl-hours H] [--batch-size N]
+"""
+import argparse
+import json
+import sys
+from datetime import timedelta
+from itertools import islice
+from typing import List, Optional
+from app.db.database import SessionLocal
+from app.models import cart  # noqa: F401 - registra los modelos que referencian las relaciones de PartOption
+from app.services import configuration_solver, cart_sweeper
+
+def count_configurations(args: argparse.Namespace) -> int:
+    """
+    Muestra el número de configuraciones válidas de un producto.
+    """
+    db = SessionLocal()
+    try:
+        count = configuration_solver.count_configurations(db, args.product_id)
+    finally:
+        db.close()
+
+    if count is None:
+        print(f"Producto {args.product_id} no encontrado", file=sys.stderr)
+        return 1
+    print(count)
+    return 0
+
+def enumerate_configurations(args: argparse.Namespace) -> int:
+    """
+    Escribe las configuraciones válidas de un producto en JSON, una por línea.
+    """
+    db = SessionLocal()
+    try:
+        configurations = configuration_solver.iter_configurations(db, args.product_id)
+    finally:
+        db.close()
+
+    if configurations is None:
+        print(f"Producto {args.product_id} no encontrado", file=sys.stderr)
+        return 1
+    if args.limit is not None:
+        configurations = islice(configurations, args.limit)
+    for options in configurations:
+        sys.stdout.write(json.dumps({"options": options}) + "\n")
+    return 0
+
+def sweep_carts(args: argparse.Namespace) -> int:
+    """
+    Borra los carritos abandonados y muestra las filas borradas por tabla en JSON.
+    """
+    db = SessionLocal()
+    try:
+        result = cart_sweeper.sweep_abandoned_carts(db, ttl=timedelta(hours=args.ttl_hours), batch_size=args.batch_size)
+    finally:
+        db.close()
+
+    print(json.dumps({"deleted": result.deleted, "batches": result.batches, "duration_seconds": round(result.duration, 3)}))
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Comandos de administración de Marcus Bikes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    count_parser = subparsers.add_parser("count-configurations", help="Cuenta las configuraciones válidas de un producto")
+    count_parser.add_argument("product_id", type=int)
+    count_parser.set_defaults(func=count_configurations)
+
+    enumerate_parser = subparsers.add_parser("enumerate-configurations", help="Enumera las configuraciones válidas de un producto")
+    enumerate_parser.add_argument("product_id", type=int)
+    enumerate_parser.add_argument("--limit", type=int, default=None, help="Número máximo de configuraciones")
+    enumerate_parser.set_defaults(func=enumerate_configurations)
+
+    sweep_parser = subparsers.add_parser("sweep-carts", help="Borra los carritos sin actividad")
+    sweep_parser.add_argument("--ttl-hours", type=float, default=cart_sweeper.CART_TTL_HOURS, help="Horas sin actividad tras las que se borra un carrito")
+    sweep_parser.add_argument("--batch-size", type=int, default=cart_sweeper.CART_SWEEP_BATCH_SIZE, help="Carritos borrados por transacción")
+    sweep_parser.set_defaults(func=sweep_carts)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,198 @@
+import itertools
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import List
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from app.db.query_stats import instrument_engine
+from app.db.pool import InstrumentedQueuePool, InstrumentedAsyncQueuePool
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
 
 # Configuración de la base de datos
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/marcusbikes")
 
-# Crear engine de SQLAlchemy
-engine = create_engine(DATABASE_URL)
+# Drivers asíncronos equivalentes a los síncronos de DATABASE_URL
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url: str) -> str:
+    """
+    Convierte una URL de base de datos síncrona en la equivalente con driver asíncrono.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No hay driver asíncrono configurado para {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+# Réplicas de lectura para las rutas del catálogo, separadas por comas. Sin réplicas, las
+# lecturas van a la base de datos principal.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Segundos durante los que una réplica que no responde deja de recibir lecturas
+DATABASE_REPLICA_RETRY_SECONDS = float(os.getenv("DATABASE_REPLICA_RETRY_SECONDS", "30"))
+# Segundos tras una escritura del catálogo en los que las lecturas del proceso que la hizo van
+# a la principal, para que vea su propia escritura. Los demás procesos pueden leer de una
+# réplica atrasada, pero no guardan en caché lo leído con una versión del catálogo anterior
+# a la conocida (ver catalog_version)
+DATABASE_REPLICA_PIN_SECONDS = float(os.getenv("DATABASE_REPLICA_PIN_SECONDS", "5"))
+
+# Pool de conexiones de cada engine. El total por proceso es (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# por engine y debe caber, multiplicado por el número de workers, en max_connections de Postgres.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Saturación del pool (conexiones en uso / capacidad) a partir de la cual el worker deja de estar listo
+DB_POOL_READY_MAX_SATURATION = float(os.getenv("DB_POOL_READY_MAX_SATURATION", "1.0"))
+
+def pool_options(url: str, poolclass) -> dict:
+    """
+    Opciones del pool para create_engine. SQLite mantiene el pool por defecto de SQLAlchemy,
+    que no admite estos parámetros para bases de datos en memoria.
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+# Crear engine de SQLAlchemy, instrumentado para contar sentencias y tiempo por petición.
+# El engine síncrono se mantiene para scripts, la CLI y los tests.
+engine = instrument_engine(create_engine(DATABASE_URL, **pool_options(DATABASE_URL, InstrumentedQueuePool)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine asíncrono para las rutas de la API. Los objetos no se expiran al hacer commit
+# porque fuera de la sesión no se pueden recargar de forma perezosa.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, InstrumentedAsyncQueuePool)
+)
+instrument_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+class ReadOnlySession(Session):
+    """
+    Sesión de las rutas que solo leen. No hace autoflush ni expira los objetos al hacer
+    commit, y rechaza el flush si se ha añadido, modificado o borrado algún objeto, de
+    modo que una lectura nunca genera sentencias de escritura.
+    """
+
+@event.listens_for(ReadOnlySession, "before_flush")
+def _reject_writes(session, flush_context, instances):
+    if session.new or session.dirty or session.deleted:
+        raise exc.InvalidRequestError("La sesión es de solo lectura")
+
+def read_only_bind(async_engine):
+    """
+    Engine para sesiones de solo lectura. En Postgres abre las transacciones como READ ONLY
+    (el driver lo indica en el BEGIN, sin una sentencia adicional); el resto de bases de
+    datos no tiene un modo equivalente y usa el engine tal cual.
+    """
+    if async_engine.dialect.name == "postgresql":
+        return async_engine.execution_options(postgresql_readonly=True)
+    return async_engine
+
+def read_only_sessionmaker(async_engine) -> async_sessionmaker:
+    return async_sessionmaker(
+        bind=read_only_bind(async_engine),
+        sync_session_class=ReadOnlySession,
+        autoflush=False,
+        expire_on_commit=False
+    )
+
+ReadOnlyAsyncSessionLocal = read_only_sessionmaker(async_engine)
+
+class ReadReplicaRouter:
+    """
+    Reparte las sesiones de solo lectura entre las réplicas en turno rotatorio. Una réplica
+    que no acepta conexiones se aparta durante retry_after segundos y la lectura pasa a la
+    siguiente; si no queda ninguna disponible, se usa la base de datos principal. Las
+    escrituras nunca pasan por aquí: usan siempre la sesión de la principal.
+    """
+
+    def __init__(
+        self,
+        primary: async_sessionmaker,
+        replicas: List[async_sessionmaker],
+        retry_after: float = DATABASE_REPLICA_RETRY_SECONDS,
+        pin_after_write: float = DATABASE_REPLICA_PIN_SECONDS,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.retry_after = retry_after
+        self.pin_after_write = pin_after_write
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._unavailable_until = [0.0] * len(replicas)
+        self._pinned_until = 0.0
+
+    def pin_to_primary(self) -> None:
+        """
+        Envía las lecturas a la principal durante pin_after_write segundos. Se llama después
+        de confirmar una escritura del catálogo y solo afecta a este proceso.
+        """
+        with self._lock:
+            self._pinned_until = time.monotonic() + self.pin_after_write
+
+    def candidates(self) -> List[int]:
+        """
+        Posiciones de las réplicas disponibles, empezando por la que tiene el turno.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not self.replicas or now < self._pinned_until:
+                return []
+            start = next(self._turn) % len(self.replicas)
+            order = [(start + offset) % len(self.replicas) for offset in range(len(self.replicas))]
+            return [position for position in order if self._unavailable_until[position] <= now]
+
+    def mark_unavailable(self, position: int) -> None:
+        with self._lock:
+            self._unavailable_until[position] = time.monotonic() + self.retry_after
+
+    async def open_session(self) -> AsyncSession:
+        """
+        Abre una sesión de lectura con la conexión ya obtenida, de modo que una réplica caída
+        se detecta aquí y no a mitad de la petición.
+        """
+        for position in self.candidates():
+            session = self.replicas[position]()
+            try:
+                await session.connection()
+                return session
+            except (exc.DBAPIError, OSError):
+                await session.close()
+                self.mark_unavailable(position)
+                logger.warning("db.replica_unavailable", replica=position)
+        return self.primary()
+
+def replica_session_factories(urls: List[str]) -> List[async_sessionmaker]:
+    factories = []
+    for url in urls:
+        url = async_database_url(url)
+        replica_engine = create_async_engine(url, **pool_options(url, InstrumentedAsyncQueuePool))
+        instrument_engine(replica_engine.sync_engine)
+        factories.append(read_only_sessionmaker(replica_engine))
+    return factories
+
+read_router = ReadReplicaRouter(ReadOnlyAsyncSessionLocal, replica_session_factories(DATABASE_REPLICA_URLS))
+
 # Base para los modelos
 Base = declarative_base()
 
@@ -21,6 +204,38 @@ def get_db():
     finally:
         db.close()
 
+# Dependencia para obtener la sesión asíncrona de BD
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Dependencia para obtener una sesión de solo lectura de la base de datos principal
+async def get_primary_read_db():
+    async with ReadOnlyAsyncSessionLocal() as db:
+        yield db
+
+# Dependencia para obtener una sesión de solo lectura, de una réplica si las hay.
+# Solo para rutas que no escriben en la base de datos.
+async def get_read_db():
+    db = await read_router.open_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
 # Crear tablas
 def create_tables():
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+
+async def run_in_session(db: AsyncSession, function, *args, schema=None, **kwargs):
+    """
+    Ejecuta una función de servicio síncrona sobre la sesión asíncrona. Si se indica un
+    esquema, el resultado se convierte dentro de la sesión, mientras las relaciones aún
+    pueden cargarse, y se devuelve desacoplado de la base de datos.
+    """
+    def call(session):
+        result = function(session, *args, **kwargs)
+        if schema is not None and result is not None:
+            return TypeAdapter(schema).validate_python(result, from_attributes=True)
+        return result
+    return await db.run_sync(call)
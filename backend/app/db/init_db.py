@@ -1,7 +1,11 @@
 from sqlalchemy.orm import Session
 from app.models.product import Product, PartType, PartOption, OptionDependency, ConditionalPrice, DependencyType
 from app.models.cart import Cart, CartItem, CartItemOption
+from app.services.catalog_version import bump_catalog_version
 from decimal import Decimal
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
 
 def init_db(db: Session):
     """
@@ -26,10 +30,10 @@ def init_db(db: Session):
         db.query(Product).delete()
         
         db.commit()
-        print("Base de datos limpiada completamente")
-    except Exception as e:
+        logger.info("db.cleared")
+    except Exception:
         db.rollback()
-        print(f"Error al limpiar la base de datos: {e}")
+        logger.exception("db.clear_failed")
         # Continuar con la creación de datos nuevos
     
     # Crear productos de bicicletas
@@ -1044,12 +1048,15 @@ def init_db(db: Session):
     
     db.commit()
     
-    print("Base de datos inicializada con datos de ejemplo ampliados y realistas")
+    # Invalidar las reglas compiladas y los resultados en caché del catálogo anterior
+    bump_catalog_version(db)
+    
+    logger.info("db.seeded")
 
 def create_initial_data(db: Session):
     try:
         init_db(db)
-    except Exception as e:
-        print(f"Error al inicializar la base de datos: {e}")
+    except Exception:
+        logger.exception("db.seed_failed")
         db.rollback()
         raise 
\ No newline at end of file
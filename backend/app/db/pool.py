@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Optional
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+from app.metrics import Histogram
+
+# Límites de los buckets del tiempo de espera al pedir una conexión, en segundos
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class PoolStats:
+    """
+    Contadores de las peticiones de conexión a un pool: tiempo de espera, peticiones que
+    encontraron el pool agotado, las que siguen esperando una conexión libre y las esperas
+    que terminaron por timeout.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkout_wait = Histogram(CHECKOUT_BUCKETS)
+        self.waiting = 0
+        self.exhausted = 0
+        self.timeouts = 0
+
+    def checkout_started(self, exhausted: bool) -> None:
+        if exhausted:
+            with self._lock:
+                self.waiting += 1
+                self.exhausted += 1
+
+    def checkout_finished(self, duration: float, exhausted: bool, timed_out: bool) -> None:
+        with self._lock:
+            if exhausted:
+                self.waiting -= 1
+            self.checkout_wait.observe(duration)
+            if timed_out:
+                self.timeouts += 1
+
+class InstrumentedPoolMixin:
+    """
+    Mide cada petición de conexión al pool. Una petición encuentra el pool agotado cuando
+    todas las conexiones, incluido el desbordamiento, están en uso y tiene que esperar a
+    que se libere alguna.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        exhausted = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        self.stats.checkout_started(exhausted)
+        timed_out = False
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.stats.checkout_finished(time.perf_counter() - started, exhausted, timed_out)
+
+    def recreate(self):
+        # dispose() sustituye el pool por uno nuevo; los contadores se conservan
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def pool_capacity(pool: Pool) -> Optional[int]:
+    """
+    Número máximo de conexiones simultáneas del pool, o None si no tiene límite.
+    """
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow
+
+def pool_health(pool: Pool, max_saturation: float = 1.0) -> dict:
+    """
+    Estado del pool para la comprobación de disponibilidad: conexiones en uso, capacidad,
+    saturación y peticiones esperando una conexión. El pool no está listo si hay peticiones
+    esperando o la saturación alcanza max_saturation.
+    """
+    capacity = pool_capacity(pool)
+    if capacity is None:
+        return {"ready": True}
+
+    checked_out = pool.checkedout()
+    saturation = checked_out / capacity if capacity else 1.0
+    stats = getattr(pool, "stats", None)
+    waiting = stats.waiting if stats is not None else 0
+    return {
+        "ready": waiting == 0 and saturation < max_saturation,
+        "checked_out": checked_out,
+        "capacity": capacity,
+        "saturation": round(saturation, 3),
+        "waiting": waiting,
+    }
@@ -0,0 +1,98 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class QueryStats:
+    """
+    Número de sentencias SQL ejecutadas y tiempo total en base de datos de un bloque de
+    código, normalmente una petición HTTP. Las mediciones anidadas se suman también a la
+    medición que las contiene.
+    """
+
+    def __init__(self, parent: Optional["QueryStats"] = None):
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+    def record(self, duration: float) -> None:
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.duration += duration
+            stats = stats.parent
+
+# Medición activa en el contexto actual. FastAPI copia el contexto al hilo que ejecuta
+# los endpoints síncronos, así que las consultas de la petición se suman a su medición.
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Cuenta las sentencias SQL y el tiempo en base de datos del bloque.
+    """
+    stats = QueryStats(_current_stats.get())
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_stats_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(time.perf_counter() - context._query_stats_start)
+
+def instrument_engine(engine: Engine) -> Engine:
+    """
+    Registra en el engine los eventos que alimentan las mediciones de track_queries.
+    """
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+class RouteQueryStats:
+    """
+    Acumulado por ruta de peticiones, sentencias SQL y tiempo en base de datos.
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, stats: QueryStats) -> None:
+        with self._lock:
+            totals = self._routes.get(route)
+            if totals is None:
+                totals = self._routes[route] = {"requests": 0, "queries": 0, "max_queries": 0, "db_time_ms": 0.0}
+            totals["requests"] += 1
+            totals["queries"] += stats.count
+            totals["max_queries"] = max(totals["max_queries"], stats.count)
+            totals["db_time_ms"] += stats.duration_ms
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        Devuelve una copia de los acumulados, con la media de sentencias por petición.
+        """
+        with self._lock:
+            return {
+                route: {**totals, "avg_queries": totals["queries"] / totals["requests"]}
+                for route, totals in self._routes.items()
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+route_stats = RouteQueryStats()
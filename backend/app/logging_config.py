@@ -0,0 +1,160 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+# Configuración del registro mediante variables de entorno
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json o text
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+# Todos los loggers de la aplicación cuelgan de este
+APP_LOGGER = "app"
+
+class StructuredLogger:
+    """
+    Logger de eventos con campos estructurados: logger.info("cart.item_added", cart_id=1).
+    Comprueba el nivel antes de crear el registro, de modo que un evento descartado no
+    cuesta más que una comparación, y el mensaje se formatea en el hilo del QueueListener.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def _log(self, level: int, event: str, fields: dict, exc_info: bool = False) -> None:
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields}, stacklevel=3)
+
+    def debug(self, event: str, **fields: Any) -> None:
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields: Any) -> None:
+        """
+        Registra un error con la traza de la excepción que se está atendiendo.
+        """
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+def get_logger(name: str) -> StructuredLogger:
+    """
+    Devuelve el logger estructurado de un módulo de la aplicación.
+    """
+    return StructuredLogger(logging.getLogger(name))
+
+class DebugSampler(logging.Filter):
+    """
+    Deja pasar solo una fracción de los eventos DEBUG (uno de cada 1/rate, en orden).
+    Los demás niveles pasan siempre. El filtro se llama desde cualquier hilo que registre
+    eventos, así que los eventos se numeran con itertools.count, cuyo next() es atómico.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.interval = max(1, round(1 / rate)) if rate > 0 else 0
+        self._seen = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.DEBUG:
+            return True
+        if not self.interval:
+            return False
+        return next(self._seen) % self.interval == 0
+
+class JsonFormatter(logging.Formatter):
+    """
+    Una línea JSON por evento, con los campos estructurados al mismo nivel que el evento.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {})
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """
+    Una línea legible por evento con los campos como pares clave=valor.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        line = f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()}"
+        if fields:
+            line = f"{line} {fields}"
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Encola el registro sin formatearlo: el formateo y la escritura ocurren en el hilo del
+    QueueListener, no en el de la petición.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+_listener: Optional[QueueListener] = None
+
+def configure_logging(
+    level: str = None,
+    log_format: str = None,
+    debug_sample_rate: float = None,
+    stream=None,
+) -> QueueListener:
+    """
+    Configura los loggers de la aplicación para escribir a través de una cola: las
+    peticiones solo encolan el evento y un hilo aparte lo formatea y lo escribe.
+    Llamarla de nuevo sustituye la configuración anterior.
+    """
+    global _listener
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(TextFormatter() if (log_format or LOG_FORMAT) == "text" else JsonFormatter())
+
+    records = queue.SimpleQueue()
+    handler = DeferredQueueHandler(records)
+    handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE if debug_sample_rate is None else debug_sample_rate))
+
+    logger = logging.getLogger(APP_LOGGER)
+    for existing in list(logger.handlers):
+        if isinstance(existing, DeferredQueueHandler):
+            logger.removeHandler(existing)
+    logger.addHandler(handler)
+    logger.setLevel((level or LOG_LEVEL).upper())
+    logger.propagate = False
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def shutdown_logging() -> None:
+    """
+    Detiene el hilo de escritura después de vaciar la cola.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,10 +1,22 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Match
 from app.api.routes.v1 import products as products_v1
 from app.api.routes.v1 import cart as cart_v1
 from app.api.routes.v1 import admin as admin_v1
-from app.db.database import create_tables, get_db
+from app.db.database import create_tables, get_db, async_engine, SessionLocal, DB_POOL_READY_MAX_SATURATION
+from app.db import query_stats
+from app.db.pool import pool_health
+from app import metrics
+from app.logging_config import configure_logging, shutdown_logging
 from app.db.init_db import create_initial_data
+from app.services.cart_sweeper import CartSweeper
+from app.services import cart_store
+
+# Barrido periódico de carritos abandonados (CART_SWEEP_INTERVAL_SECONDS=0 lo desactiva)
+cart_sweeper = CartSweeper(SessionLocal)
 
 app = FastAPI(
     title="Marcus Bikes API",
@@ -25,10 +37,65 @@ app.add_middleware(
     allow_credentials=True,  # Importante para permitir cookies
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Accept", "Authorization", "X-Requested-With", "Origin"],
-    expose_headers=["Content-Type", "Content-Length", "Set-Cookie"],  # Exponer el encabezado Set-Cookie
+    expose_headers=["Content-Type", "Content-Length", "Set-Cookie", "X-DB-Queries", "X-DB-Time-ms"],  # Exponer Set-Cookie y las métricas de BD
     max_age=86400,  # Caché preflight por 24 horas
 )
 
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """
+    Mide cada petición por plantilla de ruta: latencia, peticiones en curso, código de estado,
+    sentencias SQL y tiempo en base de datos. Las sentencias y el tiempo en base de datos se
+    devuelven además en las cabeceras X-DB-Queries y X-DB-Time-ms.
+    """
+    method = request.method
+    route = route_template(request)
+    metrics.registry.request_started(method, route)
+    status = 500
+    started = time.perf_counter()
+    with query_stats.track_queries() as stats:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            metrics.registry.request_finished(
+                method, route, status, time.perf_counter() - started, stats.count, stats.duration
+            )
+    response.headers["X-DB-Queries"] = str(stats.count)
+    response.headers["X-DB-Time-ms"] = f"{stats.duration_ms:.2f}"
+    query_stats.route_stats.record(f"{method} {route}", stats)
+    return response
+
+def route_template(request: Request) -> str:
+    """
+    Plantilla de la ruta que atenderá la petición (por ejemplo /api/v1/products/{product_id}),
+    o "unmatched" si ninguna coincide.
+    """
+    partial = None
+    for candidate in request.app.router.routes:
+        match, _ = candidate.matches(request.scope)
+        if match == Match.FULL:
+            return candidate.path
+        if match == Match.PARTIAL and partial is None:
+            partial = candidate.path
+    return partial or "unmatched"
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    """
+    Exposes the request, database and connection pool metrics in Prometheus text format.
+    """
+    return PlainTextResponse(metrics.registry.render(async_engine.pool), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/ready", include_in_schema=False)
+def read_readiness():
+    """
+    Readiness check for the orchestrator. Returns 503 while the connection pool of the API
+    is saturated or requests are waiting for a connection, so traffic is routed to other workers.
+    """
+    health = pool_health(async_engine.pool, DB_POOL_READY_MAX_SATURATION)
+    return JSONResponse(health, status_code=200 if health["ready"] else 503)
+
 # Incluir rutas versionadas v1
 app.include_router(products_v1.router, prefix="/api/v1", tags=["products"])
 app.include_router(cart_v1.router, prefix="/api/v1", tags=["cart"])
@@ -36,12 +103,24 @@ app.include_router(admin_v1.router, prefix="/api/v1", tags=["admin"])
 
 @app.on_event("startup")
 async def startup():
+    configure_logging()
+    
     # Crear tablas si no existen
     create_tables()
     
     # Inicializar datos de ejemplo
     db = next(get_db())
     create_initial_data(db)
+    
+    cart_sweeper.start()
+    cart_store.store.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await cart_sweeper.stop()
+    # Escribir los cambios pendientes del almacén de carritos antes de terminar
+    await cart_store.store.stop()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,186 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.pool import Pool
+
+# Límites de los buckets de latencia en segundos (los mismos que usan los clientes de Prometheus)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+class Histogram:
+    """
+    Histograma acumulado con buckets fijos, en el formato que espera Prometheus.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """
+        Devuelve los pares (límite, observaciones acumuladas) incluido +Inf.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((_format_value(bound), total))
+        result.append(("+Inf", self.count))
+        return result
+
+class MetricsRegistry:
+    """
+    Métricas HTTP por ruta: latencias, peticiones en curso, respuestas por código de estado
+    y sentencias SQL. Las rutas se identifican por su plantilla, no por la URL concreta,
+    para que el número de series no crezca con los IDs. Incluye también las filas borradas
+    y la duración del barrido de carritos abandonados.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        self.responses: Dict[Tuple[str, str, str], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.db_queries: Dict[Tuple[str, str], int] = {}
+        self.db_time: Dict[Tuple[str, str], float] = {}
+        self.cart_sweep_deleted: Dict[str, int] = {}
+        self.cart_sweep_duration = Histogram()
+
+    def request_started(self, method: str, route: str) -> None:
+        with self._lock:
+            key = (method, route)
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def request_finished(self, method: str, route: str, status: int, duration: float, queries: int, db_time: float) -> None:
+        with self._lock:
+            key = (method, route)
+            self.in_flight[key] -= 1
+            status_key = (method, route, str(status))
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(duration)
+            self.db_queries[key] = self.db_queries.get(key, 0) + queries
+            self.db_time[key] = self.db_time.get(key, 0.0) + db_time
+
+    def cart_sweep_finished(self, deleted: Dict[str, int], duration: float) -> None:
+        with self._lock:
+            for table, count in deleted.items():
+                self.cart_sweep_deleted[table] = self.cart_sweep_deleted.get(table, 0) + count
+            self.cart_sweep_duration.observe(duration)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.in_flight.clear()
+            self.responses.clear()
+            self.latency.clear()
+            self.db_queries.clear()
+            self.db_time.clear()
+            self.cart_sweep_deleted.clear()
+            self.cart_sweep_duration = Histogram()
+
+    def render(self, pool: Optional[Pool] = None) -> str:
+        """
+        Devuelve todas las métricas en el formato de texto de Prometheus, incluidas las del
+        pool de conexiones si se indica.
+        """
+        lines = []
+        with self._lock:
+            lines.append("# HELP http_requests_in_flight Peticiones HTTP en curso.")
+            lines.append("# TYPE http_requests_in_flight gauge")
+            for (method, route), value in sorted(self.in_flight.items()):
+                lines.append(f"http_requests_in_flight{_labels(method=method, route=route)} {value}")
+
+            lines.append("# HELP http_requests_total Respuestas HTTP por código de estado.")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route, status), value in sorted(self.responses.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {value}")
+
+            lines.append("# HELP http_request_duration_seconds Latencia de las peticiones HTTP.")
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for (method, route), histogram in sorted(self.latency.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f"http_request_duration_seconds_bucket{_labels(method=method, route=route, le=bound)} {count}")
+                lines.append(f"http_request_duration_seconds_sum{_labels(method=method, route=route)} {_format_value(histogram.sum)}")
+                lines.append(f"http_request_duration_seconds_count{_labels(method=method, route=route)} {histogram.count}")
+
+            lines.append("# HELP db_queries_total Sentencias SQL ejecutadas por las peticiones HTTP.")
+            lines.append("# TYPE db_queries_total counter")
+            for (method, route), value in sorted(self.db_queries.items()):
+                lines.append(f"db_queries_total{_labels(method=method, route=route)} {value}")
+
+            lines.append("# HELP db_query_duration_seconds_total Tiempo en base de datos de las peticiones HTTP.")
+            lines.append("# TYPE db_query_duration_seconds_total counter")
+            for (method, route), value in sorted(self.db_time.items()):
+                lines.append(f"db_query_duration_seconds_total{_labels(method=method, route=route)} {_format_value(value)}")
+
+            lines.append("# HELP cart_sweep_deleted_rows_total Filas borradas por el barrido de carritos abandonados.")
+            lines.append("# TYPE cart_sweep_deleted_rows_total counter")
+            for table, value in sorted(self.cart_sweep_deleted.items()):
+                lines.append(f"cart_sweep_deleted_rows_total{_labels(table=table)} {value}")
+
+            lines.append("# HELP cart_sweep_duration_seconds Duración de los barridos de carritos abandonados.")
+            lines.append("# TYPE cart_sweep_duration_seconds histogram")
+            if self.cart_sweep_duration.count:
+                for bound, count in self.cart_sweep_duration.cumulative():
+                    lines.append(f"cart_sweep_duration_seconds_bucket{_labels(le=bound)} {count}")
+                lines.append(f"cart_sweep_duration_seconds_sum {_format_value(self.cart_sweep_duration.sum)}")
+                lines.append(f"cart_sweep_duration_seconds_count {self.cart_sweep_duration.count}")
+
+        for name, metric_type, help_text, value in _pool_stats(pool):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+
+        stats = getattr(pool, "stats", None)
+        if stats is not None:
+            lines.append("# HELP db_pool_checkout_wait_seconds Tiempo de espera para obtener una conexión del pool.")
+            lines.append("# TYPE db_pool_checkout_wait_seconds histogram")
+            for bound, count in stats.checkout_wait.cumulative():
+                lines.append(f"db_pool_checkout_wait_seconds_bucket{_labels(le=bound)} {count}")
+            lines.append(f"db_pool_checkout_wait_seconds_sum {_format_value(stats.checkout_wait.sum)}")
+            lines.append(f"db_pool_checkout_wait_seconds_count {stats.checkout_wait.count}")
+
+        return "\n".join(lines) + "\n"
+
+def _pool_stats(pool: Optional[Pool]) -> List[Tuple[str, str, str, int]]:
+    """
+    Estado del pool de conexiones. Solo los pools con cola (QueuePool) exponen contadores,
+    y solo los instrumentados (app.db.pool) las esperas y los agotamientos.
+    """
+    if pool is None or not hasattr(pool, "checkedout"):
+        return []
+    result = [
+        ("db_pool_size", "gauge", "Tamaño configurado del pool de conexiones.", pool.size()),
+        ("db_pool_checked_out", "gauge", "Conexiones del pool en uso.", pool.checkedout()),
+        ("db_pool_checked_in", "gauge", "Conexiones del pool libres.", pool.checkedin()),
+        ("db_pool_overflow", "gauge", "Conexiones abiertas por encima del tamaño del pool.", pool.overflow()),
+    ]
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        result += [
+            ("db_pool_waiting", "gauge", "Peticiones esperando una conexión con el pool agotado.", stats.waiting),
+            ("db_pool_exhausted_total", "counter", "Peticiones de conexión que encontraron el pool agotado.", stats.exhausted),
+            ("db_pool_timeouts_total", "counter", "Esperas de conexión que terminaron por timeout.", stats.timeouts),
+        ]
+    return result
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_value(value: float) -> str:
+    return repr(float(value))
+
+registry = MetricsRegistry()
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Numeric, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, column_property, query_expression
 from sqlalchemy.sql import func
 from app.db.database import Base
 
@@ -7,10 +7,17 @@ class Cart(Base):
     __tablename__ = "carts"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, nullable=True)
+    # Único: un carrito por usuario. Los carritos anónimos tienen user_id NULL
+    user_id = Column(String, nullable=True, unique=True, index=True)
     created_at = Column(DateTime, default=func.now())
+    # Última escritura en el carrito o sus ítems; la usa cart_sweeper para borrar los carritos abandonados
+    last_activity = Column(DateTime, default=func.now(), index=True)
     
     items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan")
+    
+    # Totales calculados en SQL por cart_service.get_cart; None si el carrito se cargó de otra forma
+    subtotal = query_expression()
+    item_count = query_expression()
 
 class CartItem(Base):
     __tablename__ = "cart_items"
@@ -20,6 +27,7 @@ class CartItem(Base):
     product_id = Column(Integer, ForeignKey("products.id"))
     price_snapshot = Column(Numeric(10, 2))
     quantity = Column(Integer, default=1)
+    subtotal = column_property(price_snapshot * quantity)
     
     cart = relationship("Cart", back_populates="items")
     product = relationship("Product")
@@ -18,6 +18,8 @@ class Product(Base):
     featured = Column(Boolean, default=False)
     base_price = Column(Numeric(10, 2), nullable=True)
     image_url = Column(String, nullable=True)
+    # Versión del catálogo del producto, que invalida las reglas y resultados en caché
+    catalog_version = Column(Integer, nullable=False, default=0, server_default="0")
     
     part_types = relationship("PartType", back_populates="product", cascade="all, delete-orphan")
 
@@ -36,14 +36,18 @@ class CartItem(CartItemBase):
     id: int
     cart_id: int
     price_snapshot: Decimal
+    subtotal: Decimal
     options: List[CartItemOption] = []
 
     class Config:
         orm_mode = True
 
 class Cart(CartBase):
-    id: int
-    created_at: datetime
+    # Sin ID ni fecha de creación para el carrito virtual, que aún no se ha guardado
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    subtotal: Decimal
+    item_count: int
     items: List[CartItem] = []
 
     class Config:
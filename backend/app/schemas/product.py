@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional
 from decimal import Decimal
 from enum import Enum
@@ -28,6 +28,12 @@ class OptionDependencyBase(BaseModel):
     depends_on_option_id: int
     type: DependencyType
 
+    @field_validator("type", mode="before")
+    @classmethod
+    def enum_to_value(cls, value):
+        # Los modelos usan su propio enum; se convierte a su valor para validarlo aquí
+        return value.value if isinstance(value, Enum) else value
+
     class Config:
         from_attributes = True
         json_encoders = {
@@ -100,4 +106,15 @@ class PartTypeDetail(PartType):
     options: List[PartOptionDetail] = []
 
 class ProductDetail(Product):
-    part_types: List[PartTypeDetail] = [] 
\ No newline at end of file
+    part_types: List[PartTypeDetail] = [] 
+
+# Schemas for custom functionality
+class ConfigureRequest(BaseModel):
+    selected_options: List[int] = []
+
+class SelectionToValidate(BaseModel):
+    product_id: int
+    selected_options: List[int] = []
+
+class BatchValidationRequest(BaseModel):
+    selections: List[SelectionToValidate] = Field(..., max_length=10000)
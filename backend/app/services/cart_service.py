@@ -1,12 +1,52 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, selectinload, with_expression
 from app.models.cart import Cart, CartItem, CartItemOption
-from app.models.product import Product, PartOption
 from app.schemas.cart import CartCreate, CartItemCreate
-from app.services.product_service import calculate_price, validate_compatibility
-from typing import List
+from app.services import rule_index, compatibility_engine
+from app.services.product_service import price_selection
+from typing import List, Optional, Tuple
+from decimal import Decimal
+from fastapi import HTTPException
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# INSERT con ON CONFLICT de cada base de datos soportada, para crear carritos por usuario sin duplicados
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# Subtotal y número de unidades de un carrito, como subconsultas correlacionadas de la consulta del carrito
+_cart_subtotal = select(
+    func.coalesce(func.sum(CartItem.price_snapshot * CartItem.quantity), 0)
+).where(CartItem.cart_id == Cart.id).correlate(Cart).scalar_subquery()
+_cart_item_count = select(
+    func.coalesce(func.sum(CartItem.quantity), 0)
+).where(CartItem.cart_id == Cart.id).correlate(Cart).scalar_subquery()
 
 def get_cart(db: Session, cart_id: int):
-    return db.query(Cart).filter(Cart.id == cart_id).first()
+    """
+    Obtiene un carrito con sus ítems y las opciones de cada ítem en un número fijo de
+    consultas (carrito, ítems y opciones), independiente del tamaño del carrito. El subtotal
+    de cada ítem y el subtotal y las unidades del carrito se calculan en SQL.
+    """
+    return db.query(Cart).options(
+        selectinload(Cart.items).selectinload(CartItem.options),
+        with_expression(Cart.subtotal, _cart_subtotal),
+        with_expression(Cart.item_count, _cart_item_count)
+    ).filter(Cart.id == cart_id).execution_options(populate_existing=True).first()
+
+def cart_exists(db: Session, cart_id: int) -> bool:
+    return db.query(Cart.id).filter(Cart.id == cart_id).first() is not None
+
+def touch_cart(db: Session, cart_id: int) -> None:
+    """
+    Actualiza la última actividad del carrito dentro de la transacción en curso, para que
+    el barrido de carritos abandonados no lo borre mientras se usa.
+    """
+    db.execute(update(Cart).where(Cart.id == cart_id).values(last_activity=func.now()))
 
 def create_cart(db: Session, cart: CartCreate):
     db_cart = Cart(**cart.dict())
@@ -15,102 +55,93 @@ def create_cart(db: Session, cart: CartCreate):
     db.refresh(db_cart)
     return db_cart
 
-def add_to_cart(db: Session, cart_id: int, product_id: int, selected_option_ids: List[int], quantity: int = 1):
+class IncompatibleConfigurationError(ValueError):
     """
-    Añade un producto configurado al carrito.
+    La selección tiene un conflicto entre opciones. details describe el conflicto con el
+    formato incompatibility_details de la validación: type (excludes, requires u otro motivo),
+    option_id, option_name y, según el tipo, la opción requerida o la excluida.
     """
-    # Validar que las opciones seleccionadas sean compatibles
-    compatibility_result = validate_compatibility(db, product_id=product_id, selected_option_ids=selected_option_ids)
-    
-    # Comprobar si el resultado tiene la estructura esperada (el nuevo formato) o el formato antiguo
-    if isinstance(compatibility_result, dict) and "product" in compatibility_result:
-        # Nuevo formato - necesitamos determinar la compatibilidad general
-        is_compatible = True
-        incompatibility_details = None
-        
-        # Verificar si alguna opción seleccionada es incompatible
-        for component in compatibility_result["product"]["components"]:
-            for option in component["options"]:
-                if option.get("selected", False) and not option.get("is_compatible", True):
-                    is_compatible = False
-                    # Intentar extraer detalles de incompatibilidad si existen
-                    if "compatibility_details" in option:
-                        incompatibility_details = {
-                            "type": option["compatibility_details"].get("reason", "unknown"),
-                            "option_name": option["name"],
-                            "option_id": option["id"]
-                        }
-                        # Añadir detalles específicos según el tipo de incompatibilidad
-                        if option["compatibility_details"]["reason"] == "requires":
-                            incompatibility_details["required_option_name"] = option["compatibility_details"]["dependency_name"]
-                            incompatibility_details["required_option_id"] = option["compatibility_details"]["dependency_id"]
-                        elif option["compatibility_details"]["reason"] == "excludes":
-                            incompatibility_details["excluded_option_name"] = option["compatibility_details"]["dependency_name"]
-                            incompatibility_details["excluded_option_id"] = option["compatibility_details"]["dependency_id"]
-                    break
-            if not is_compatible:
-                break
-                
-        # Crear un objeto de resultado en el formato que espera el resto del código
-        compatibility_result = {
-            "is_compatible": is_compatible,
-            "incompatibility_details": incompatibility_details
-        }
+
+    def __init__(self, message: str, details: dict):
+        super().__init__(message)
+        self.details = details
+
+def price_cart_item(db: Session, product_id: int, selected_option_ids: List[int]) -> Tuple[List[int], Decimal]:
+    """
+    Valida una selección para añadirla al carrito y calcula su precio total (precio base
+    del producto más las opciones) en una sola pasada sobre el índice de reglas del producto,
+    sin consultas cuando el índice está en caché. Devuelve las opciones a guardar, incluidas
+    las auto-seleccionadas para completar las dependencias requires, y el precio.
+    """
+    index = rule_index.get_rule_index(db, product_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    # Ahora usamos el objeto compatibility_result normalizado
-    if not compatibility_result.get("is_compatible", False):
-        details = compatibility_result.get("incompatibility_details")
-        if details:
-            if details.get("type") == "excludes":
-                raise ValueError(f"La opción '{details['option_name']}' no es compatible con '{details['excluded_option_name']}'")
-            elif details.get("type") == "requires":
-                raise ValueError(f"La opción '{details['option_name']}' requiere '{details['required_option_name']}'")
-            else:
-                raise ValueError(f"Hay una incompatibilidad con la opción '{details['option_name']}'")
+    auto_selected, conflict = compatibility_engine.get_engine(index).check(sorted(set(selected_option_ids)))
+    if conflict is not None:
+        if conflict["reason"] == "out_of_stock":
+            raise ValueError(f"La opción '{conflict['option_name']}' no está disponible")
+        details = {"type": conflict["reason"], "option_name": conflict["option_name"], "option_id": conflict["option_id"]}
+        if conflict["reason"] == "requires":
+            details["required_option_name"] = conflict["dependency_name"]
+            details["required_option_id"] = conflict["dependency_id"]
+            message = f"La opción '{details['option_name']}' requiere '{details['required_option_name']}'"
+        elif conflict["reason"] == "excludes":
+            details["excluded_option_name"] = conflict["dependency_name"]
+            details["excluded_option_id"] = conflict["dependency_id"]
+            message = f"La opción '{details['option_name']}' no es compatible con '{details['excluded_option_name']}'"
         else:
-            raise ValueError("Las opciones seleccionadas no son compatibles")
-    
-    # Verificar que todas las opciones estén en stock
-    options = db.query(PartOption).filter(PartOption.id.in_(selected_option_ids)).all()
-    for option in options:
-        if not option.in_stock:
-            raise ValueError(f"La opción '{option.name}' no está disponible")
+            message = f"Hay una incompatibilidad con la opción '{details['option_name']}'"
+        raise IncompatibleConfigurationError(message, details)
     
-    # Obtener el producto para acceder a su precio base
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
-        raise ValueError(f"Producto con ID {product_id} no encontrado")
+    # Guardar también las opciones auto-seleccionadas para completar las dependencias requires
+    option_ids = list(selected_option_ids) + auto_selected
+    options_price, _ = price_selection(index, option_ids)
+    total_price = (index.base_price or Decimal('0')) + options_price
     
-    # Calcular el precio de las opciones
-    options_price = calculate_price(db, selected_option_ids)
-    
-    # Sumar el precio base del producto y el precio de las opciones
-    total_price = product.base_price + options_price
-    
-    print(f"Añadiendo al carrito - Producto ID: {product_id}, Precio base: {product.base_price}, Precio opciones: {options_price}, Precio total: {total_price}")
-    
-    # Crear el ítem del carrito con el precio total
+    logger.debug(
+        "cart.item_priced",
+        product_id=product_id,
+        base_price=index.base_price,
+        options_price=options_price,
+        total_price=total_price
+    )
+    return option_ids, total_price
+
+def insert_cart_item(db: Session, cart_id: int, product_id: int, option_ids: List[int], price: Decimal, quantity: int = 1) -> CartItem:
+    """
+    Inserta el ítem y sus opciones en una sola transacción: el ítem con un INSERT y todas
+    sus opciones con un único INSERT en bloque. Actualiza también la última actividad del carrito.
+    """
     db_cart_item = CartItem(
         cart_id=cart_id,
         product_id=product_id,
-        price_snapshot=total_price,
+        price_snapshot=price,
         quantity=quantity
     )
     db.add(db_cart_item)
-    db.commit()
-    db.refresh(db_cart_item)
+    db.flush()
     
-    # Agregar las opciones seleccionadas al ítem
-    for option_id in selected_option_ids:
-        db_cart_item_option = CartItemOption(
-            cart_item_id=db_cart_item.id,
-            part_option_id=option_id
+    if option_ids:
+        db.execute(
+            insert(CartItemOption),
+            [{"cart_item_id": db_cart_item.id, "part_option_id": option_id} for option_id in option_ids]
         )
-        db.add(db_cart_item_option)
     
+    touch_cart(db, cart_id)
     db.commit()
     return db_cart_item
 
+def add_to_cart(db: Session, cart_id: int, product_id: int, selected_option_ids: List[int], quantity: int = 1):
+    """
+    Añade un producto configurado al carrito. La selección se valida y se valora una sola
+    vez y el ítem se guarda con sus opciones en una sola transacción.
+    Lanza IncompatibleConfigurationError si las opciones no son compatibles y ValueError si
+    alguna no está disponible.
+    """
+    option_ids, total_price = price_cart_item(db, product_id, selected_option_ids)
+    return insert_cart_item(db, cart_id, product_id, option_ids, total_price, quantity)
+
 def get_cart_items(db: Session, cart_id: int):
     """
     Obtiene todos los ítems en un carrito con sus opciones.
@@ -126,6 +157,7 @@ def update_cart_item_quantity(db: Session, cart_item_id: int, quantity: int):
         raise ValueError("Ítem no encontrado en el carrito")
     
     db_cart_item.quantity = quantity
+    touch_cart(db, db_cart_item.cart_id)
     db.commit()
     db.refresh(db_cart_item)
     return db_cart_item
@@ -139,22 +171,52 @@ def remove_cart_item(db: Session, cart_item_id: int):
         raise ValueError("Ítem no encontrado en el carrito")
     
     db.delete(db_cart_item)
+    touch_cart(db, db_cart_item.cart_id)
     db.commit()
     return True
 
-def get_or_create_cart(db: Session, user_id: str = None):
+def find_user_cart_id(db: Session, user_id: str) -> Optional[int]:
     """
-    Obtiene o crea un carrito para un usuario o sesión.
+    Obtiene el ID del carrito de un usuario, o None si no tiene carrito.
+    """
+    cart = db.query(Cart.id).filter(Cart.user_id == user_id).first()
+    return cart.id if cart else None
+
+def get_or_create_cart_id(db: Session, user_id: str = None) -> int:
+    """
+    Obtiene el ID del carrito de un usuario, o crea un carrito nuevo si no hay usuario o
+    el usuario no tiene carrito. Con usuario se hace en una sola sentencia, un INSERT con
+    ON CONFLICT sobre el índice único de user_id que devuelve el carrito existente o el
+    nuevo, de modo que dos peticiones simultáneas del mismo usuario no crean dos carritos.
     """
     if user_id:
-        # Si hay un ID de usuario, intentar encontrar su carrito
-        cart = db.query(Cart).filter(Cart.user_id == user_id).first()
-        if cart:
-            return cart
+        upsert = UPSERT_INSERTS[db.get_bind().dialect.name](Cart).values(user_id=user_id)
+        # DO UPDATE en lugar de DO NOTHING para que RETURNING devuelva también el carrito
+        # existente; de paso se actualiza su última actividad
+        cart_id = db.execute(
+            upsert.on_conflict_do_update(index_elements=[Cart.user_id], set_={"last_activity": func.now()})
+            .returning(Cart.id)
+        ).scalar_one()
+        db.commit()
+        return cart_id
     
-    # Si no hay carrito o no hay usuario, crear uno nuevo
+    # Sin usuario, crear un carrito nuevo
     new_cart = Cart(user_id=user_id)
     db.add(new_cart)
     db.commit()
-    db.refresh(new_cart)
-    return new_cart 
\ No newline at end of file
+    return new_cart.id
+
+def resolve_cart_id(db: Session, cart_id: Optional[int], user_id: str = None) -> int:
+    """
+    Devuelve el ID del carrito indicado si existe o, si no, el del carrito del usuario,
+    que se crea si no lo tiene.
+    """
+    if cart_id is None or not cart_exists(db, cart_id):
+        return get_or_create_cart_id(db, user_id)
+    return cart_id
+
+def get_or_create_cart(db: Session, user_id: str = None):
+    """
+    Obtiene o crea un carrito para un usuario o sesión, con sus ítems y totales.
+    """
+    return get_cart(db, get_or_create_cart_id(db, user_id))
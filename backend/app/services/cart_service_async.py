@@ -0,0 +1,49 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import run_in_session
+from app.schemas.cart import Cart, CartItem
+from app.services import cart_service, cart_store
+from typing import List, Optional, Tuple
+from decimal import Decimal
+
+# Versión asíncrona de cart_service para las rutas de la API. Las rutas del carrito pasan
+# por el almacén configurado en cart_store (CART_STORE_BACKEND), que ejecuta la lógica
+# síncrona del servicio sobre la sesión asíncrona con run_sync y devuelve los carritos ya
+# convertidos a su esquema.
+
+async def get_cart(db: AsyncSession, cart_id: int) -> Optional[Cart]:
+    return await run_in_session(db, cart_service.get_cart, cart_id, schema=Cart)
+
+async def get_cart_or_virtual(db: AsyncSession, cart_id: Optional[int], user_id: Optional[str] = None) -> Cart:
+    """
+    Obtiene el carrito indicado o, si no existe, el del usuario. Si tampoco lo hay, devuelve
+    un carrito virtual vacío sin ID: el carrito solo se guarda al añadir el primer ítem, de
+    modo que las visitas sin cookie no escriben en la base de datos. Sin ID de carrito ni de
+    usuario no se hace ninguna consulta.
+    """
+    if cart_id is not None or user_id:
+        cart = await cart_store.store.find_cart(db, cart_id, user_id)
+        if cart is not None:
+            return cart
+    return Cart(id=None, user_id=user_id, created_at=None, subtotal=Decimal('0'), item_count=0, items=[])
+
+async def add_to_cart(
+    db: AsyncSession,
+    cart_id: Optional[int],
+    user_id: Optional[str],
+    product_id: int,
+    selected_option_ids: List[int],
+    quantity: int = 1
+) -> Tuple[int, int]:
+    """
+    Valida y valora la selección, obtiene el carrito (o lo crea si no existe) y guarda el
+    ítem, todo en una sola llamada a run_sync. La selección se valida antes de
+    crear el carrito, de modo que una selección incompatible no deja un carrito vacío.
+    Devuelve el ID del carrito y el del ítem.
+    """
+    return await cart_store.store.add_item(db, cart_id, user_id, product_id, selected_option_ids, quantity)
+
+async def update_cart_item_quantity(db: AsyncSession, cart_item_id: int, quantity: int) -> CartItem:
+    return await cart_store.store.update_item_quantity(db, cart_item_id, quantity)
+
+async def remove_cart_item(db: AsyncSession, cart_item_id: int) -> bool:
+    return await cart_store.store.remove_item(db, cart_item_id)
@@ -0,0 +1,412 @@
+import abc
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+from app.db.database import AsyncSessionLocal, run_in_session
+from app.models.cart import Cart as CartModel, CartItem as CartItemModel, CartItemOption as CartItemOptionModel
+from app.schemas.cart import Cart, CartItem
+from app.services import cart_service
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Almacén de los carritos de la API: "sql" (base de datos en cada petición) o "memory"
+# (carritos en memoria del proceso con escritura diferida a la base de datos)
+CART_STORE_BACKEND = os.getenv("CART_STORE_BACKEND", "sql")
+# Carritos que el almacén en memoria mantiene en cada proceso
+CART_STORE_MEMORY_SIZE = int(os.getenv("CART_STORE_MEMORY_SIZE", "10000"))
+# Segundos entre escrituras de los cambios pendientes del almacén en memoria
+CART_STORE_FLUSH_SECONDS = float(os.getenv("CART_STORE_FLUSH_SECONDS", "2"))
+
+class CartStore(abc.ABC):
+    """
+    Almacén de carritos usado por cart_service_async. Los carritos se devuelven como
+    esquemas, desacoplados de la sesión.
+    """
+
+    @abc.abstractmethod
+    async def find_cart(self, db: AsyncSession, cart_id: Optional[int], user_id: Optional[str] = None) -> Optional[Cart]:
+        """
+        Obtiene el carrito indicado o, si no existe, el del usuario. Devuelve None si no hay ninguno.
+        """
+
+    @abc.abstractmethod
+    async def add_item(
+        self,
+        db: AsyncSession,
+        cart_id: Optional[int],
+        user_id: Optional[str],
+        product_id: int,
+        selected_option_ids: List[int],
+        quantity: int = 1
+    ) -> Tuple[int, int]:
+        """
+        Valida, valora y guarda un ítem, creando el carrito si no existe. Devuelve el ID del
+        carrito y el del ítem.
+        """
+
+    @abc.abstractmethod
+    async def update_item_quantity(self, db: AsyncSession, cart_item_id: int, quantity: int) -> CartItem:
+        """
+        Cambia la cantidad de un ítem y devuelve el ítem actualizado. Lanza ValueError si no existe.
+        """
+
+    @abc.abstractmethod
+    async def remove_item(self, db: AsyncSession, cart_item_id: int) -> bool:
+        """
+        Borra un ítem del carrito. Lanza ValueError si no existe.
+        """
+
+    async def flush(self) -> int:
+        """
+        Escribe los cambios pendientes en la base de datos. Devuelve los carritos escritos.
+        """
+        return 0
+
+    def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+def _find_cart(db: Session, cart_id: Optional[int], user_id: Optional[str]):
+    cart = cart_service.get_cart(db, cart_id) if cart_id is not None else None
+    if cart is None and user_id:
+        user_cart_id = cart_service.find_user_cart_id(db, user_id)
+        if user_cart_id is not None:
+            cart = cart_service.get_cart(db, user_cart_id)
+    return cart
+
+def _add_item(db: Session, cart_id, user_id, product_id, selected_option_ids, quantity) -> CartItemModel:
+    # La selección se valida antes de crear el carrito, de modo que una selección
+    # incompatible no deja un carrito vacío
+    option_ids, total_price = cart_service.price_cart_item(db, product_id, selected_option_ids)
+    resolved_cart_id = cart_service.resolve_cart_id(db, cart_id, user_id)
+    return cart_service.insert_cart_item(db, resolved_cart_id, product_id, option_ids, total_price, quantity)
+
+class SqlCartStore(CartStore):
+    """
+    Carritos en la base de datos: cada lectura y escritura es una ida a la base de datos.
+    """
+
+    async def find_cart(self, db, cart_id, user_id=None):
+        return await run_in_session(db, _find_cart, cart_id, user_id, schema=Cart)
+
+    async def add_item(self, db, cart_id, user_id, product_id, selected_option_ids, quantity=1):
+        def add(session):
+            cart_item = _add_item(session, cart_id, user_id, product_id, selected_option_ids, quantity)
+            return cart_item.cart_id, cart_item.id
+        return await run_in_session(db, add)
+
+    async def update_item_quantity(self, db, cart_item_id, quantity):
+        return await run_in_session(db, cart_service.update_cart_item_quantity, cart_item_id, quantity, schema=CartItem)
+
+    async def remove_item(self, db, cart_item_id):
+        return await run_in_session(db, cart_service.remove_cart_item, cart_item_id)
+
+@dataclass
+class PendingWrites:
+    """
+    Cambios del almacén en memoria aún no escritos en la base de datos.
+    """
+    quantities: Dict[int, int] = field(default_factory=dict)  # ítem -> cantidad
+    removed: Dict[int, int] = field(default_factory=dict)  # ítem -> carrito
+    touched: Set[int] = field(default_factory=set)  # carritos con actividad
+
+    def __bool__(self) -> bool:
+        return bool(self.quantities or self.removed or self.touched)
+
+def write_pending(db: Session, pending: PendingWrites) -> Set[int]:
+    """
+    Escribe los cambios pendientes con una sentencia por tipo de cambio, sin hacer commit:
+    un DELETE de las opciones y otro de los ítems borrados, y un UPDATE en bloque de las
+    cantidades y otro de la última actividad de los carritos. La última actividad se
+    escribe con el reloj de la base de datos, el mismo que usa el barrido de carritos.
+
+    Devuelve los carritos con cambios que ya no existen (borrados por el barrido), cuyos
+    cambios no se han aplicado. Todo cambio marca su carrito, así que basta con comparar
+    las filas del UPDATE de actividad, y solo si faltan se consulta cuáles.
+    """
+    if pending.removed:
+        removed_ids = list(pending.removed)
+        db.execute(delete(CartItemOptionModel).where(CartItemOptionModel.cart_item_id.in_(removed_ids)))
+        db.execute(delete(CartItemModel).where(CartItemModel.id.in_(removed_ids)))
+    if pending.quantities:
+        items = CartItemModel.__table__
+        db.execute(
+            update(items).where(items.c.id == bindparam("item_id")).values(quantity=bindparam("new_quantity")),
+            [{"item_id": item_id, "new_quantity": quantity} for item_id, quantity in pending.quantities.items()]
+        )
+    if not pending.touched:
+        return set()
+    touched = db.execute(update(CartModel).where(CartModel.id.in_(pending.touched)).values(last_activity=func.now()))
+    if touched.rowcount == len(pending.touched):
+        return set()
+    existing = db.execute(select(CartModel.id).where(CartModel.id.in_(pending.touched))).scalars()
+    return pending.touched - set(existing)
+
+class MemoryCartStore(CartStore):
+    """
+    Carritos en memoria del proceso con expulsión LRU y escritura diferida. Las lecturas de
+    un carrito en memoria no consultan la base de datos, y los cambios de cantidad y los
+    borrados se aplican en memoria y se escriben en lotes cada flush_interval segundos.
+    Añadir un ítem sigue escribiendo en la base de datos, que asigna los IDs.
+    Los carritos con cambios pendientes no se expulsan hasta que se escriben, y los que el
+    barrido de carritos ha borrado entretanto se descartan de la memoria al escribirlos.
+
+    Cada proceso tiene su propia memoria, así que este almacén supone que un carrito solo
+    se modifica desde un proceso (un único worker o sesiones fijas por carrito), y que los
+    cambios pendientes se pierden si el proceso termina sin llamar a stop().
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        maxsize: int = CART_STORE_MEMORY_SIZE,
+        flush_interval: float = CART_STORE_FLUSH_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval
+        self.sql = SqlCartStore()
+        self._carts: "OrderedDict[int, Cart]" = OrderedDict()
+        self._user_carts: Dict[str, int] = {}
+        self._item_carts: Dict[int, int] = {}
+        self._pending = PendingWrites()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def find_cart(self, db, cart_id, user_id=None):
+        with self._lock:
+            key = cart_id if cart_id is not None else self._user_carts.get(user_id) if user_id else None
+            cart = self._carts.get(key) if key is not None else None
+            if cart is not None:
+                self._carts.move_to_end(key)
+                return cart
+
+        cart = await self.sql.find_cart(db, cart_id, user_id)
+        if cart is None:
+            return None
+        with self._lock:
+            # Si otra petición lo ha cargado mientras tanto, su versión puede tener cambios pendientes
+            current = self._carts.get(cart.id)
+            if current is not None:
+                return current
+            self._put(cart)
+            return cart
+
+    async def add_item(self, db, cart_id, user_id, product_id, selected_option_ids, quantity=1):
+        def add(session):
+            option_ids, total_price = cart_service.price_cart_item(session, product_id, selected_option_ids)
+            resolved_cart_id = cart_service.resolve_cart_id(session, cart_id, user_id)
+            # Los cambios pendientes del carrito se escriben en la misma transacción que el ítem
+            # para que el carrito recargado los incluya
+            pending = self._take_pending(resolved_cart_id)
+            try:
+                write_pending(session, pending)
+                cart_item = cart_service.insert_cart_item(
+                    session, resolved_cart_id, product_id, option_ids, total_price, quantity
+                )
+            except Exception:
+                self._restore_pending(pending)
+                raise
+            cart = Cart.model_validate(cart_service.get_cart(session, resolved_cart_id), from_attributes=True)
+            return cart, cart_item.id
+
+        cart, cart_item_id = await run_in_session(db, add)
+        with self._lock:
+            if cart_id is not None and cart_id != cart.id:
+                # El carrito indicado ya no existe (lo ha borrado el barrido) y se ha usado otro
+                self._discard({cart_id})
+            self._put(self._apply_pending(cart))
+        return cart.id, cart_item_id
+
+    async def update_item_quantity(self, db, cart_item_id, quantity):
+        with self._lock:
+            cart_id = self._item_carts.get(cart_item_id)
+            if cart_id is not None:
+                cart = self._carts[cart_id]
+                items = [
+                    item.model_copy(update={"quantity": quantity, "subtotal": item.price_snapshot * quantity})
+                    if item.id == cart_item_id else item
+                    for item in cart.items
+                ]
+                self._pending.quantities[cart_item_id] = quantity
+                self._pending.touched.add(cart_id)
+                self._carts[cart_id] = _with_items(cart, items)
+                return next(item for item in items if item.id == cart_item_id)
+        # Si el carrito no está en memoria, el cambio se escribe directamente
+        return await self.sql.update_item_quantity(db, cart_item_id, quantity)
+
+    async def remove_item(self, db, cart_item_id):
+        with self._lock:
+            cart_id = self._item_carts.pop(cart_item_id, None)
+            if cart_id is not None:
+                cart = self._carts[cart_id]
+                self._pending.quantities.pop(cart_item_id, None)
+                self._pending.removed[cart_item_id] = cart_id
+                self._pending.touched.add(cart_id)
+                self._carts[cart_id] = _with_items(cart, [item for item in cart.items if item.id != cart_item_id])
+                return True
+        return await self.sql.remove_item(db, cart_item_id)
+
+    async def flush(self) -> int:
+        pending = self._take_pending()
+        if not pending:
+            return 0
+        try:
+            async with self.session_factory() as db:
+                missing = await db.run_sync(write_pending, pending)
+                await db.commit()
+        except Exception:
+            self._restore_pending(pending)
+            raise
+        if missing:
+            with self._lock:
+                self._discard(missing)
+            logger.warning("cart.store_carts_missing", cart_ids=sorted(missing))
+        logger.debug(
+            "cart.store_flushed",
+            carts=len(pending.touched) - len(missing),
+            updated_items=len(pending.quantities),
+            removed_items=len(pending.removed)
+        )
+        return len(pending.touched) - len(missing)
+
+    def start(self) -> None:
+        if self.flush_interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._carts),
+                "maxsize": self.maxsize,
+                "dirty": len(self._pending.touched)
+            }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                # Los cambios se conservan y se reintentan en la siguiente escritura
+                logger.exception("cart.store_flush_failed")
+
+    def _put(self, cart: Cart) -> None:
+        previous = self._carts.pop(cart.id, None)
+        if previous is not None:
+            for item in previous.items:
+                self._item_carts.pop(item.id, None)
+        self._carts[cart.id] = cart
+        if cart.user_id:
+            self._user_carts[cart.user_id] = cart.id
+        for item in cart.items:
+            self._item_carts[item.id] = cart.id
+
+        # Expulsar los carritos menos usados que no tengan cambios pendientes
+        if len(self._carts) > self.maxsize:
+            for cart_id in list(self._carts):
+                if len(self._carts) <= self.maxsize:
+                    break
+                if cart_id not in self._pending.touched:
+                    self._drop(cart_id)
+
+    def _drop(self, cart_id: int) -> None:
+        cart = self._carts.pop(cart_id)
+        if cart.user_id and self._user_carts.get(cart.user_id) == cart_id:
+            del self._user_carts[cart.user_id]
+        for item in cart.items:
+            self._item_carts.pop(item.id, None)
+
+    def _discard(self, cart_ids: Set[int]) -> None:
+        """
+        Olvida los carritos que ya no existen en la base de datos, con sus cambios pendientes.
+        """
+        for cart_id in cart_ids:
+            cart = self._carts.get(cart_id)
+            item_ids = {item.id for item in cart.items} if cart is not None else set()
+            for item_id in item_ids:
+                self._pending.quantities.pop(item_id, None)
+            for item_id in [item_id for item_id, owner in self._pending.removed.items() if owner == cart_id]:
+                del self._pending.removed[item_id]
+            self._pending.touched.discard(cart_id)
+            if cart is not None:
+                self._drop(cart_id)
+
+    def _apply_pending(self, cart: Cart) -> Cart:
+        # Cambios hechos por otras peticiones mientras el carrito se recargaba
+        items = [
+            item.model_copy(update={
+                "quantity": self._pending.quantities[item.id],
+                "subtotal": item.price_snapshot * self._pending.quantities[item.id]
+            }) if item.id in self._pending.quantities else item
+            for item in cart.items
+            if item.id not in self._pending.removed
+        ]
+        return _with_items(cart, items)
+
+    def _take_pending(self, cart_id: Optional[int] = None) -> PendingWrites:
+        """
+        Extrae los cambios pendientes de un carrito, o todos si no se indica.
+        """
+        with self._lock:
+            if cart_id is None:
+                pending, self._pending = self._pending, PendingWrites()
+                return pending
+            pending = PendingWrites()
+            if cart_id in self._pending.touched:
+                self._pending.touched.remove(cart_id)
+                pending.touched.add(cart_id)
+            for item_id in [item_id for item_id, owner in self._pending.removed.items() if owner == cart_id]:
+                pending.removed[item_id] = self._pending.removed.pop(item_id)
+            for item_id in [item_id for item_id in self._pending.quantities if self._item_carts.get(item_id) == cart_id]:
+                pending.quantities[item_id] = self._pending.quantities.pop(item_id)
+            return pending
+
+    def _restore_pending(self, pending: PendingWrites) -> None:
+        # Los cambios posteriores a la extracción tienen prioridad
+        with self._lock:
+            for item_id, quantity in pending.quantities.items():
+                if item_id not in self._pending.removed:
+                    self._pending.quantities.setdefault(item_id, quantity)
+            for item_id, cart_id in pending.removed.items():
+                self._pending.removed.setdefault(item_id, cart_id)
+            self._pending.touched |= pending.touched
+
+def _with_items(cart: Cart, items: List[CartItem]) -> Cart:
+    return cart.model_copy(update={
+        "items": items,
+        "subtotal": sum((item.subtotal for item in items), Decimal("0")),
+        "item_count": sum(item.quantity for item in items)
+    })
+
+def create_cart_store(backend: str = CART_STORE_BACKEND, session_factory: async_sessionmaker = AsyncSessionLocal) -> CartStore:
+    """
+    Crea el almacén de carritos configurado en CART_STORE_BACKEND.
+    """
+    if backend == "sql":
+        return SqlCartStore()
+    if backend == "memory":
+        return MemoryCartStore(session_factory)
+    raise ValueError(f"Almacén de carritos desconocido: {backend}")
+
+store = create_cart_store()
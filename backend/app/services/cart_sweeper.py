@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from app.models.cart import Cart, CartItem, CartItemOption
+from app import metrics
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Horas sin actividad tras las que un carrito se considera abandonado y se borra
+CART_TTL_HOURS = float(os.getenv("CART_TTL_HOURS", "720"))
+# Carritos borrados por transacción, para no bloquear las tablas del carrito durante el barrido
+CART_SWEEP_BATCH_SIZE = int(os.getenv("CART_SWEEP_BATCH_SIZE", "500"))
+# Segundos entre barridos del proceso de la API; 0 desactiva el barrido en segundo plano
+CART_SWEEP_INTERVAL_SECONDS = float(os.getenv("CART_SWEEP_INTERVAL_SECONDS", "3600"))
+
+@dataclass
+class SweepResult:
+    """
+    Filas borradas por tabla en un barrido y su duración en segundos.
+    """
+    deleted: Dict[str, int] = field(default_factory=lambda: {"carts": 0, "cart_items": 0, "cart_item_options": 0})
+    batches: int = 0
+    duration: float = 0.0
+
+def database_now(db: Session) -> datetime:
+    """
+    Hora actual de la base de datos, en el mismo formato que las columnas escritas con func.now().
+    """
+    return db.execute(select(func.now())).scalar_one()
+
+def sweep_abandoned_carts(
+    db: Session,
+    ttl: timedelta = timedelta(hours=CART_TTL_HOURS),
+    batch_size: int = CART_SWEEP_BATCH_SIZE,
+    now: Optional[datetime] = None
+) -> SweepResult:
+    """
+    Borra los carritos sin actividad desde hace más de ttl, con sus ítems y las opciones
+    de los ítems, en lotes de batch_size carritos con una transacción por lote. Cada lote
+    bloquea sus carritos (FOR UPDATE SKIP LOCKED en Postgres), de modo que varios barridos
+    en paralelo no se pisan y un carrito que se está modificando se deja para el siguiente.
+    El límite se calcula con el reloj de la base de datos, el mismo con el que se escribe
+    last_activity, salvo que se indique now.
+    """
+    cutoff = (now or database_now(db)) - ttl
+    result = SweepResult()
+    started = time.perf_counter()
+    try:
+        while True:
+            cart_ids = db.execute(
+                select(Cart.id)
+                .where(Cart.last_activity < cutoff)
+                .order_by(Cart.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not cart_ids:
+                break
+
+            item_ids = select(CartItem.id).where(CartItem.cart_id.in_(cart_ids)).scalar_subquery()
+            deleted_options = db.execute(delete(CartItemOption).where(CartItemOption.cart_item_id.in_(item_ids)))
+            deleted_items = db.execute(delete(CartItem).where(CartItem.cart_id.in_(cart_ids)))
+            deleted_carts = db.execute(delete(Cart).where(Cart.id.in_(cart_ids)))
+            db.commit()
+
+            result.deleted["cart_item_options"] += deleted_options.rowcount
+            result.deleted["cart_items"] += deleted_items.rowcount
+            result.deleted["carts"] += deleted_carts.rowcount
+            result.batches += 1
+            if len(cart_ids) < batch_size:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        result.duration = time.perf_counter() - started
+        metrics.registry.cart_sweep_finished(result.deleted, result.duration)
+
+    logger.info("cart.sweep", deleted=result.deleted, batches=result.batches, duration_ms=round(result.duration * 1000, 2))
+    return result
+
+class CartSweeper:
+    """
+    Barrido periódico de carritos abandonados dentro del proceso de la API. Cada barrido
+    se ejecuta en un hilo con su propia sesión síncrona para no bloquear el bucle de eventos.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], interval: float = CART_SWEEP_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def sweep(self) -> SweepResult:
+        db = self.session_factory()
+        try:
+            return sweep_abandoned_carts(db)
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception:
+                # Un barrido fallido no detiene los siguientes
+                logger.exception("cart.sweep_failed")
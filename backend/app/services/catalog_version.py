@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from app.models.product import Product
+
+# Versión del catálogo por producto, guardada en products.catalog_version. Cualquier
+# escritura que afecte a las reglas, precios o stock de un producto incrementa su versión,
+# lo que invalida de forma precisa el índice compilado y los resultados en caché de ese
+# producto en todos los procesos. Cada proceso recuerda la versión leída durante
+# CATALOG_VERSION_TTL_SECONDS, de modo que las escrituras del propio proceso se ven de
+# inmediato y las de otros workers como mucho tras ese tiempo.
+CATALOG_VERSION_TTL_SECONDS = float(os.getenv("CATALOG_VERSION_TTL_SECONDS", "1"))
+
+_versions: Dict[int, Tuple[int, float]] = {}  # producto -> (versión, momento de la lectura)
+_lock = threading.Lock()
+
+def get_catalog_version(db: Session, product_id: int) -> Optional[int]:
+    """
+    Obtiene la versión actual del catálogo de un producto, leyéndola de la base de datos
+    si la recordada tiene más de CATALOG_VERSION_TTL_SECONDS. Devuelve None si el
+    producto no existe.
+    """
+    known = _versions.get(product_id)
+    if known is not None and time.monotonic() - known[1] < CATALOG_VERSION_TTL_SECONDS:
+        return known[0]
+
+    version = db.execute(select(Product.catalog_version).where(Product.id == product_id)).scalar_one_or_none()
+    if version is None:
+        with _lock:
+            _versions.pop(product_id, None)
+        return None
+    return record_catalog_version(product_id, version)
+
+def record_catalog_version(product_id: int, version: int) -> int:
+    """
+    Recuerda la versión del catálogo de un producto leída de la base de datos y devuelve
+    la más reciente conocida. La versión nunca retrocede: una réplica que aún no ha recibido
+    la última escritura devuelve una versión anterior, que no sustituye a la conocida ni
+    renueva su lectura, de modo que se vuelve a consultar hasta que la réplica se pone al día.
+    Los datos leídos con una versión anterior a la devuelta no deben guardarse en caché.
+    """
+    with _lock:
+        known = _versions.get(product_id)
+        if known is None or version >= known[0]:
+            known = _versions[product_id] = (version, time.monotonic())
+        return known[0]
+
+def known_catalog_version(product_id: int) -> Optional[int]:
+    """
+    Última versión del catálogo de un producto leída por el proceso, sin consultar la base
+    de datos aunque haya caducado.
+    """
+    known = _versions.get(product_id)
+    return known[0] if known is not None else None
+
+def bump_catalog_version(db: Session, product_id: Optional[int] = None) -> None:
+    """
+    Incrementa la versión del catálogo de un producto, o de todos si no se indica producto,
+    y confirma el cambio. Debe llamarse después de confirmar la escritura del catálogo, de
+    modo que ningún proceso pueda guardar los datos anteriores con la versión nueva.
+    """
+    statement = update(Product).values(catalog_version=Product.catalog_version + 1)
+    if product_id is not None:
+        statement = statement.where(Product.id == product_id)
+    db.execute(statement)
+    version = None
+    if product_id is not None:
+        version = db.execute(select(Product.catalog_version).where(Product.id == product_id)).scalar_one_or_none()
+    db.commit()
+
+    if version is not None:
+        record_catalog_version(product_id, version)
+        return
+    with _lock:
+        if product_id is None:
+            _versions.clear()
+        else:
+            _versions.pop(product_id, None)
+
+def clear_catalog_versions() -> None:
+    """
+    Olvida las versiones leídas por el proceso.
+    """
+    with _lock:
+        _versions.clear()
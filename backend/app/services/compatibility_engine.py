@@ -0,0 +1,549 @@
+from app.models.product import DependencyType
+from app.services.rule_index import ProductRuleIndex
+from typing import Dict, List, Optional, Tuple
+
+class CompatibilityEngine:
+    """
+    Motor de compatibilidad basado en máscaras de bits.
+    Cada opción del producto (y cada opción externa referenciada por una dependencia)
+    ocupa un bit, y las reglas requires/excludes se precalculan como máscaras enteras,
+    de modo que evaluar una selección cuesta O(opciones) independientemente del número
+    de dependencias.
+    """
+
+    def __init__(self, index: ProductRuleIndex):
+        self.index = index
+
+        # Asignar un bit a cada opción del producto y a los destinos externos de sus dependencias
+        self.bits: Dict[int, int] = {}
+        self.option_ids: List[int] = []  # Opción que ocupa cada posición de bit
+        for option_id in index.options:
+            self.bits[option_id] = 1 << len(self.bits)
+            self.option_ids.append(option_id)
+        for targets in index.dependencies.values():
+            for depends_on_id, _ in targets:
+                if depends_on_id not in self.bits:
+                    self.bits[depends_on_id] = 1 << len(self.bits)
+                    self.option_ids.append(depends_on_id)
+
+        self.requires_mask: Dict[int, int] = {}
+        self.excludes_mask: Dict[int, int] = {}
+        self.required_by_mask: Dict[int, int] = {}
+        self.excluded_by_mask: Dict[int, int] = {}
+        for option_id, targets in index.dependencies.items():
+            for depends_on_id, dep_type in targets:
+                if dep_type == DependencyType.requires:
+                    self.requires_mask[option_id] = self.requires_mask.get(option_id, 0) | self.bits[depends_on_id]
+                    self.required_by_mask[depends_on_id] = self.required_by_mask.get(depends_on_id, 0) | self.bits[option_id]
+                elif dep_type == DependencyType.excludes:
+                    self.excludes_mask[option_id] = self.excludes_mask.get(option_id, 0) | self.bits[depends_on_id]
+                    self.excluded_by_mask[depends_on_id] = self.excluded_by_mask.get(depends_on_id, 0) | self.bits[option_id]
+
+        self.part_type_mask: Dict[int, int] = {}
+        for part_type_id, option_ids in index.options_by_part_type.items():
+            mask = 0
+            for option_id in option_ids:
+                mask |= self.bits[option_id]
+            self.part_type_mask[part_type_id] = mask
+
+        self.product_mask = 0
+        self.in_stock_mask = 0
+        for option_id, option in index.options.items():
+            self.product_mask |= self.bits[option_id]
+            if option.in_stock:
+                self.in_stock_mask |= self.bits[option_id]
+
+        # Opciones del producto que son destino de al menos una dependencia requires
+        self.has_requiring_dependents = 0
+        for depends_on_id, sources in index.dependents.items():
+            if depends_on_id in index.options and any(dep_type == DependencyType.requires for _, dep_type in sources):
+                self.has_requiring_dependents |= self.bits[depends_on_id]
+
+        # Cierre transitivo de requires de cada opción, sin incluir la propia opción. Se guarda
+        # también el orden de recorrido para informar del primer conflicto de la cadena.
+        self.closure_order: Dict[int, List[int]] = {}
+        self.closure_mask: Dict[int, int] = {}
+        for option_id in index.requires:
+            order = self._requires_closure(option_id)
+            if order:
+                self.closure_order[option_id] = order
+                self.closure_mask[option_id] = self.mask_of(order)
+
+    def _requires_closure(self, option_id: int) -> List[int]:
+        """
+        Recorre en anchura las dependencias requires a partir de una opción.
+        Los ciclos se cortan al volver a una opción ya visitada.
+        """
+        requires = self.index.requires
+        visited = {option_id}
+        order = []
+        position = 0
+        pending = [option_id]
+        while position < len(pending):
+            current = pending[position]
+            position += 1
+            for depends_on_id in requires.get(current, ()):
+                if depends_on_id not in visited:
+                    visited.add(depends_on_id)
+                    order.append(depends_on_id)
+                    pending.append(depends_on_id)
+        return order
+
+    def mask_of(self, option_ids) -> int:
+        """
+        Convierte una colección de IDs de opción en una máscara, ignorando IDs desconocidos.
+        """
+        mask = 0
+        bits = self.bits
+        for option_id in option_ids:
+            bit = bits.get(option_id)
+            if bit is not None:
+                mask |= bit
+        return mask
+
+    def ids_in(self, mask: int):
+        """
+        Itera las opciones cuyo bit está en la máscara, en orden de bit.
+        """
+        option_ids = self.option_ids
+        while mask:
+            lowest = mask & -mask
+            yield option_ids[lowest.bit_length() - 1]
+            mask ^= lowest
+
+    def _first_in(self, option_ids: List[int], mask: int) -> int:
+        """
+        Devuelve la primera opción de la lista (en orden de dependencia) cuyo bit está en la máscara.
+        """
+        bits = self.bits
+        for option_id in option_ids:
+            if bits[option_id] & mask:
+                return option_id
+        raise ValueError("La máscara no contiene ninguna opción de la lista")
+
+    def _first_dependent(self, option_id: int, dep_type: DependencyType, mask: int) -> int:
+        """
+        Devuelve la primera opción que depende de option_id con el tipo indicado y cuyo bit está en la máscara.
+        """
+        bits = self.bits
+        for dependent_id, dependent_type in self.index.dependents.get(option_id, ()):
+            if dependent_type == dep_type and bits[dependent_id] & mask:
+                return dependent_id
+        raise ValueError("La máscara no contiene ninguna opción dependiente")
+
+    def _requires_other_entries(self, selected_option_ids: List[int], part_type_id: int) -> List[Tuple[int, int]]:
+        """
+        Lista ordenada de pares (opción que requiere, opción requerida) relevantes para las
+        selecciones actuales cuyo destino pertenece al tipo de parte indicado. Sigue el mismo
+        orden que las dependencias directas e inversas de cada opción seleccionada.
+        """
+        index = self.index
+        entries = []
+        for option_id in selected_option_ids:
+            for depends_on_id, dep_type in index.dependencies.get(option_id, ()):
+                if dep_type == DependencyType.requires:
+                    required = index.options.get(depends_on_id)
+                    if required and required.part_type_id == part_type_id:
+                        entries.append((option_id, depends_on_id))
+            option = index.options.get(option_id)
+            if option and option.part_type_id == part_type_id:
+                for dependent_id, dep_type in index.dependents.get(option_id, ()):
+                    if dep_type == DependencyType.requires:
+                        entries.append((dependent_id, option_id))
+        return entries
+
+    def _chain_conflicts(self, auto_selected: int, final_selected: int) -> Dict[int, dict]:
+        """
+        Conflictos de las opciones que habría que auto-seleccionar para completar el cierre
+        de requires: opciones de otro producto, sin stock, excluidas por (o que excluyen a)
+        la selección final, u otra opción del mismo tipo de parte ya presente.
+        """
+        index = self.index
+        bits = self.bits
+        conflicts = {}
+        for option_id in self.ids_in(auto_selected):
+            option = index.options.get(option_id)
+            bit = bits[option_id]
+            conflict = None
+            if option is None:
+                conflict = {"reason": "not_in_product"}
+            elif not option.in_stock:
+                conflict = {"reason": "out_of_stock"}
+            elif self.excludes_mask.get(option_id, 0) & final_selected:
+                depends_on_id = self._first_in(index.excludes[option_id], final_selected)
+                conflict = {
+                    "reason": "excludes",
+                    "dependency_id": depends_on_id,
+                    "dependency_name": index.option_name(depends_on_id)
+                }
+            elif self.excluded_by_mask.get(option_id, 0) & final_selected:
+                excluder_id = self._first_dependent(option_id, DependencyType.excludes, final_selected)
+                conflict = {
+                    "reason": "excluded_by",
+                    "dependency_id": excluder_id,
+                    "dependency_name": index.option_name(excluder_id)
+                }
+            elif self.part_type_mask[option.part_type_id] & final_selected & ~bit:
+                other_id = self._first_in(index.options_by_part_type[option.part_type_id], final_selected & ~bit)
+                conflict = {
+                    "reason": "another_option_selected",
+                    "dependency_id": other_id,
+                    "dependency_name": index.option_name(other_id)
+                }
+            if conflict:
+                conflicts[option_id] = {"option_id": option_id, "option_name": index.option_name(option_id), **conflict}
+        return conflicts
+
+    def validate(self, selected_option_ids: List[int]) -> dict:
+        """
+        Evalúa la compatibilidad de todas las opciones del producto para una selección.
+        Devuelve la misma estructura que product_service.validate_compatibility.
+        """
+        index = self.index
+        result = {
+            "product": {
+                "id": index.product_id,
+                "name": index.product_name,
+                "components": []
+            },
+            "auto_selected_options": []
+        }
+
+        # Si no hay selecciones, todas las opciones son compatibles salvo las que no tienen stock
+        if not selected_option_ids:
+            for part_type_id, part_type_name in index.part_types:
+                component_data = {"id": part_type_id, "name": part_type_name, "options": []}
+                for option_id in index.options_by_part_type[part_type_id]:
+                    option = index.options[option_id]
+                    option_data = {
+                        "id": option.id,
+                        "name": option.name,
+                        "base_price": option.base_price,
+                        "in_stock": option.in_stock,
+                        "selected": False,
+                        "is_compatible": option.in_stock
+                    }
+                    if not option.in_stock:
+                        option_data["availability_reason"] = "out_of_stock"
+                    component_data["options"].append(option_data)
+                result["product"]["components"].append(component_data)
+            return result
+
+        bits = self.bits
+        requires_mask = self.requires_mask
+        excludes_mask = self.excludes_mask
+        selected = self.mask_of(selected_option_ids)
+
+        # Cierre transitivo de requires de la selección y conflictos de las opciones que
+        # habría que añadir para completarlo
+        closure = 0
+        excludes_selected = False
+        for option_id in selected_option_ids:
+            closure |= self.closure_mask.get(option_id, 0)
+            if excludes_mask.get(option_id, 0) & selected:
+                excludes_selected = True
+        auto_selected = closure & ~selected
+        chain_conflicts = self._chain_conflicts(auto_selected, selected | closure) if auto_selected else {}
+        chain_conflict_mask = self.mask_of(chain_conflicts)
+
+        # El cierre solo se auto-selecciona completo: si algún eslabón de cualquier cadena
+        # está en conflicto, o la selección ya se excluye a sí misma, no se añade nada
+        can_auto_select = not chain_conflicts and not excludes_selected
+
+        # Detectar incompatibilidades entre las opciones seleccionadas. Se recorre la selección
+        # en orden porque un motivo posterior sobrescribe al anterior para la misma opción.
+        incompatible = 0
+        unmet_requires = 0  # Opciones seleccionadas con algún requires no satisfecho
+        required = 0
+        incompatible_reasons = {}
+        for option_id in selected_option_ids:
+            if option_id not in index.options:
+                continue
+            bit = bits[option_id]
+            option_requires = requires_mask.get(option_id, 0)
+            required |= option_requires
+
+            missing = option_requires & ~selected
+            if missing and not can_auto_select:
+                depends_on_id = self._first_in(index.requires[option_id], missing)
+                incompatible |= bit
+                unmet_requires |= bit
+                incompatible_reasons[option_id] = {
+                    "reason": "requires",
+                    "dependency_id": depends_on_id,
+                    "dependency_name": index.option_name(depends_on_id)
+                }
+                # Informar del primer conflicto en la cadena de requires de la opción
+                if self.closure_mask.get(option_id, 0) & chain_conflict_mask:
+                    conflict_id = self._first_in(self.closure_order[option_id], chain_conflict_mask)
+                    incompatible_reasons[option_id]["chain_conflict"] = chain_conflicts[conflict_id]
+
+            conflicts = excludes_mask.get(option_id, 0) & selected
+            if conflicts:
+                depends_on_id = self._first_in(index.excludes[option_id], conflicts)
+                incompatible |= bit | bits[depends_on_id]
+                incompatible_reasons[option_id] = {
+                    "reason": "excludes",
+                    "dependency_id": depends_on_id,
+                    "dependency_name": index.option_name(depends_on_id)
+                }
+                incompatible_reasons[depends_on_id] = {
+                    "reason": "excluded_by",
+                    "dependency_id": option_id,
+                    "dependency_name": index.options[option_id].name
+                }
+
+        has_incompatibilities = incompatible != 0
+
+        # Solo auto-seleccionar el cierre de requires si no hay incompatibilidades
+        final_selected = selected if has_incompatibilities else selected | closure
+        if not has_incompatibilities:
+            result["auto_selected_options"] = list(self.ids_in(auto_selected))
+
+        # Opciones requeridas específicamente por alguna dependencia relevante para la selección
+        required_targets = (required | (selected & self.has_requiring_dependents)) & self.product_mask
+
+        for part_type_id, part_type_name in index.part_types:
+            component_data = {"id": part_type_id, "name": part_type_name, "options": []}
+            part_type_mask = self.part_type_mask[part_type_id]
+            has_selection_for_part_type = (part_type_mask & final_selected) != 0
+            requires_other = part_type_mask & required_targets
+            requires_other_entries = None
+
+            for option_id in index.options_by_part_type[part_type_id]:
+                option = index.options[option_id]
+                bit = bits[option_id]
+                option_data = {
+                    "id": option.id,
+                    "name": option.name,
+                    "base_price": option.base_price,
+                    "in_stock": option.in_stock,
+                    "selected": (final_selected & bit) != 0,
+                    "is_compatible": True
+                }
+
+                # Las opciones seleccionadas siempre son compatibles
+                if selected & bit:
+                    if incompatible & bit:
+                        option_data["requires_additional_selection"] = True
+                        if option_id in incompatible_reasons:
+                            option_data["compatibility_details"] = incompatible_reasons[option_id]
+                    component_data["options"].append(option_data)
+                    continue
+
+                # Opciones añadidas por el cierre de requires de la selección
+                if final_selected & bit:
+                    option_data["auto_selected"] = True
+                    option_data["required_by"] = [
+                        {"option_id": requiring_id, "option_name": index.option_name(requiring_id)}
+                        for requiring_id, dep_type in index.dependents.get(option_id, ())
+                        if dep_type == DependencyType.requires and bits[requiring_id] & final_selected
+                    ]
+                    component_data["options"].append(option_data)
+                    continue
+
+                if not option.in_stock:
+                    option_data["is_compatible"] = False
+                    option_data["availability_reason"] = "out_of_stock"
+                    component_data["options"].append(option_data)
+                    continue
+
+                if has_selection_for_part_type and not final_selected & bit:
+                    option_data["is_compatible"] = True
+                    option_data["available_for_selection"] = False
+                    option_data["availability_reason"] = "another_option_selected"
+                    component_data["options"].append(option_data)
+                    continue
+
+                if incompatible & bit:
+                    option_data["is_compatible"] = False
+                    if option_id in incompatible_reasons:
+                        option_data["availability_reason"] = incompatible_reasons[option_id]["reason"]
+                        option_data["compatibility_details"] = incompatible_reasons[option_id]
+                    component_data["options"].append(option_data)
+                    continue
+
+                # Si hay incompatibilidades y esta opción es requerida, es compatible pero no auto-seleccionada
+                if has_incompatibilities and required & bit:
+                    required_by = [
+                        {"option_id": requiring_id, "option_name": index.option_name(requiring_id)}
+                        for requiring_id in selected_option_ids
+                        for depends_on_id in index.requires.get(requiring_id, ())
+                        if depends_on_id == option_id
+                    ]
+                    if required_by:
+                        option_data["required_by"] = required_by
+                    component_data["options"].append(option_data)
+                    continue
+
+                is_compatible = True
+                compatibility_reason = None
+
+                # 1. Alguna dependencia relevante requiere específicamente otra opción de este tipo
+                if requires_other & ~bit:
+                    if requires_other_entries is None:
+                        requires_other_entries = self._requires_other_entries(selected_option_ids, part_type_id)
+                    for requiring_id, required_id in requires_other_entries:
+                        if required_id != option_id:
+                            is_compatible = False
+                            compatibility_reason = {
+                                "reason": "requires_other",
+                                "requiring_id": requiring_id,
+                                "requiring_name": index.option_name(requiring_id),
+                                "required_id": required_id,
+                                "required_name": index.options[required_id].name
+                            }
+                            break
+
+                # 2. Dependencias propias de la opción frente a la selección final
+                if is_compatible:
+                    missing = requires_mask.get(option_id, 0) & ~final_selected
+                    conflicts = excludes_mask.get(option_id, 0) & final_selected
+                    if missing or conflicts:
+                        for depends_on_id, dep_type in index.dependencies[option_id]:
+                            failing = missing if dep_type == DependencyType.requires else conflicts
+                            if bits[depends_on_id] & failing:
+                                is_compatible = False
+                                compatibility_reason = {
+                                    "reason": "requires" if dep_type == DependencyType.requires else "excludes",
+                                    "dependency_id": depends_on_id,
+                                    "dependency_name": index.option_name(depends_on_id)
+                                }
+                                break
+
+                # 3. Si hay incompatibilidades, comprobar si la opción forma parte del conflicto
+                if has_incompatibilities:
+                    excluders = self.excluded_by_mask.get(option_id, 0) & selected
+                    if excluders:
+                        excluder_id = self._first_dependent(option_id, DependencyType.excludes, excluders)
+                        is_compatible = False
+                        compatibility_reason = {
+                            "reason": "excluded_by",
+                            "dependency_id": excluder_id,
+                            "dependency_name": index.option_name(excluder_id)
+                        }
+
+                    requirers = self.required_by_mask.get(option_id, 0) & unmet_requires
+                    if requirers:
+                        requiring_id = self._first_dependent(option_id, DependencyType.requires, requirers)
+                        is_compatible = False
+                        compatibility_reason = {
+                            "reason": "required_by_incompatible",
+                            "dependency_id": requiring_id,
+                            "dependency_name": index.option_name(requiring_id)
+                        }
+
+                option_data["is_compatible"] = is_compatible
+                if not is_compatible and compatibility_reason:
+                    option_data["availability_reason"] = compatibility_reason["reason"]
+                    option_data["compatibility_details"] = compatibility_reason
+
+                component_data["options"].append(option_data)
+
+            result["product"]["components"].append(component_data)
+
+        return result
+
+    def check(self, selected_option_ids: List[int]) -> Tuple[List[int], Optional[dict]]:
+        """
+        Veredicto compacto de una selección, sin construir el estado de cada opción.
+        Devuelve las opciones que se auto-seleccionarían para completar las dependencias
+        requires y el primer conflicto encontrado (None si la selección es válida).
+        A diferencia de validate, también son conflicto las opciones de otro producto, las
+        opciones seleccionadas sin stock y dos opciones del mismo tipo de parte.
+        """
+        index = self.index
+        bits = self.bits
+        selected = self.mask_of(selected_option_ids)
+        closure = 0
+
+        for option_id in selected_option_ids:
+            option = index.options.get(option_id)
+            if option is None:
+                return [], {"option_id": option_id, "option_name": index.option_name(option_id), "reason": "not_in_product"}
+            conflict = None
+            if not option.in_stock:
+                conflict = {"reason": "out_of_stock"}
+            elif self.excludes_mask.get(option_id, 0) & selected:
+                depends_on_id = self._first_in(index.excludes[option_id], selected)
+                conflict = {
+                    "reason": "excludes",
+                    "dependency_id": depends_on_id,
+                    "dependency_name": index.option_name(depends_on_id)
+                }
+            elif self.part_type_mask[option.part_type_id] & selected & ~bits[option_id]:
+                other_id = self._first_in(index.options_by_part_type[option.part_type_id], selected & ~bits[option_id])
+                conflict = {
+                    "reason": "another_option_selected",
+                    "dependency_id": other_id,
+                    "dependency_name": index.option_name(other_id)
+                }
+            if conflict:
+                return [], {"option_id": option_id, "option_name": option.name, **conflict}
+            closure |= self.closure_mask.get(option_id, 0)
+
+        auto_selected = closure & ~selected
+        if not auto_selected:
+            return [], None
+
+        chain_conflicts = self._chain_conflicts(auto_selected, selected | closure)
+        if chain_conflicts:
+            chain_conflict_mask = self.mask_of(chain_conflicts)
+            for option_id in selected_option_ids:
+                missing = self.requires_mask.get(option_id, 0) & ~selected
+                if missing and self.closure_mask[option_id] & chain_conflict_mask:
+                    depends_on_id = self._first_in(index.requires[option_id], missing)
+                    conflict_id = self._first_in(self.closure_order[option_id], chain_conflict_mask)
+                    return [], {
+                        "option_id": option_id,
+                        "option_name": index.option_name(option_id),
+                        "reason": "requires",
+                        "dependency_id": depends_on_id,
+                        "dependency_name": index.option_name(depends_on_id),
+                        "chain_conflict": chain_conflicts[conflict_id]
+                    }
+
+        return list(self.ids_in(auto_selected)), None
+
+    def available_options(self, current_selection: List[int]) -> List[dict]:
+        """
+        Opciones en stock de cada tipo de parte, marcando si serían compatibles al añadirlas
+        a la selección actual. Devuelve la misma estructura que product_service.get_available_options.
+        """
+        index = self.index
+        bits = self.bits
+        selection = self.mask_of(current_selection)
+
+        result = []
+        for part_type_id, part_type_name in index.part_types:
+            part_type_data = {"id": part_type_id, "name": part_type_name, "options": []}
+            for option_id in index.options_by_part_type[part_type_id]:
+                option = index.options[option_id]
+                if not option.in_stock:
+                    continue
+
+                bit = bits[option_id]
+                is_compatible = True
+                if not selection & bit:
+                    temp_selection = selection | bit
+                    is_compatible = not (
+                        self.requires_mask.get(option_id, 0) & ~temp_selection
+                        or self.excludes_mask.get(option_id, 0) & temp_selection
+                        or self.excluded_by_mask.get(option_id, 0) & selection
+                    )
+
+                part_type_data["options"].append({
+                    "id": option.id,
+                    "name": option.name,
+                    "base_price": option.base_price,
+                    "is_compatible": is_compatible
+                })
+            result.append(part_type_data)
+
+        return result
+
+def get_engine(index: ProductRuleIndex) -> CompatibilityEngine:
+    """
+    Obtiene el motor de compatibilidad del índice, compilándolo la primera vez.
+    """
+    return index.derived("compatibility", CompatibilityEngine)
@@ -0,0 +1,358 @@
+from sqlalchemy.orm import Session
+from app.services import rule_index, compatibility_engine
+from app.services.rule_index import ProductRuleIndex
+from app.services.pricing_engine import to_cents
+from typing import Dict, Iterator, List, Optional, Tuple
+import math
+
+class ConfigurationSolver:
+    """
+    Cuenta y enumera las configuraciones válidas de un producto: una opción en stock por
+    cada tipo de parte, respetando las dependencias requires y excludes. Los tipos de parte
+    sin opciones no intervienen, y un producto sin opciones no tiene configuraciones.
+
+    Los tipos de parte se recorren en orden y el estado de la búsqueda se reduce a tres
+    máscaras: opciones forzadas y prohibidas en los tipos de parte restantes, y opciones
+    ya elegidas que alguna opción posterior requiere. Al contar, el número de
+    configuraciones de cada estado se memoriza, de modo que subárboles equivalentes no
+    se vuelven a recorrer. La memoria de recuentos vive solo durante cada operación para
+    no retenerla junto al índice compilado.
+    """
+
+    def __init__(self, index: ProductRuleIndex):
+        self.index = index
+        self.engine = engine = compatibility_engine.get_engine(index)
+
+        self.part_type_masks: List[int] = [
+            engine.part_type_mask[part_type_id]
+            for part_type_id, _ in index.part_types
+            if index.options_by_part_type[part_type_id]
+        ]
+        size = len(self.part_type_masks)
+
+        # Máscaras de las opciones de los tipos de parte anteriores y posteriores a cada posición
+        self.earlier_masks: List[int] = [0] * (size + 1)
+        self.later_masks: List[int] = [0] * (size + 1)
+        for position in range(size):
+            self.earlier_masks[position + 1] = self.earlier_masks[position] | self.part_type_masks[position]
+        for position in range(size - 1, -1, -1):
+            self.later_masks[position] = self.later_masks[position + 1] | self.part_type_masks[position]
+
+        # Propagación de restricciones: una opción es viable si está en stock y ella junto con
+        # su cierre de requires no contiene dos opciones del mismo tipo de parte ni un par
+        # excluido. Como el cierre es transitivo, basta con exigir que todo el cierre sea viable.
+        consistent = 0
+        for option_id in engine.ids_in(engine.in_stock_mask):
+            if self._is_consistent(engine.closure_mask.get(option_id, 0) | engine.bits[option_id]):
+                consistent |= engine.bits[option_id]
+        self.viable = 0
+        for option_id in engine.ids_in(consistent):
+            if not engine.closure_mask.get(option_id, 0) & ~consistent:
+                self.viable |= engine.bits[option_id]
+
+        # Opciones de tipos de parte anteriores a cada posición que requiere alguna opción posterior
+        self.needed_masks: List[int] = [0] * (size + 1)
+        for position in range(size - 1, -1, -1):
+            needed = self.needed_masks[position + 1]
+            for option_id in engine.ids_in(self.part_type_masks[position]):
+                needed |= engine.closure_mask.get(option_id, 0)
+            self.needed_masks[position] = needed
+        for position in range(size + 1):
+            self.needed_masks[position] &= self.earlier_masks[position]
+
+        # Precios en céntimos para la búsqueda de la configuración más barata: precio base
+        # y precios condicionales (por orden de ID) con el bit de su condición. Las condiciones
+        # que no son opciones viables del producto nunca se cumplen y se descartan.
+        self.base_cents: Dict[int, int] = {}
+        self.conditional_cents: Dict[int, List[Tuple[int, int]]] = {}
+        self.price_floors: Dict[int, int] = {}
+        for option_id in engine.ids_in(self.viable):
+            self.base_cents[option_id] = to_cents(index.options[option_id].base_price)
+            self.conditional_cents[option_id] = [
+                (engine.bits[condition_option_id], to_cents(conditional_price))
+                for condition_option_id, conditional_price in index.conditional_prices.get(option_id, ())
+                if engine.bits.get(condition_option_id, 0) & self.viable
+            ]
+            self.price_floors[option_id] = min(
+                [self.base_cents[option_id]] + [price for _, price in self.conditional_cents[option_id]]
+            )
+
+        # El precio de una opción se resuelve al decidir el último tipo de parte entre el suyo y
+        # los de sus condiciones. Hasta entonces, la opción y sus condiciones forman parte del
+        # estado de la búsqueda, junto con las opciones que requiere alguna opción posterior.
+        position_of = {}
+        for position, part_type_mask in enumerate(self.part_type_masks):
+            for option_id in engine.ids_in(part_type_mask):
+                position_of[option_id] = position
+        self.resolve_masks: List[int] = [0] * (size + 1)
+        self.pending_masks: List[int] = [0] * (size + 1)
+        self.price_keep_masks: List[int] = list(self.needed_masks)
+        for option_id, conditions in self.conditional_cents.items():
+            option_position = position_of[option_id]
+            condition_positions = [
+                (condition_bit, position_of[engine.option_ids[condition_bit.bit_length() - 1]])
+                for condition_bit, _ in conditions
+            ]
+            resolve_position = max([option_position] + [position for _, position in condition_positions])
+            self.resolve_masks[resolve_position] |= engine.bits[option_id]
+            for position in range(option_position + 1, resolve_position + 1):
+                self.pending_masks[position] |= engine.bits[option_id]
+                self.price_keep_masks[position] |= engine.bits[option_id]
+            for condition_bit, condition_position in condition_positions:
+                for position in range(condition_position + 1, resolve_position + 1):
+                    self.price_keep_masks[position] |= condition_bit
+
+        # Cota inferior del coste de los tipos de parte pendientes desde cada posición
+        self.remaining_floors: List[Optional[int]] = [0] * (size + 1)
+        for position in range(size - 1, -1, -1):
+            floors = [self.price_floors[option_id] for option_id in engine.ids_in(self.part_type_masks[position] & self.viable)]
+            following = self.remaining_floors[position + 1]
+            self.remaining_floors[position] = None if not floors or following is None else min(floors) + following
+
+    def _is_consistent(self, mask: int) -> bool:
+        """
+        Indica si un conjunto de opciones tiene como mucho una opción por tipo de parte
+        y ningún par de opciones que se excluyan.
+        """
+        engine = self.engine
+        for part_type_mask in engine.part_type_mask.values():
+            options_in_part_type = mask & part_type_mask
+            if options_in_part_type & (options_in_part_type - 1):
+                return False
+        for option_id in engine.ids_in(mask):
+            if engine.excludes_mask.get(option_id, 0) & mask:
+                return False
+        return True
+
+    def _choices(
+        self,
+        position: int,
+        forced: int,
+        banned: int,
+        chosen: int,
+        keep_masks: Optional[List[int]] = None
+    ) -> Iterator[Tuple[int, Tuple[int, int, int, int]]]:
+        """
+        Opciones elegibles para el tipo de parte de la posición indicada, junto con el
+        estado resultante de elegir cada una. keep_masks indica qué opciones elegidas se
+        conservan en el estado en cada posición (por defecto, las que requiere alguna
+        opción posterior).
+        """
+        if keep_masks is None:
+            keep_masks = self.needed_masks
+        engine = self.engine
+        part_type_mask = self.part_type_masks[position]
+        domain = part_type_mask & self.viable & ~banned
+
+        forced_here = forced & part_type_mask
+        if forced_here:
+            # Dos opciones forzadas en el mismo tipo de parte no se pueden satisfacer
+            if forced_here & (forced_here - 1):
+                return
+            domain &= forced_here
+
+        earlier_mask = self.earlier_masks[position]
+        later_mask = self.later_masks[position + 1] & self.viable
+        keep_mask = keep_masks[position + 1]
+        for option_id in engine.ids_in(domain):
+            closure = engine.closure_mask.get(option_id, 0)
+            # Lo que la opción requiere de tipos de parte anteriores debe estar ya elegido
+            if closure & earlier_mask & ~chosen:
+                continue
+            bit = engine.bits[option_id]
+            yield option_id, (
+                position + 1,
+                (forced | closure) & later_mask,
+                (banned | engine.excludes_mask.get(option_id, 0) | engine.excluded_by_mask.get(option_id, 0)) & later_mask,
+                (chosen | bit) & keep_mask
+            )
+
+    def _count(self, state: Tuple[int, int, int, int], counts: Dict[Tuple[int, int, int, int], int]) -> int:
+        """
+        Número de configuraciones válidas que completan el estado indicado.
+        """
+        if state[0] == len(self.part_type_masks):
+            return 1
+
+        count = counts.get(state)
+        if count is None:
+            count = 0
+            for _, next_state in self._choices(*state):
+                count += self._count(next_state, counts)
+            counts[state] = count
+        return count
+
+    def count(self) -> int:
+        """
+        Número total de configuraciones válidas del producto.
+        """
+        if not self.part_type_masks:
+            return 0
+        return self._count((0, 0, 0, 0), {})
+
+    def configurations(self) -> Iterator[List[int]]:
+        """
+        Genera perezosamente las configuraciones válidas, como listas de IDs de opción en el
+        orden de los tipos de parte. Las ramas sin configuraciones se descartan con los
+        recuentos memorizados, por lo que nunca se exploran caminos sin salida.
+        """
+        if not self.part_type_masks:
+            return
+        yield from self._enumerate((0, 0, 0, 0), [], {})
+
+    def _enumerate(
+        self,
+        state: Tuple[int, int, int, int],
+        path: List[int],
+        counts: Dict[Tuple[int, int, int, int], int]
+    ) -> Iterator[List[int]]:
+        """
+        Recorre en profundidad las opciones elegibles a partir del estado indicado.
+        """
+        if state[0] == len(self.part_type_masks):
+            yield list(path)
+            return
+
+        for option_id, next_state in self._choices(*state):
+            if self._count(next_state, counts) == 0:
+                continue
+            path.append(option_id)
+            yield from self._enumerate(next_state, path, counts)
+            path.pop()
+
+    def _resolution_cost(self, position: int, chosen: int) -> int:
+        """
+        Precio, en céntimos, de las opciones elegidas cuyo precio queda resuelto al decidir el
+        tipo de parte de la posición indicada: el primer precio condicional (por ID) cuya
+        condición esté elegida, o el precio base.
+        """
+        cost = 0
+        for option_id in self.engine.ids_in(chosen & self.resolve_masks[position]):
+            for condition_bit, conditional_price in self.conditional_cents[option_id]:
+                if chosen & condition_bit:
+                    cost += conditional_price
+                    break
+            else:
+                cost += self.base_cents[option_id]
+        return cost
+
+    def _lower_bound(self, state: Tuple[int, int, int, int]) -> Optional[int]:
+        """
+        Cota admisible del coste de completar un estado: el menor precio posible de cada
+        tipo de parte pendiente más el de las opciones elegidas cuyo precio aún no se ha resuelto.
+        """
+        position, _, _, chosen = state
+        bound = self.remaining_floors[position]
+        if bound is None:
+            return None
+        for option_id in self.engine.ids_in(chosen & self.pending_masks[position]):
+            bound += self.price_floors[option_id]
+        return bound
+
+    def _cheapest(
+        self,
+        state: Tuple[int, int, int, int],
+        budget: Optional[int],
+        best: Dict[Tuple[int, int, int, int], Tuple[int, int]],
+        lower_bounds: Dict[Tuple[int, int, int, int], float]
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Coste mínimo de completar el estado y la opción elegida en él, siempre que sea menor
+        que el presupuesto (None = sin límite); si no, None. Los costes exactos se memorizan en
+        best; cuando la búsqueda no encuentra nada por debajo del presupuesto se memoriza este
+        como cota inferior del estado, de modo que cada estado se poda o se resuelve una vez.
+        """
+        if state[0] == len(self.part_type_masks):
+            return 0, None
+
+        exact = best.get(state)
+        if exact is not None:
+            return exact if budget is None or exact[0] < budget else None
+        known_bound = lower_bounds.get(state, 0)
+        bound = self._lower_bound(state)
+        if bound is None:
+            return None
+        if budget is not None and max(bound, known_bound) >= budget:
+            return None
+        if known_bound == math.inf:
+            return None
+
+        position, _, _, chosen = state
+        engine = self.engine
+        result = None
+        limit = budget
+        # Probar primero las opciones más baratas para ajustar pronto el límite
+        choices = sorted(self._choices(*state, self.price_keep_masks), key=lambda choice: (self.price_floors[choice[0]], choice[0]))
+        for option_id, next_state in choices:
+            cost = self._resolution_cost(position, chosen | engine.bits[option_id])
+            if limit is not None and cost >= limit:
+                continue
+            completion = self._cheapest(next_state, None if limit is None else limit - cost, best, lower_bounds)
+            if completion is not None:
+                result = (cost + completion[0], option_id)
+                limit = result[0]
+
+        if result is None:
+            lower_bounds[state] = math.inf if budget is None else max(known_bound, budget)
+            return None
+        best[state] = result
+        return result
+
+    def cheapest_completion(self, selected_option_ids: List[int]) -> Optional[List[int]]:
+        """
+        Configuración válida más barata que contiene las opciones seleccionadas, como lista de
+        IDs de opción en el orden de los tipos de parte, o None si no existe ninguna. El precio
+        considera los precios condicionales; ante empates se devuelve la primera encontrada.
+
+        Ramificación y poda sobre los estados del solver: cada estado se poda si su cota
+        inferior (menor precio posible de cada tipo de parte pendiente) no mejora el mejor
+        precio conocido, y los resultados se memorizan por estado como en el recuento.
+        """
+        engine = self.engine
+        if not self.part_type_masks:
+            return None
+        if any(option_id not in self.index.options for option_id in selected_option_ids):
+            return None
+        selected = engine.mask_of(selected_option_ids)
+        if selected & ~self.viable:
+            return None
+
+        # Las opciones seleccionadas se fuerzan en sus tipos de parte
+        state = (0, selected, 0, 0)
+        best = {}
+        if self._cheapest(state, None, best, {}) is None:
+            return None
+
+        configuration = []
+        while state[0] < len(self.part_type_masks):
+            option_id = best[state][1]
+            configuration.append(option_id)
+            state = next(next_state for choice_id, next_state in self._choices(*state, self.price_keep_masks) if choice_id == option_id)
+        return configuration
+
+def get_solver(index: ProductRuleIndex) -> ConfigurationSolver:
+    """
+    Obtiene el solver de configuraciones del índice, compilándolo la primera vez.
+    """
+    return index.derived("configuration_solver", ConfigurationSolver)
+
+def count_configurations(db: Session, product_id: int) -> Optional[int]:
+    """
+    Cuenta las configuraciones válidas de un producto sin materializarlas.
+    Devuelve None si el producto no existe.
+    """
+    index = rule_index.get_rule_index(db, product_id)
+    if index is None:
+        return None
+    return get_solver(index).count()
+
+def iter_configurations(db: Session, product_id: int) -> Optional[Iterator[List[int]]]:
+    """
+    Devuelve un generador de las configuraciones válidas de un producto.
+    El generador no usa la sesión, por lo que puede consumirse después de cerrarla.
+    Devuelve None si el producto no existe.
+    """
+    index = rule_index.get_rule_index(db, product_id)
+    if index is None:
+        return None
+    return get_solver(index).configurations()
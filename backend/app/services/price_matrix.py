@@ -0,0 +1,161 @@
+import numpy as np
+from app.services import pricing_engine
+from app.services.rule_index import ProductRuleIndex
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+# Rango de las celdas sin precio condicional: mayor que cualquier posición de precedencia
+NO_RULE = np.iinfo(np.int32).max
+
+class PriceMatrix:
+    """
+    Matriz de precios de un producto con NumPy: una fila por opción y una columna por opción
+    condición. Cada celda guarda el precio condicional en céntimos y su rango de precedencia
+    (posición de la regla en la tabla de precios, menor gana).
+
+    Permite calcular en una sola operación vectorizada el precio marginal de todas las
+    opciones dada una selección: lo que cambiaría el precio total si la opción sustituyera
+    a la seleccionada de su tipo de parte, incluidos los precios condicionales que activa o
+    desactiva en el resto de la selección.
+    """
+
+    def __init__(self, index: ProductRuleIndex):
+        pricing = pricing_engine.get_pricing_engine(index)
+
+        self.option_ids: List[int] = list(index.options)
+        self.row_of: Dict[int, int] = {option_id: row for row, option_id in enumerate(self.option_ids)}
+        part_type_codes = {part_type_id: code for code, (part_type_id, _) in enumerate(index.part_types)}
+        self.part_type_count = len(part_type_codes)
+        self.row_part_type = np.array(
+            [part_type_codes[index.options[option_id].part_type_id] for option_id in self.option_ids],
+            dtype=np.int64
+        )
+        self.base = np.array(
+            [pricing_engine.to_cents(index.options[option_id].base_price) for option_id in self.option_ids],
+            dtype=np.int64
+        )
+
+        # Columnas: opciones que actúan como condición, incluidas las de otros productos
+        self.condition_ids: List[int] = sorted(
+            {condition_option_id for conditions in pricing.conditions.values() for condition_option_id in conditions}
+        )
+        self.column_of: Dict[int, int] = {option_id: column for column, option_id in enumerate(self.condition_ids)}
+        self.column_part_type = np.array(
+            [
+                part_type_codes[index.options[option_id].part_type_id] if option_id in index.options else -1
+                for option_id in self.condition_ids
+            ],
+            dtype=np.int64
+        )
+
+        # Se añade una columna vacía al final para las opciones que no son condición de nada
+        columns = len(self.condition_ids) + 1
+        self.ranks = np.full((len(self.option_ids), columns), NO_RULE, dtype=np.int32)
+        self.prices = np.zeros((len(self.option_ids), columns), dtype=np.int64)
+        for option_id, conditions in pricing.conditions.items():
+            row = self.row_of.get(option_id)
+            if row is None:
+                continue
+            for rank, condition_option_id in enumerate(conditions):
+                column = self.column_of[condition_option_id]
+                self.ranks[row, column] = rank
+                self.prices[row, column] = pricing_engine.to_cents(pricing.prices[(option_id, condition_option_id)])
+
+        # Columna de cada opción como condición, o la columna vacía
+        self.row_column = np.array(
+            [self.column_of.get(option_id, columns - 1) for option_id in self.option_ids],
+            dtype=np.int64
+        )
+
+    def _best(self, ranks: np.ndarray, prices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Regla de mayor precedencia por fila entre las columnas dadas: devuelve su rango y el
+        precio resultante (el condicional si hay regla, o el base).
+        """
+        if ranks.shape[1] == 0:
+            return np.full(ranks.shape[0], NO_RULE, dtype=np.int32), self.base.copy()
+        best = ranks.argmin(axis=1)
+        rows = np.arange(ranks.shape[0])
+        rank = ranks[rows, best]
+        return rank, np.where(rank < NO_RULE, prices[rows, best], self.base)
+
+    def marginal_prices(self, selected_option_ids: List[int]) -> Dict[int, Tuple[Decimal, Decimal]]:
+        """
+        Devuelve, para cada opción del producto, su precio dada la selección y la variación del
+        precio total al elegirla en lugar de la opción seleccionada de su tipo de parte.
+        Las opciones ya seleccionadas conservan su precio actual con variación cero.
+        """
+        selected = set(selected_option_ids)
+        selected_columns = np.array(
+            [column for column, option_id in enumerate(self.condition_ids) if option_id in selected],
+            dtype=np.int64
+        )
+        selected_rows = np.array(
+            [self.row_of[option_id] for option_id in selected if option_id in self.row_of],
+            dtype=np.int64
+        )
+        ranks = self.ranks[:, selected_columns]
+        prices = self.prices[:, selected_columns]
+        groups = self.column_part_type[selected_columns]
+
+        # Precio actual de cada opción con todas las condiciones seleccionadas
+        current_rank, current_price = self._best(ranks, prices)
+
+        # Mejor regla de cada opción sin las condiciones de cada tipo de parte, que es lo que
+        # queda cuando la opción candidata sustituye a la seleccionada de su tipo
+        excluded_rank = np.repeat(current_rank[:, None], self.part_type_count, axis=1)
+        excluded_price = np.repeat(current_price[:, None], self.part_type_count, axis=1)
+        for group in np.unique(groups[groups >= 0]):
+            keep = groups != group
+            excluded_rank[:, group], excluded_price[:, group] = self._best(ranks[:, keep], prices[:, keep])
+
+        rows = np.arange(len(self.option_ids))
+        candidate_part_type = self.row_part_type
+
+        # Precio propio de cada candidata: la mejor regla entre lo que queda de la selección
+        # y la propia candidata
+        own_rule_rank = self.ranks[rows, self.row_column]
+        remaining_rank = excluded_rank[rows, candidate_part_type]
+        own_price = np.where(
+            own_rule_rank < remaining_rank,
+            self.prices[rows, self.row_column],
+            excluded_price[rows, candidate_part_type]
+        )
+
+        delta = own_price
+        if selected_rows.size:
+            # Opciones seleccionadas (filas) frente a candidatas (columnas)
+            same_part_type = self.row_part_type[selected_rows][:, None] == candidate_part_type[None, :]
+            selected_current = current_price[selected_rows][:, None]
+
+            # Las seleccionadas del mismo tipo de parte dejan de sumarse
+            removed = np.where(same_part_type, selected_current, 0).sum(axis=0)
+
+            # Las demás se recalculan sin las condiciones sustituidas y con la candidata
+            rule_rank = self.ranks[selected_rows][:, self.row_column]
+            remaining_rank = excluded_rank[selected_rows][:, candidate_part_type]
+            new_price = np.where(
+                rule_rank < remaining_rank,
+                self.prices[selected_rows][:, self.row_column],
+                excluded_price[selected_rows][:, candidate_part_type]
+            )
+            changed = np.where(same_part_type, 0, new_price - selected_current).sum(axis=0)
+
+            delta = own_price - removed + changed
+            delta[selected_rows] = 0
+            own_price = own_price.copy()
+            own_price[selected_rows] = current_price[selected_rows]
+
+        return {
+            option_id: (_from_cents(own_price[row]), _from_cents(delta[row]))
+            for row, option_id in enumerate(self.option_ids)
+        }
+
+def _from_cents(cents) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+def get_price_matrix(index: ProductRuleIndex) -> PriceMatrix:
+    """
+    Obtiene la matriz de precios del índice, construyéndola la primera vez.
+    """
+    return index.derived("price_matrix", PriceMatrix)
@@ -0,0 +1,126 @@
+from sqlalchemy.orm import Session
+from app.models.product import PartOption, ConditionalPrice
+from app.services.rule_index import ProductRuleIndex
+from typing import Dict, Iterable, List, Optional, Tuple
+from decimal import Decimal
+
+class PricingEngine:
+    """
+    Tabla de precios de un conjunto de opciones: precio base por opción y precio condicional
+    por par (opción, opción condición). Permite calcular el precio de cualquier selección en
+    una sola pasada sin consultar la base de datos.
+
+    Cuando varias condiciones de una misma opción están seleccionadas gana la regla con el ID
+    de precio condicional más bajo, de modo que el resultado no depende del orden de la consulta.
+    """
+
+    def __init__(
+        self,
+        options: Iterable[Tuple[int, str, Decimal]],
+        conditional_prices: Iterable[Tuple[int, int, Decimal]],
+        condition_names: Dict[int, str] = None,
+    ):
+        self.base_prices: Dict[int, Decimal] = {}
+        self.names: Dict[int, str] = {}
+        for option_id, name, base_price in options:
+            # Una opción sin precio base (NULL) cuesta 0
+            self.base_prices[option_id] = base_price if base_price is not None else Decimal('0')
+            self.names[option_id] = name
+        if condition_names:
+            for option_id, name in condition_names.items():
+                self.names.setdefault(option_id, name)
+
+        # Los precios condicionales deben llegar ordenados por precedencia (ID ascendente);
+        # si un par (opción, condición) se repite, se conserva la primera regla
+        self.prices: Dict[Tuple[int, int], Decimal] = {}
+        self.conditions: Dict[int, List[int]] = {}
+        for option_id, condition_option_id, conditional_price in conditional_prices:
+            key = (option_id, condition_option_id)
+            if key in self.prices:
+                continue
+            self.prices[key] = conditional_price
+            self.conditions.setdefault(option_id, []).append(condition_option_id)
+
+    @classmethod
+    def from_index(cls, index: ProductRuleIndex) -> "PricingEngine":
+        """
+        Construye la tabla a partir del índice compilado de un producto.
+        """
+        return cls(
+            ((option.id, option.name, option.base_price) for option in index.options.values()),
+            (
+                (option_id, condition_option_id, conditional_price)
+                for option_id, conditions in index.conditional_prices.items()
+                for condition_option_id, conditional_price in conditions
+            ),
+            {
+                condition_option_id: index.option_name(condition_option_id)
+                for conditions in index.conditional_prices.values()
+                for condition_option_id, _ in conditions
+            },
+        )
+
+    def condition_for(self, option_id: int, selected) -> Tuple[Optional[int], Decimal]:
+        """
+        Devuelve la condición aplicable a una opción y su precio, o (None, precio base).
+        """
+        for condition_option_id in self.conditions.get(option_id, ()):
+            if condition_option_id in selected:
+                return condition_option_id, self.prices[(option_id, condition_option_id)]
+        return None, self.base_prices[option_id]
+
+    def price(self, selected_option_ids: Iterable[int]) -> Tuple[Decimal, Dict[int, dict]]:
+        """
+        Calcula el precio de las opciones seleccionadas y los precios condicionales aplicados.
+        Las opciones que no están en la tabla se ignoran.
+        """
+        selected = set(selected_option_ids)
+        total = Decimal('0')
+        applied_conditional_prices = {}
+
+        for option_id in sorted(selected):
+            if option_id not in self.base_prices:
+                continue
+            condition_option_id, price = self.condition_for(option_id, selected)
+            total += price
+            if condition_option_id is not None:
+                applied_conditional_prices[option_id] = {
+                    "option_id": option_id,
+                    "option_name": self.names[option_id],
+                    "base_price": float(self.base_prices[option_id]),
+                    "conditional_price": float(price),
+                    "condition_option_id": condition_option_id,
+                    "condition_option_name": self.names.get(condition_option_id, f"Opción {condition_option_id}")
+                }
+
+        return total, applied_conditional_prices
+
+def to_cents(price: Optional[Decimal]) -> int:
+    """
+    Convierte un precio a céntimos enteros. Un precio sin definir (NULL) cuenta como 0.
+    """
+    if price is None:
+        return 0
+    return int((price * 100).to_integral_value())
+
+def get_pricing_engine(index: ProductRuleIndex) -> PricingEngine:
+    """
+    Obtiene la tabla de precios del índice, construyéndola la primera vez.
+    """
+    return index.derived("pricing", PricingEngine.from_index)
+
+def load_pricing_engine(db: Session, option_ids: List[int]) -> PricingEngine:
+    """
+    Carga la tabla de precios de un conjunto arbitrario de opciones con un número fijo de
+    consultas. Se usa cuando la selección no pertenece a un único producto compilado.
+    """
+    options = db.query(PartOption.id, PartOption.name, PartOption.base_price).filter(
+        PartOption.id.in_(option_ids)
+    ).all()
+    conditional_prices = db.query(
+        ConditionalPrice.option_id, ConditionalPrice.condition_option_id, ConditionalPrice.conditional_price
+    ).filter(
+        ConditionalPrice.option_id.in_(option_ids),
+        ConditionalPrice.condition_option_id.in_(option_ids)
+    ).order_by(ConditionalPrice.id).all()
+    return PricingEngine(options, conditional_prices)
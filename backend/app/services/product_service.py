@@ -1,28 +1,54 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from app.models.product import Product, PartType, PartOption, OptionDependency, ConditionalPrice, DependencyType
 from app.models.cart import CartItemOption
-from app.schemas.product import ProductCreate, PartTypeCreate, PartOptionCreate, OptionDependencyCreate, ConditionalPriceCreate
-from typing import List, Optional
+from app.schemas.product import ProductCreate, PartTypeCreate, PartOptionCreate, OptionDependencyCreate, ConditionalPriceCreate, ProductDetail
+from app.services import rule_index, compatibility_engine, configuration_solver, pricing_engine, price_matrix, what_if, catalog_version, result_cache
+from typing import Dict, List, Optional, Tuple
 from decimal import Decimal
 from fastapi import HTTPException
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
 
 def get_product(db: Session, product_id: int):
     """
-    Obtiene un producto por su ID, incluyendo todos sus tipos de partes, opciones y dependencias.
-    Convierte los valores enum a strings para evitar errores de serialización.
+    Obtiene un producto por su ID, incluyendo todos sus tipos de partes, opciones,
+    dependencias y precios condicionales. Las relaciones se cargan con selectinload,
+    por lo que se ejecuta un número fijo de consultas independiente del tamaño del catálogo.
     """
-    product = db.query(Product).filter(Product.id == product_id).first()
-    
-    if product:
-        # Asegurar que los tipos de dependencia sean strings
-        for part_type in product.part_types:
-            for option in part_type.options:
-                for dependency in option.dependencies:
-                    # Convertir enum a string para la serialización
-                    if hasattr(dependency.type, 'value'):
-                        dependency.type = dependency.type.value
-    
-    return product
+    options_loader = selectinload(Product.part_types).selectinload(PartType.options)
+    return db.query(Product).options(
+        options_loader.selectinload(PartOption.dependencies),
+        options_loader.selectinload(PartOption.conditional_prices)
+    ).filter(Product.id == product_id).first()
+
+def product_exists(db: Session, product_id: int) -> bool:
+    """
+    Comprueba si existe un producto sin cargar sus relaciones.
+    """
+    return db.query(Product.id).filter(Product.id == product_id).first() is not None
+
+def get_product_detail_json(db: Session, product_id: int) -> Optional[bytes]:
+    """
+    Devuelve el detalle del producto ya serializado como JSON según el esquema ProductDetail.
+    El resultado se guarda en caché por versión del catálogo, de modo que las lecturas
+    repetidas no consultan la base de datos ni vuelven a serializar.
+    Devuelve None si el producto no existe.
+    """
+    version = catalog_version.get_catalog_version(db, product_id)
+    if version is None:
+        return None
+    content = result_cache.product_detail_cache.get((product_id, version))
+    if content is None:
+        product = get_product(db, product_id)
+        if product is None:
+            return None
+        # Se guarda con la versión leída junto con el producto, salvo que sea anterior a la
+        # conocida (una réplica atrasada)
+        content = ProductDetail.model_validate(product, from_attributes=True).model_dump_json().encode()
+        if catalog_version.record_catalog_version(product_id, product.catalog_version) == product.catalog_version:
+            result_cache.product_detail_cache.put((product_id, product.catalog_version), content)
+    return content
 
 def get_products(db: Session, skip: int = 0, limit: int = 100):
     return db.query(Product).offset(skip).limit(limit).all()
@@ -51,6 +77,7 @@ def create_part_type(db: Session, part_type: PartTypeCreate, product_id: int):
     db.add(db_part_type)
     db.commit()
     db.refresh(db_part_type)
+    catalog_version.bump_catalog_version(db, product_id)
     return db_part_type
 
 def create_part_option(db: Session, part_option: PartOptionCreate, part_type_id: int):
@@ -58,6 +85,7 @@ def create_part_option(db: Session, part_option: PartOptionCreate, part_type_id:
     db.add(db_part_option)
     db.commit()
     db.refresh(db_part_option)
+    bump_catalog_version_for_part_type(db, part_type_id)
     return db_part_option
 
 def create_option_dependency(db: Session, dependency: OptionDependencyCreate, option_id: int):
@@ -65,6 +93,7 @@ def create_option_dependency(db: Session, dependency: OptionDependencyCreate, op
     db.add(db_dependency)
     db.commit()
     db.refresh(db_dependency)
+    bump_catalog_version_for_option(db, option_id)
     return db_dependency
 
 def create_conditional_price(db: Session, conditional_price: ConditionalPriceCreate, option_id: int):
@@ -72,415 +101,180 @@ def create_conditional_price(db: Session, conditional_price: ConditionalPriceCre
     db.add(db_conditional_price)
     db.commit()
     db.refresh(db_conditional_price)
+    bump_catalog_version_for_option(db, option_id)
     return db_conditional_price
 
+def update_option_stock(db: Session, option_id: int, in_stock: bool) -> Optional[PartOption]:
+    """
+    Actualiza el estado de stock de una opción.
+    Devuelve None si la opción no existe.
+    """
+    option = db.query(PartOption).filter(PartOption.id == option_id).first()
+    if not option:
+        return None
+    
+    option.in_stock = in_stock
+    db.commit()
+    db.refresh(option)
+    bump_catalog_version_for_option(db, option_id)
+    return option
+
+def delete_option_dependency(db: Session, dependency_id: int) -> bool:
+    """
+    Elimina una dependencia entre opciones.
+    Devuelve False si la dependencia no existe.
+    """
+    dependency = db.query(OptionDependency).filter(OptionDependency.id == dependency_id).first()
+    if not dependency:
+        return False
+    
+    option_id = dependency.option_id
+    db.delete(dependency)
+    db.commit()
+    bump_catalog_version_for_option(db, option_id)
+    return True
+
+def bump_catalog_version_for_part_type(db: Session, part_type_id: int) -> None:
+    """
+    Incrementa la versión del catálogo del producto al que pertenece un tipo de parte.
+    """
+    product_id = db.query(PartType.product_id).filter(PartType.id == part_type_id).scalar()
+    if product_id is not None:
+        catalog_version.bump_catalog_version(db, product_id)
+
+def bump_catalog_version_for_option(db: Session, option_id: int) -> None:
+    """
+    Incrementa la versión del catálogo del producto al que pertenece una opción.
+    """
+    product_id = db.query(PartType.product_id).join(
+        PartOption, PartOption.part_type_id == PartType.id
+    ).filter(PartOption.id == option_id).scalar()
+    if product_id is not None:
+        catalog_version.bump_catalog_version(db, product_id)
+
 def calculate_price(db: Session, selected_option_ids: List[int]) -> Decimal:
     """
     Calcula el precio total de las opciones seleccionadas, teniendo en cuenta precios condicionales.
     No incluye el precio base del producto, solo el precio adicional de las opciones.
     """
+    total, _ = price_options(db, selected_option_ids)
+    return total
+
+def price_options(db: Session, selected_option_ids: List[int]) -> Tuple[Decimal, dict]:
+    """
+    Calcula el precio de las opciones seleccionadas y los precios condicionales aplicados.
+    Cuando todas las opciones pertenecen a un mismo producto, el precio se calcula sobre la
+    tabla de precios de su índice compilado y se guarda en la caché de resultados. En otro
+    caso se carga la tabla de las opciones seleccionadas con un número fijo de consultas.
+    """
     # Si no hay opciones seleccionadas, retornar cero
     if not selected_option_ids:
-        print("No hay opciones seleccionadas para calcular precio")
-        return Decimal('0')
-    
-    total = Decimal('0')
-    
-    try:
-        # Obtener las opciones seleccionadas
-        selected_options = db.query(PartOption).filter(PartOption.id.in_(selected_option_ids)).all()
-        
-        if not selected_options:
-            print("No se encontraron opciones para los IDs proporcionados")
-            return Decimal('0')
-            
-        # Calcular precio total de las opciones
-        for option in selected_options:
-            # Buscar si hay un precio condicional aplicable
-            conditional_price = db.query(ConditionalPrice).filter(
-                ConditionalPrice.option_id == option.id,
-                ConditionalPrice.condition_option_id.in_(selected_option_ids)
-            ).first()
-            
-            # Si hay un precio condicional, usar ese, de lo contrario usar el precio base
-            if conditional_price:
-                total += conditional_price.conditional_price
-                print(f"Usando precio condicional para opción {option.name}: {conditional_price.conditional_price}")
-            else:
-                total += option.base_price
-                print(f"Usando precio base para opción {option.name}: {option.base_price}")
-        
-        print(f"Precio total calculado: {total}")
-        return total
-    except Exception as e:
-        print(f"Error al calcular precio: {e}")
-        return Decimal('0')
+        return Decimal('0'), {}
+    
+    product_id = get_product_id_from_options(db, selected_option_ids[:1])
+    index = rule_index.get_rule_index(db, product_id) if product_id else None
+    if index is not None and all(option_id in index.options for option_id in selected_option_ids):
+        key = (index.product_id, frozenset(selected_option_ids), index.version)
+        priced = result_cache.price_cache.get(key)
+        if priced is None:
+            priced = price_selection(index, selected_option_ids)
+            result_cache.price_cache.put(key, priced)
+        return priced
+    
+    # Un error al valorar se propaga: nunca se devuelve un precio de 0 por un fallo
+    return pricing_engine.load_pricing_engine(db, selected_option_ids).price(selected_option_ids)
 
 def validate_compatibility(db: Session, product_id=None, selected_option_ids: List[int] = None) -> dict:
     """
     Verifica la compatibilidad de las opciones para un producto.
+    La evaluación se delega en el motor de máscaras de bits compilado a partir del índice
+    de reglas del producto, por lo que no realiza consultas cuando el índice está en caché.
     """
     if selected_option_ids is None:
         selected_option_ids = []
     
-    print(f"Validando compatibilidad para opciones: {selected_option_ids}")
-    
-    # Obtener el producto y sus tipos de componentes
+    # Obtener el producto a partir de la primera opción seleccionada si no se indica
     if product_id is None and selected_option_ids:
-        # Intentar obtener el product_id de la primera opción seleccionada
-        first_option = db.query(PartOption).filter(PartOption.id == selected_option_ids[0]).first()
-        if first_option:
-            part_type = db.query(PartType).filter(PartType.id == first_option.part_type_id).first()
-            if part_type:
-                product_id = part_type.product_id
+        product_id = get_product_id_from_options(db, selected_option_ids[:1])
     
     if not product_id:
         raise HTTPException(status_code=400, detail="No se pudo determinar el producto")
     
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
+    index = rule_index.get_rule_index(db, product_id)
+    if index is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    result = {
-        "product": {
-            "id": product.id,
-            "name": product.name,
-            "components": []
-        }
-    }
+    return validate_selection(index, selected_option_ids)
+
+def validate_selection(index: rule_index.ProductRuleIndex, selected_option_ids: List[int]) -> dict:
+    """
+    Valida una selección sobre el índice compilado del producto, sin acceder a la base de datos.
+    """
+    # El resultado se guarda en caché por producto, conjunto de opciones y versión del catálogo.
+    # Se evalúa siempre en orden de ID para que el resultado no dependa del orden de la selección.
+    # El diccionario devuelto es compartido y no debe modificarse.
+    key = (index.product_id, frozenset(selected_option_ids), index.version)
+    result = result_cache.validation_cache.get(key)
+    if result is None:
+        result = compatibility_engine.get_engine(index).validate(sorted(set(selected_option_ids)))
+        result_cache.validation_cache.put(key, result)
+    
+    logger.debug(
+        "compatibility.validated",
+        product_id=index.product_id,
+        selected_options=len(selected_option_ids),
+        auto_selected_options=len(result["auto_selected_options"])
+    )
+    return result
+
+def validate_selections(db: Session, selections: List[Tuple[int, List[int]]]) -> List[dict]:
+    """
+    Valida en lote varias selecciones de uno o más productos.
+    El índice de reglas de cada producto se obtiene una sola vez por lote, de modo que todas
+    las selecciones de un mismo producto se evalúan contra la misma versión del catálogo.
+    Para cada selección devuelve si es válida, las opciones auto-añadidas, el primer conflicto
+    y el precio de las opciones (incluidas las auto-añadidas) cuando es válida.
+    """
+    indexes = {product_id: rule_index.get_rule_index(db, product_id) for product_id in dict.fromkeys(
+        product_id for product_id, _ in selections
+    )}
+    return evaluate_selections(indexes, selections)
+
+def evaluate_selections(
+    indexes: Dict[int, Optional[rule_index.ProductRuleIndex]],
+    selections: List[Tuple[int, List[int]]]
+) -> List[dict]:
+    """
+    Evalúa en lote las selecciones sobre los índices ya cargados de sus productos (None si
+    el producto no existe), sin acceder a la base de datos.
+    """
+    verdicts = []
     
-    # Si no hay selecciones, todas las opciones son compatibles
-    if not selected_option_ids:
-        part_types = db.query(PartType).filter(PartType.product_id == product_id).all()
-        for part_type in part_types:
-            component_data = {
-                "id": part_type.id,
-                "name": part_type.name,
-                "options": []
-            }
-            
-            options = db.query(PartOption).filter(PartOption.part_type_id == part_type.id).all()
-            for option in options:
-                option_data = {
-                    "id": option.id,
-                    "name": option.name,
-                    "base_price": option.base_price,
-                    "in_stock": option.in_stock,
-                    "selected": False,
-                    "is_compatible": option.in_stock  # Solo incompatible si no hay stock
-                }
-                
-                # Añadir motivo de disponibilidad
-                if not option.in_stock:
-                    option_data["availability_reason"] = "out_of_stock"
-                
-                component_data["options"].append(option_data)
-            
-            result["product"]["components"].append(component_data)
+    for product_id, selected_option_ids in selections:
+        index = indexes[product_id]
         
-        return result
-    
-    # Obtener todas las dependencias relevantes
-    all_dependencies = []
-    for option_id in selected_option_ids:
-        # Obtener dependencias directas (donde la opción es el origen)
-        direct_deps = db.query(OptionDependency).filter(
-            OptionDependency.option_id == option_id
-        ).all()
-        all_dependencies.extend(direct_deps)
-        
-        # Obtener dependencias inversas (donde la opción es el destino)
-        inverse_deps = db.query(OptionDependency).filter(
-            OptionDependency.depends_on_option_id == option_id
-        ).all()
-        all_dependencies.extend(inverse_deps)
-    
-    # Verificar si hay incompatibilidades en las selecciones actuales
-    has_incompatibilities = False
-    incompatible_options = set()  # Conjunto para almacenar IDs de opciones incompatibles
-    incompatible_reasons = {}  # Diccionario para almacenar motivos de incompatibilidad
-    
-    for option_id in selected_option_ids:
-        option = db.query(PartOption).filter(PartOption.id == option_id).first()
-        if not option:
-            continue
-            
-        # Verificar dependencias requires
-        requires_deps = db.query(OptionDependency).filter(
-            OptionDependency.option_id == option_id,
-            OptionDependency.type == DependencyType.requires
-        ).all()
-        
-        for dep in requires_deps:
-            if dep.depends_on_option_id not in selected_option_ids:
-                has_incompatibilities = True
-                incompatible_options.add(option_id)  # La opción que requiere algo no satisfecho es incompatible
-                required = db.query(PartOption).filter(PartOption.id == dep.depends_on_option_id).first()
-                
-                # Guardar el motivo de incompatibilidad
-                incompatible_reasons[option_id] = {
-                    "reason": "requires",
-                    "dependency_id": dep.depends_on_option_id,
-                    "dependency_name": required.name if required else f"Opción {dep.depends_on_option_id}"
-                }
-                
-                print(f"Incompatibilidad: {option.name} requiere {required.name if required else dep.depends_on_option_id}")
-                break
-        
-        # Verificar dependencias excludes
-        excludes_deps = db.query(OptionDependency).filter(
-            OptionDependency.option_id == option_id,
-            OptionDependency.type == DependencyType.excludes
-        ).all()
-        
-        for dep in excludes_deps:
-            if dep.depends_on_option_id in selected_option_ids:
-                has_incompatibilities = True
-                incompatible_options.add(option_id)  # La opción que excluye es incompatible
-                incompatible_options.add(dep.depends_on_option_id)  # La opción excluida es incompatible
-                excluded = db.query(PartOption).filter(PartOption.id == dep.depends_on_option_id).first()
-                
-                # Guardar motivos para ambas opciones
-                incompatible_reasons[option_id] = {
-                    "reason": "excludes",
-                    "dependency_id": dep.depends_on_option_id,
-                    "dependency_name": excluded.name if excluded else f"Opción {dep.depends_on_option_id}"
-                }
-                
-                incompatible_reasons[dep.depends_on_option_id] = {
-                    "reason": "excluded_by",
-                    "dependency_id": option_id,
-                    "dependency_name": option.name
-                }
-                
-                print(f"Incompatibilidad: {option.name} excluye {excluded.name if excluded else dep.depends_on_option_id}")
-                break
-    
-    # Identificar opciones requeridas
-    required_options = set()
-    required_by = {}  # Diccionario para almacenar qué opción requiere a cuál
-    
-    for dep in all_dependencies:
-        if dep.type == DependencyType.requires and dep.option_id in selected_option_ids:
-            required_options.add(dep.depends_on_option_id)
-            required = db.query(PartOption).filter(PartOption.id == dep.depends_on_option_id).first()
-            requiring = db.query(PartOption).filter(PartOption.id == dep.option_id).first()
-            
-            # Guardar información sobre quién requiere esta opción
-            if dep.depends_on_option_id not in required_by:
-                required_by[dep.depends_on_option_id] = []
-            required_by[dep.depends_on_option_id].append({
-                "option_id": dep.option_id,
-                "option_name": requiring.name if requiring else f"Opción {dep.option_id}"
-            })
-            
-            print(f"Opción {required.name if required else dep.depends_on_option_id} es requerida por una opción seleccionada")
-    
-    # Solo auto-seleccionar si no hay incompatibilidades
-    final_selected_ids = selected_option_ids.copy()
-    if not has_incompatibilities:
-        final_selected_ids = list(set(selected_option_ids) | required_options)
-        print("No hay incompatibilidades, auto-seleccionando opciones requeridas")
-    else:
-        print("Hay incompatibilidades, no se auto-seleccionarán las opciones requeridas")
-    
-    # Procesar cada tipo de componente
-    part_types = db.query(PartType).filter(PartType.product_id == product_id).all()
-    for part_type in part_types:
-        component_data = {
-            "id": part_type.id,
-            "name": part_type.name,
-            "options": []
+        verdict = {
+            "product_id": product_id,
+            "selected_options": selected_option_ids,
+            "valid": False,
+            "auto_added": [],
+            "first_conflict": None,
+            "price": None
         }
+        if index is None:
+            verdict["first_conflict"] = {"reason": "product_not_found"}
+            verdicts.append(verdict)
+            continue
         
-        # Obtener todas las opciones para este tipo de componente
-        options = db.query(PartOption).filter(PartOption.part_type_id == part_type.id).all()
-        
-        # Determinar si ya hay algo seleccionado para este tipo de componente
-        part_type_selected_option_ids = [opt_id for opt_id in selected_option_ids if db.query(PartOption).filter(PartOption.id == opt_id, PartOption.part_type_id == part_type.id).first()]
-        has_selection_for_part_type = len(part_type_selected_option_ids) > 0
-        
-        for option in options:
-            option_data = {
-                "id": option.id,
-                "name": option.name,
-                "base_price": option.base_price,
-                "in_stock": option.in_stock,
-                "selected": option.id in final_selected_ids,
-                "is_compatible": True
-            }
-            
-            # Las opciones seleccionadas siempre son compatibles
-            if option.id in selected_option_ids:
-                # Si la opción fue seleccionada por el usuario pero tiene incompatibilidades,
-                # indicamos que es compatible pero requiere otras opciones
-                if option.id in incompatible_options:
-                    option_data["requires_additional_selection"] = True
-                    if option.id in incompatible_reasons:
-                        option_data["compatibility_details"] = incompatible_reasons[option.id]
-                component_data["options"].append(option_data)
-                continue
-            
-            # Si no hay stock, marcar como no compatible
-            if not option.in_stock:
-                option_data["is_compatible"] = False
-                option_data["availability_reason"] = "out_of_stock"
-                print(f"Opción {option.name} no compatible por falta de stock")
-                component_data["options"].append(option_data)
-                continue
-            
-            # Si ya hay una opción seleccionada para este componente y esta no está seleccionada,
-            # marcarla como no disponible para selección pero aún es compatible
-            if has_selection_for_part_type and option.id not in final_selected_ids:
-                option_data["is_compatible"] = True
-                option_data["available_for_selection"] = False
-                option_data["availability_reason"] = "another_option_selected"
-                component_data["options"].append(option_data)
-                continue
-            
-            # Si la opción está en las incompatibilidades, marcarla como incompatible
-            if option.id in incompatible_options:
-                option_data["is_compatible"] = False
-                
-                # Añadir motivo de incompatibilidad
-                if option.id in incompatible_reasons:
-                    option_data["availability_reason"] = incompatible_reasons[option.id]["reason"]
-                    option_data["compatibility_details"] = incompatible_reasons[option.id]
-                
-                print(f"Opción {option.name} marcada como incompatible por conflictos")
-                component_data["options"].append(option_data)
-                continue
-            
-            # Si hay incompatibilidades y esta opción es requerida, es compatible pero no auto-seleccionada
-            if has_incompatibilities and option.id in required_options:
-                # Añadir información sobre quién requiere esta opción
-                if option.id in required_by:
-                    option_data["required_by"] = required_by[option.id]
-                
-                component_data["options"].append(option_data)
-                continue
-            
-            # Verificar si esta opción es compatible con las selecciones actuales
-            is_compatible = True
-            compatibility_reason = None
-            
-            # 1. Verificar si alguna opción seleccionada requiere específicamente otra opción de este tipo
-            for dep in all_dependencies:
-                if dep.type == DependencyType.requires:
-                    required_option = db.query(PartOption).filter(PartOption.id == dep.depends_on_option_id).first()
-                    if required_option and required_option.part_type_id == part_type.id:
-                        # Si se requiere una opción específica y esta no es esa opción, es incompatible
-                        if option.id != required_option.id:
-                            is_compatible = False
-                            requiring_option = db.query(PartOption).filter(PartOption.id == dep.option_id).first()
-                            
-                            compatibility_reason = {
-                                "reason": "requires_other",
-                                "requiring_id": dep.option_id,
-                                "requiring_name": requiring_option.name if requiring_option else f"Opción {dep.option_id}",
-                                "required_id": required_option.id,
-                                "required_name": required_option.name
-                            }
-                            
-                            print(f"Opción {option.name} incompatible porque se requiere específicamente {required_option.name}")
-                            break
-            
-            # 2. Verificar dependencias propias de la opción
-            if is_compatible:
-                option_deps = db.query(OptionDependency).filter(
-                    OptionDependency.option_id == option.id
-                ).all()
-                
-                for dep in option_deps:
-                    if dep.type == DependencyType.requires:
-                        # Si esta opción requiere algo que no está seleccionado
-                        if dep.depends_on_option_id not in final_selected_ids:
-                            is_compatible = False
-                            required = db.query(PartOption).filter(PartOption.id == dep.depends_on_option_id).first()
-                            
-                            compatibility_reason = {
-                                "reason": "requires",
-                                "dependency_id": dep.depends_on_option_id,
-                                "dependency_name": required.name if required else f"Opción {dep.depends_on_option_id}"
-                            }
-                            
-                            print(f"Opción {option.name} incompatible porque requiere {required.name if required else dep.depends_on_option_id}")
-                            break
-                    elif dep.type == DependencyType.excludes:
-                        # Si esta opción excluye algo que está seleccionado
-                        if dep.depends_on_option_id in final_selected_ids:
-                            is_compatible = False
-                            excluded = db.query(PartOption).filter(PartOption.id == dep.depends_on_option_id).first()
-                            
-                            compatibility_reason = {
-                                "reason": "excludes",
-                                "dependency_id": dep.depends_on_option_id,
-                                "dependency_name": excluded.name if excluded else f"Opción {dep.depends_on_option_id}"
-                            }
-                            
-                            print(f"Opción {option.name} incompatible porque excluye {excluded.name if excluded else dep.depends_on_option_id}")
-                            break
-            
-            # 3. Si hay incompatibilidades en las selecciones actuales, verificar si esta opción es parte del conflicto
-            if has_incompatibilities:
-                # Verificar si esta opción es excluida por alguna opción seleccionada
-                excluding_deps = db.query(OptionDependency).filter(
-                    OptionDependency.option_id.in_(selected_option_ids),
-                    OptionDependency.type == DependencyType.excludes,
-                    OptionDependency.depends_on_option_id == option.id
-                ).all()
-                
-                if excluding_deps:
-                    is_compatible = False
-                    excluder = db.query(PartOption).filter(PartOption.id == excluding_deps[0].option_id).first()
-                    
-                    compatibility_reason = {
-                        "reason": "excluded_by",
-                        "dependency_id": excluding_deps[0].option_id,
-                        "dependency_name": excluder.name if excluder else f"Opción {excluding_deps[0].option_id}"
-                    }
-                    
-                    print(f"Opción {option.name} incompatible porque es excluida por {excluder.name if excluder else excluding_deps[0].option_id}")
-                
-                # Verificar si esta opción es requerida por una opción que tiene conflictos
-                requiring_deps = db.query(OptionDependency).filter(
-                    OptionDependency.depends_on_option_id == option.id,
-                    OptionDependency.type == DependencyType.requires
-                ).all()
-                
-                for dep in requiring_deps:
-                    if dep.option_id in selected_option_ids and not all(
-                        req.depends_on_option_id in selected_option_ids
-                        for req in db.query(OptionDependency).filter(
-                            OptionDependency.option_id == dep.option_id,
-                            OptionDependency.type == DependencyType.requires
-                        ).all()
-                    ):
-                        is_compatible = False
-                        requiring = db.query(PartOption).filter(PartOption.id == dep.option_id).first()
-                        
-                        compatibility_reason = {
-                            "reason": "required_by_incompatible",
-                            "dependency_id": dep.option_id,
-                            "dependency_name": requiring.name if requiring else f"Opción {dep.option_id}"
-                        }
-                        
-                        print(f"Opción {option.name} incompatible porque es requerida por {requiring.name if requiring else dep.option_id} que tiene conflictos")
-                        break
-            
-            option_data["is_compatible"] = is_compatible
-            
-            # Añadir motivo de incompatibilidad
-            if not is_compatible and compatibility_reason:
-                option_data["availability_reason"] = compatibility_reason["reason"]
-                option_data["compatibility_details"] = compatibility_reason
-                
-            component_data["options"].append(option_data)
-        
-        result["product"]["components"].append(component_data)
-    
-    print("Resultado de validación:", result)
-    return result
+        auto_added, first_conflict = compatibility_engine.get_engine(index).check(sorted(set(selected_option_ids)))
+        verdict["first_conflict"] = first_conflict
+        if first_conflict is None:
+            verdict["valid"] = True
+            verdict["auto_added"] = auto_added
+            verdict["price"], _ = price_selection(index, list(selected_option_ids) + auto_added)
+        verdicts.append(verdict)
+    
+    return verdicts
 
 def get_available_options(db: Session, product_id: int, current_selection: List[int] = None):
     """
@@ -489,71 +283,108 @@ def get_available_options(db: Session, product_id: int, current_selection: List[
     """
     if current_selection is None:
         current_selection = []
-        
-    # Obtener todas las opciones para el producto
-    part_types = db.query(PartType).filter(PartType.product_id == product_id).all()
-    
-    result = []
-    for part_type in part_types:
-        part_type_data = {
-            "id": part_type.id,
-            "name": part_type.name,
-            "options": []
-        }
-        
-        for option in part_type.options:
-            # Comprobar si la opción está en stock
-            if not option.in_stock:
-                continue
-                
-            # Verificar compatibilidad de esta opción con la selección actual
-            is_compatible = True
-            
-            # Si la opción ya está seleccionada, es compatible
-            if option.id in current_selection:
-                is_compatible = True
-            else:
-                # Comprobar con una selección temporal que incluya esta opción
-                temp_selection = current_selection + [option.id]
-                # Verificamos si esta opción tiene dependencias incompatibles
-                is_compatible = True
-                
-                # Comprobar dependencias de esta opción
-                dependencies = db.query(OptionDependency).filter(
-                    OptionDependency.option_id == option.id
-                ).all()
-                
-                for dependency in dependencies:
-                    if dependency.type == DependencyType.requires:
-                        if dependency.depends_on_option_id not in temp_selection:
-                            is_compatible = False
-                            break
-                    elif dependency.type == DependencyType.excludes:
-                        if dependency.depends_on_option_id in temp_selection:
-                            is_compatible = False
-                            break
-                
-                # Verificar si alguna de las opciones seleccionadas excluye esta opción
-                if is_compatible and current_selection:
-                    excluding_dependencies = db.query(OptionDependency).filter(
-                        OptionDependency.option_id.in_(current_selection),
-                        OptionDependency.type == DependencyType.excludes,
-                        OptionDependency.depends_on_option_id == option.id
-                    ).all()
-                    
-                    if excluding_dependencies:
-                        is_compatible = False
-            
-            part_type_data["options"].append({
-                "id": option.id,
-                "name": option.name,
-                "base_price": option.base_price,
-                "is_compatible": is_compatible
-            })
-            
-        result.append(part_type_data)
-        
-    return result
+    
+    index = rule_index.get_rule_index(db, product_id)
+    if index is None:
+        return []
+    
+    return options_with_consequences(index, current_selection)
+
+def options_with_consequences(index: rule_index.ProductRuleIndex, current_selection: List[int]) -> List[dict]:
+    """
+    Opciones disponibles de cada tipo de parte con su precio dada la selección actual
+    (marginal_price) y la variación del precio total al elegirlas (price_delta). Las opciones
+    no seleccionadas incluyen además las consecuencias de elegirlas: si la selección seguiría
+    siendo válida, qué opciones se auto-seleccionarían y cuáles habría que quitar.
+    """
+    options = compatibility_engine.get_engine(index).available_options(current_selection)
+    marginal_prices = price_matrix.get_price_matrix(index).marginal_prices(current_selection)
+    consequences = what_if.get_what_if_evaluator(index).evaluate(current_selection)
+    for part_type in options:
+        for option in part_type["options"]:
+            option["marginal_price"], option["price_delta"] = marginal_prices[option["id"]]
+            option.update(consequences.get(option["id"], {}))
+    return options
+
+def price_selection(index: rule_index.ProductRuleIndex, selected_option_ids: List[int]):
+    """
+    Calcula el precio de las opciones seleccionadas a partir del índice compilado del producto.
+    Devuelve el precio total de las opciones y los precios condicionales aplicados por opción.
+    """
+    return pricing_engine.get_pricing_engine(index).price(selected_option_ids)
+
+def configure_product(db: Session, product_id: int, selected_option_ids: List[int] = None) -> dict:
+    """
+    Devuelve en una sola pasada las opciones disponibles, el estado de compatibilidad,
+    el precio de las opciones y los precios condicionales aplicados para una selección.
+    Todo se calcula sobre el mismo índice compilado del producto. El precio incluye las
+    opciones auto-seleccionadas para completar las dependencias requires.
+    """
+    if selected_option_ids is None:
+        selected_option_ids = []
+    
+    index = rule_index.get_rule_index(db, product_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    
+    return configure_selection(index, selected_option_ids)
+
+def configure_selection(index: rule_index.ProductRuleIndex, selected_option_ids: List[int]) -> dict:
+    """
+    Calcula configure_product sobre el índice compilado del producto, sin acceder a la base de datos.
+    """
+    # Misma validación que validate_compatibility, normalizada y con su caché de resultados
+    compatibility = validate_selection(index, selected_option_ids)
+    total_price, applied_conditional_prices = price_selection(
+        index, list(selected_option_ids) + compatibility["auto_selected_options"]
+    )
+    
+    return {
+        "product_id": index.product_id,
+        "options": options_with_consequences(index, selected_option_ids),
+        "compatibility": compatibility,
+        "total_price": total_price,
+        "conditional_prices": applied_conditional_prices
+    }
+
+def complete_configuration(db: Session, product_id: int, selected_option_ids: List[int] = None) -> dict:
+    """
+    Completa una selección parcial con la configuración válida más barata que la contiene.
+    El precio total incluye el precio base del producto y los precios condicionales.
+    """
+    if selected_option_ids is None:
+        selected_option_ids = []
+    
+    index = rule_index.get_rule_index(db, product_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    
+    return complete_selection(index, selected_option_ids)
+
+def complete_selection(index: rule_index.ProductRuleIndex, selected_option_ids: List[int]) -> dict:
+    """
+    Calcula complete_configuration sobre el índice compilado del producto, sin acceder a la base de datos.
+    """
+    options = configuration_solver.get_solver(index).cheapest_completion(selected_option_ids)
+    if options is None:
+        raise HTTPException(
+            status_code=400,
+            detail="No existe ninguna configuración válida que incluya las opciones seleccionadas"
+        )
+    
+    options_price, applied_conditional_prices = price_selection(index, options)
+    base_price = index.base_price or Decimal('0')
+    selected = set(selected_option_ids)
+    
+    return {
+        "product_id": index.product_id,
+        "options": options,
+        "added_options": [option_id for option_id in options if option_id not in selected],
+        "base_price": base_price,
+        "options_price": options_price,
+        "total_price": base_price + options_price,
+        "conditional_prices": applied_conditional_prices
+    }
 
 def update_product(db: Session, product_id: int, product: ProductCreate):
     """
@@ -570,6 +401,7 @@ def update_product(db: Session, product_id: int, product: ProductCreate):
     
     db.commit()
     db.refresh(db_product)
+    catalog_version.bump_catalog_version(db, product_id)
     return db_product
 
 def delete_part_type(db: Session, part_type_id: int):
@@ -603,8 +435,10 @@ def delete_part_type(db: Session, part_type_id: int):
             ).delete(synchronize_session=False)
         
         # Ahora podemos eliminar el tipo de parte de forma segura
+        product_id = part_type.product_id
         db.delete(part_type)
         db.commit()
+        catalog_version.bump_catalog_version(db, product_id)
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -652,6 +486,7 @@ def delete_part_option(db: Session, part_type_id: int, option_id: int):
         # Finalmente eliminar la opción
         db.delete(option)
         db.commit()
+        catalog_version.bump_catalog_version(db, part_type.product_id)
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -667,43 +502,27 @@ def delete_product(db: Session, product_id: int) -> None:
     if product:
         db.delete(product)
         db.commit()
+        catalog_version.bump_catalog_version(db, product_id)
     return None
 
 def get_product_dependencies(db: Session, product_id: int) -> List[OptionDependency]:
     """
     Obtiene todas las dependencias de las opciones de un producto.
+    Los objetos se devuelven sin modificar: la conversión del tipo de dependencia a string
+    la hace el esquema OptionDependency al serializar.
     """
-    print(f"Buscando dependencias para el producto {product_id}")
-    
-    # Obtener todas las opciones del producto
-    part_types = db.query(PartType).filter(PartType.product_id == product_id).all()
-    print(f"Tipos de parte encontrados: {len(part_types)}")
-    print("Tipos de parte:", [{"id": pt.id, "name": pt.name} for pt in part_types])
-    
-    option_ids = []
-    for part_type in part_types:
-        options = db.query(PartOption).filter(PartOption.part_type_id == part_type.id).all()
-        print(f"Opciones encontradas para tipo de parte {part_type.name}:", [{"id": opt.id, "name": opt.name} for opt in options])
-        option_ids.extend([option.id for option in options])
-    
-    print(f"IDs de opciones encontradas: {option_ids}")
-    
-    # Obtener todas las dependencias donde la opción principal está en las opciones del producto
-    dependencies = db.query(OptionDependency).filter(
-        OptionDependency.option_id.in_(option_ids)
-    ).all()
-    
-    print(f"Dependencias encontradas: {len(dependencies)}")
-    for dep in dependencies:
-        option = db.query(PartOption).filter(PartOption.id == dep.option_id).first()
-        depends_on = db.query(PartOption).filter(PartOption.id == dep.depends_on_option_id).first()
-        print(f"Dependencia: {option.name if option else 'Opción no encontrada'} ({dep.option_id}) {dep.type.value} {depends_on.name if depends_on else 'Opción no encontrada'} ({dep.depends_on_option_id})")
-    
-    # Convertir el tipo de dependencia a string antes de devolverlo
-    for dep in dependencies:
-        dep.type = dep.type.value
-    
-    return dependencies 
+    # Una sola consulta: las dependencias cuya opción principal pertenece al producto
+    dependencies = db.query(OptionDependency).join(
+        PartOption, OptionDependency.option_id == PartOption.id
+    ).join(
+        PartType, PartOption.part_type_id == PartType.id
+    ).filter(
+        PartType.product_id == product_id
+    ).order_by(OptionDependency.id).all()
+    
+    logger.debug("product.dependencies_loaded", product_id=product_id, dependencies=len(dependencies))
+    
+    return dependencies
 
 def get_product_id_from_options(db: Session, selected_option_ids: List[int]) -> Optional[int]:
     """
@@ -720,6 +539,11 @@ def get_product_id_from_options(db: Session, selected_option_ids: List[int]) ->
     if not selected_option_ids:
         return None
     
+    # Si el producto ya está compilado en caché, no hace falta consultar la base de datos
+    cached_product_id = rule_index.find_product_id_for_option(selected_option_ids[0])
+    if cached_product_id is not None:
+        return cached_product_id
+    
     # Tomamos la primera opción para obtener el tipo de parte y luego el producto
     first_option = db.query(PartOption).filter(PartOption.id == selected_option_ids[0]).first()
     if not first_option:
@@ -0,0 +1,151 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from app.db import database
+from app.db.database import run_in_session
+from app.schemas.product import (
+    Product, ProductCreate, PartType, PartTypeCreate, PartOption, PartOptionCreate,
+    OptionDependency, OptionDependencyCreate, ConditionalPrice, ConditionalPriceCreate
+)
+from app.services import product_service, configuration_solver, rule_index
+from typing import Iterator, List, Optional, Tuple
+from decimal import Decimal
+
+# Versión asíncrona de product_service para las rutas de la API. Cada función ejecuta la
+# lógica síncrona del servicio sobre la conexión de la sesión asíncrona (run_sync), de modo
+# que el bucle de eventos queda libre mientras se espera a la base de datos. Los resultados
+# con relaciones se convierten a su esquema dentro de la sesión, porque fuera de ella no se
+# pueden cargar de forma perezosa.
+#
+# run_sync ejecuta la función en el hilo del bucle de eventos, así que las funciones que
+# evalúan reglas (motor de compatibilidad, matrices de precios, solver) solo cargan el
+# índice del producto dentro de la sesión y hacen el cálculo en el pool de hilos, para que
+# una validación en lote o un recuento pesado no bloqueen el resto de peticiones.
+
+async def _write_catalog(db: AsyncSession, function, *args, schema=None):
+    # Tras una escritura del catálogo, las lecturas van a la principal hasta que las
+    # réplicas la reciban
+    result = await run_in_session(db, function, *args, schema=schema)
+    database.read_router.pin_to_primary()
+    return result
+
+async def _get_rule_index(db: AsyncSession, product_id: int) -> Optional[rule_index.ProductRuleIndex]:
+    return await run_in_session(db, rule_index.get_rule_index, product_id)
+
+async def _require_rule_index(db: AsyncSession, product_id: int) -> rule_index.ProductRuleIndex:
+    index = await _get_rule_index(db, product_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    return index
+
+async def product_exists(db: AsyncSession, product_id: int) -> bool:
+    return await run_in_session(db, product_service.product_exists, product_id)
+
+async def get_product_detail_json(db: AsyncSession, product_id: int) -> Optional[bytes]:
+    return await run_in_session(db, product_service.get_product_detail_json, product_id)
+
+async def get_products_page(db: AsyncSession, skip: int = 0, limit: int = 100) -> dict:
+    """
+    Obtiene una página de productos y el total de productos para la paginación.
+    """
+    def page(session):
+        return {
+            "items": jsonable_encoder(product_service.get_products(session, skip=skip, limit=limit)),
+            "total": product_service.get_total_products(session)
+        }
+    return await run_in_session(db, page)
+
+async def get_featured_products(db: AsyncSession, limit: int = 3) -> List[Product]:
+    return await run_in_session(db, product_service.get_featured_products, limit, schema=List[Product])
+
+async def create_product(db: AsyncSession, product: ProductCreate) -> Product:
+    return await _write_catalog(db, product_service.create_product, product, schema=Product)
+
+async def update_product(db: AsyncSession, product_id: int, product: ProductCreate) -> Product:
+    return await _write_catalog(db, product_service.update_product, product_id, product, schema=Product)
+
+async def delete_product(db: AsyncSession, product_id: int) -> None:
+    return await _write_catalog(db, product_service.delete_product, product_id)
+
+async def create_part_type(db: AsyncSession, part_type: PartTypeCreate, product_id: int) -> PartType:
+    return await _write_catalog(db, product_service.create_part_type, part_type, product_id, schema=PartType)
+
+async def create_part_option(db: AsyncSession, part_option: PartOptionCreate, part_type_id: int) -> PartOption:
+    return await _write_catalog(db, product_service.create_part_option, part_option, part_type_id, schema=PartOption)
+
+async def create_option_dependency(db: AsyncSession, dependency: OptionDependencyCreate, option_id: int) -> OptionDependency:
+    return await _write_catalog(db, product_service.create_option_dependency, dependency, option_id, schema=OptionDependency)
+
+async def create_conditional_price(db: AsyncSession, conditional_price: ConditionalPriceCreate, option_id: int) -> ConditionalPrice:
+    return await _write_catalog(
+        db, product_service.create_conditional_price, conditional_price, option_id, schema=ConditionalPrice
+    )
+
+async def update_option_stock(db: AsyncSession, option_id: int, in_stock: bool) -> Optional[PartOption]:
+    return await _write_catalog(db, product_service.update_option_stock, option_id, in_stock, schema=PartOption)
+
+async def delete_option_dependency(db: AsyncSession, dependency_id: int) -> bool:
+    return await _write_catalog(db, product_service.delete_option_dependency, dependency_id)
+
+async def delete_part_type(db: AsyncSession, part_type_id: int) -> None:
+    return await _write_catalog(db, product_service.delete_part_type, part_type_id)
+
+async def delete_part_option(db: AsyncSession, part_type_id: int, option_id: int) -> None:
+    return await _write_catalog(db, product_service.delete_part_option, part_type_id, option_id)
+
+async def get_product_dependencies(db: AsyncSession, product_id: int) -> List[OptionDependency]:
+    return await run_in_session(db, product_service.get_product_dependencies, product_id, schema=List[OptionDependency])
+
+async def get_product_id_from_options(db: AsyncSession, selected_option_ids: List[int]) -> Optional[int]:
+    return await run_in_session(db, product_service.get_product_id_from_options, selected_option_ids)
+
+async def validate_compatibility(db: AsyncSession, product_id=None, selected_option_ids: List[int] = None) -> dict:
+    if selected_option_ids is None:
+        selected_option_ids = []
+    if product_id is None and selected_option_ids:
+        product_id = await get_product_id_from_options(db, selected_option_ids[:1])
+    if not product_id:
+        raise HTTPException(status_code=400, detail="No se pudo determinar el producto")
+    index = await _require_rule_index(db, product_id)
+    return await run_in_threadpool(product_service.validate_selection, index, selected_option_ids)
+
+async def validate_selections(db: AsyncSession, selections: List[Tuple[int, List[int]]]) -> List[dict]:
+    def load(session):
+        return {product_id: rule_index.get_rule_index(session, product_id) for product_id, _ in selections}
+    indexes = await run_in_session(db, load)
+    return await run_in_threadpool(product_service.evaluate_selections, indexes, selections)
+
+async def price_options(db: AsyncSession, selected_option_ids: List[int]) -> Tuple[Decimal, dict]:
+    return await run_in_session(db, product_service.price_options, selected_option_ids)
+
+async def get_available_options(db: AsyncSession, product_id: int, current_selection: List[int] = None) -> Optional[List[dict]]:
+    """
+    Obtiene las opciones disponibles para la selección actual, sin consultas si el índice
+    de reglas del producto está en caché. Devuelve None si el producto no existe.
+    """
+    index = await _get_rule_index(db, product_id)
+    if index is None:
+        return None
+    return await run_in_threadpool(product_service.options_with_consequences, index, current_selection or [])
+
+async def configure_product(db: AsyncSession, product_id: int, selected_option_ids: List[int] = None) -> dict:
+    index = await _require_rule_index(db, product_id)
+    return await run_in_threadpool(product_service.configure_selection, index, selected_option_ids or [])
+
+async def complete_configuration(db: AsyncSession, product_id: int, selected_option_ids: List[int] = None) -> dict:
+    index = await _require_rule_index(db, product_id)
+    return await run_in_threadpool(product_service.complete_selection, index, selected_option_ids or [])
+
+async def count_configurations(db: AsyncSession, product_id: int) -> Optional[int]:
+    index = await _get_rule_index(db, product_id)
+    if index is None:
+        return None
+    return await run_in_threadpool(lambda: configuration_solver.get_solver(index).count())
+
+async def iter_configurations(db: AsyncSession, product_id: int) -> Optional[Iterator[List[int]]]:
+    # El generador no usa la sesión; StreamingResponse lo consume en el pool de hilos
+    index = await _get_rule_index(db, product_id)
+    if index is None:
+        return None
+    return await run_in_threadpool(lambda: configuration_solver.get_solver(index).configurations())
@@ -0,0 +1,97 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+class LRUCache:
+    """
+    Caché LRU acotada y segura entre hilos, con contadores de aciertos, fallos y expulsiones.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Devuelve el valor asociado a la clave y lo marca como usado recientemente.
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Guarda un valor, expulsando la entrada menos usada si se supera el tamaño máximo.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Vacía la caché y reinicia los contadores.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Devuelve los contadores y el tamaño actual de la caché.
+        """
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+# Cachés de resultados de validate_compatibility y calculate_price, indexadas por
+# (product_id, frozenset(selected_option_ids), catalog_version)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+
+validation_cache = LRUCache(RESULT_CACHE_SIZE)
+price_cache = LRUCache(RESULT_CACHE_SIZE)
+
+# Caché del detalle de producto serializado, indexada por (product_id, catalog_version)
+PRODUCT_DETAIL_CACHE_SIZE = int(os.getenv("PRODUCT_DETAIL_CACHE_SIZE", "256"))
+
+product_detail_cache = LRUCache(PRODUCT_DETAIL_CACHE_SIZE)
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Devuelve los contadores de todas las cachés de resultados.
+    """
+    return {
+        "validation": validation_cache.stats(),
+        "price": price_cache.stats(),
+        "product_detail": product_detail_cache.stats()
+    }
+
+def clear() -> None:
+    """
+    Vacía todas las cachés de resultados.
+    """
+    validation_cache.clear()
+    price_cache.clear()
+    product_detail_cache.clear()
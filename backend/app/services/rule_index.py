@@ -0,0 +1,161 @@
+from sqlalchemy.orm import Session
+from app.models.product import Product, PartType, PartOption, OptionDependency, ConditionalPrice, DependencyType
+from app.services import catalog_version
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from decimal import Decimal
+import threading
+
+class OptionRule:
+    """
+    Datos de una opción necesarios para evaluar reglas sin acceder a la base de datos.
+    """
+    __slots__ = ("id", "name", "base_price", "in_stock", "part_type_id")
+
+    def __init__(self, id: int, name: str, base_price: Decimal, in_stock: bool, part_type_id: int):
+        self.id = id
+        self.name = name
+        self.base_price = base_price
+        self.in_stock = in_stock
+        self.part_type_id = part_type_id
+
+class ProductRuleIndex:
+    """
+    Índice compilado de las reglas de un producto: tipos de parte, opciones,
+    adyacencia de dependencias requires/excludes y precios condicionales.
+    Se construye una sola vez a partir de un conjunto fijo de consultas y es inmutable.
+    """
+
+    def __init__(
+        self,
+        product: Product,
+        part_types: List[PartType],
+        options: List[PartOption],
+        dependencies: List[OptionDependency],
+        conditional_prices: List[ConditionalPrice],
+    ):
+        self.product_id = product.id
+        self.version = product.catalog_version
+        self.product_name = product.name
+        self.base_price = product.base_price
+
+        # Tipos de parte en el orden de la base de datos
+        self.part_types: List[Tuple[int, str]] = [(pt.id, pt.name) for pt in part_types]
+
+        self.options: Dict[int, OptionRule] = {}
+        self.options_by_part_type: Dict[int, List[int]] = {pt.id: [] for pt in part_types}
+        for option in options:
+            self.options[option.id] = OptionRule(
+                option.id, option.name, option.base_price, option.in_stock, option.part_type_id
+            )
+            self.options_by_part_type.setdefault(option.part_type_id, []).append(option.id)
+
+        # Dependencias salientes (option_id -> [(depends_on_option_id, tipo)]) y entrantes
+        # (depends_on_option_id -> [(option_id, tipo)]), ambas en orden de ID de dependencia
+        self.dependencies: Dict[int, List[Tuple[int, DependencyType]]] = {}
+        self.dependents: Dict[int, List[Tuple[int, DependencyType]]] = {}
+        self.requires: Dict[int, List[int]] = {}
+        self.excludes: Dict[int, List[int]] = {}
+        for dep in dependencies:
+            self.dependencies.setdefault(dep.option_id, []).append((dep.depends_on_option_id, dep.type))
+            self.dependents.setdefault(dep.depends_on_option_id, []).append((dep.option_id, dep.type))
+            if dep.type == DependencyType.requires:
+                self.requires.setdefault(dep.option_id, []).append(dep.depends_on_option_id)
+            elif dep.type == DependencyType.excludes:
+                self.excludes.setdefault(dep.option_id, []).append(dep.depends_on_option_id)
+
+        # Precios condicionales: option_id -> [(condition_option_id, precio)]
+        self.conditional_prices: Dict[int, List[Tuple[int, Decimal]]] = {}
+        for cp in conditional_prices:
+            self.conditional_prices.setdefault(cp.option_id, []).append(
+                (cp.condition_option_id, cp.conditional_price)
+            )
+
+        # Estructuras derivadas (motores de evaluación) construidas bajo demanda
+        self._derived: Dict[str, Any] = {}
+
+    def option_name(self, option_id: int) -> str:
+        """
+        Devuelve el nombre de una opción o un texto genérico si no pertenece al producto.
+        """
+        option = self.options.get(option_id)
+        return option.name if option else f"Opción {option_id}"
+
+    def derived(self, key: str, factory: Callable[["ProductRuleIndex"], Any]) -> Any:
+        """
+        Obtiene una estructura derivada del índice, construyéndola la primera vez que se pide.
+        Como el índice es inmutable, la estructura vive mientras el índice siga en caché.
+        """
+        value = self._derived.get(key)
+        if value is None:
+            value = factory(self)
+            self._derived[key] = value
+        return value
+
+def load_rule_index(db: Session, product_id: int) -> Optional[ProductRuleIndex]:
+    """
+    Carga todas las reglas de un producto con un número fijo de consultas,
+    independiente del número de opciones o dependencias.
+    """
+    product = db.query(Product).filter(Product.id == product_id).first()
+    if not product:
+        return None
+
+    part_types = db.query(PartType).filter(PartType.product_id == product_id).order_by(PartType.id).all()
+    part_type_ids = [pt.id for pt in part_types]
+
+    options = []
+    if part_type_ids:
+        options = db.query(PartOption).filter(
+            PartOption.part_type_id.in_(part_type_ids)
+        ).order_by(PartOption.id).all()
+    option_ids = [option.id for option in options]
+
+    dependencies = []
+    conditional_prices = []
+    if option_ids:
+        dependencies = db.query(OptionDependency).filter(
+            OptionDependency.option_id.in_(option_ids)
+        ).order_by(OptionDependency.id).all()
+        conditional_prices = db.query(ConditionalPrice).filter(
+            ConditionalPrice.option_id.in_(option_ids)
+        ).order_by(ConditionalPrice.id).all()
+
+    return ProductRuleIndex(product, part_types, options, dependencies, conditional_prices)
+
+# Caché de índices por producto. Cada índice guarda la versión del catálogo leída junto con
+# sus datos y se descarta en cuanto esa versión deja de ser la actual.
+_indexes: Dict[int, ProductRuleIndex] = {}
+_lock = threading.Lock()
+
+def get_rule_index(db: Session, product_id: int) -> Optional[ProductRuleIndex]:
+    """
+    Obtiene el índice compilado de un producto, cargándolo solo si no está en caché
+    o si la versión del catálogo del producto ha cambiado.
+    """
+    index = _indexes.get(product_id)
+    if index is not None and index.version == catalog_version.get_catalog_version(db, product_id):
+        return index
+
+    index = load_rule_index(db, product_id)
+    if index is not None:
+        with _lock:
+            # El índice de una réplica atrasada sirve para esta petición, pero no se guarda
+            if catalog_version.record_catalog_version(product_id, index.version) == index.version:
+                _indexes[product_id] = index
+    return index
+
+def clear_rule_indexes() -> None:
+    """
+    Vacía la caché de índices compilados.
+    """
+    with _lock:
+        _indexes.clear()
+
+def find_product_id_for_option(option_id: int) -> Optional[int]:
+    """
+    Busca entre los índices vigentes en caché el producto al que pertenece una opción.
+    """
+    for index in list(_indexes.values()):
+        if option_id in index.options and index.version == catalog_version.known_catalog_version(index.product_id):
+            return index.product_id
+    return None
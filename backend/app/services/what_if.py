@@ -0,0 +1,110 @@
+import numpy as np
+from app.services import compatibility_engine
+from app.services.rule_index import ProductRuleIndex
+from typing import Dict, List
+
+class WhatIfEvaluator:
+    """
+    Evalúa de una sola vez qué pasaría al elegir cada opción no seleccionada de un producto.
+    La opción sustituye a la seleccionada de su tipo de parte y arrastra su cadena de
+    dependencias requires, igual que al seleccionarla en la interfaz.
+
+    Las reglas se precalculan como matrices booleanas sobre las posiciones de bit del motor
+    de compatibilidad: cierre requires (incluida la propia opción), exclusiones en ambos
+    sentidos y pertenencia a tipos de parte. Cada evaluación se reduce a unos pocos productos
+    de matrices sobre todas las opciones a la vez.
+    """
+
+    def __init__(self, index: ProductRuleIndex):
+        engine = compatibility_engine.get_engine(index)
+        self.option_ids = engine.option_ids
+        self.bits = engine.bits
+        size = len(engine.option_ids)
+        # Las opciones del producto ocupan las primeras posiciones de bit
+        self.candidate_count = len(index.options)
+
+        self.closure = np.zeros((self.candidate_count, size), dtype=bool)
+        for position, option_id in enumerate(self.option_ids[:self.candidate_count]):
+            self.closure[position, position] = True
+            for required_id in engine.closure_order.get(option_id, ()):
+                self.closure[position, engine.bits[required_id].bit_length() - 1] = True
+
+        self.conflicts = np.zeros((size, size), dtype=bool)
+        for option_id, excluded_mask in engine.excludes_mask.items():
+            position = engine.bits[option_id].bit_length() - 1
+            for excluded_id in engine.ids_in(excluded_mask):
+                excluded_position = engine.bits[excluded_id].bit_length() - 1
+                self.conflicts[position, excluded_position] = True
+                self.conflicts[excluded_position, position] = True
+
+        part_type_codes = {part_type_id: code for code, (part_type_id, _) in enumerate(index.part_types)}
+        self.part_types = np.zeros((size, len(part_type_codes)), dtype=bool)
+        self.available = np.zeros(size, dtype=bool)
+        for option_id, option in index.options.items():
+            position = engine.bits[option_id].bit_length() - 1
+            self.part_types[position, part_type_codes[option.part_type_id]] = True
+            self.available[position] = option.in_stock
+
+        # Pares de opciones distintas del mismo tipo de parte
+        self.same_part_type = _product(self.part_types, self.part_types.T)
+        np.fill_diagonal(self.same_part_type, False)
+
+    def evaluate(self, selected_option_ids: List[int]) -> Dict[int, dict]:
+        """
+        Para cada opción del producto que no está seleccionada devuelve si la selección
+        resultante de elegirla sería válida (valid_if_selected), qué opciones se añadirían
+        por sus dependencias requires (auto_selects) y qué opciones seleccionadas habría que
+        quitar para que la opción y su cadena encajen (deselects).
+        """
+        count = self.candidate_count
+        selected = np.zeros(len(self.option_ids), dtype=bool)
+        for option_id in selected_option_ids:
+            bit = self.bits.get(option_id)
+            if bit is not None and bit.bit_length() <= count:
+                selected[bit.bit_length() - 1] = True
+        selected_positions = np.flatnonzero(selected)
+
+        # Opciones que añade cada candidata: ella misma y su cierre requires
+        added = self.closure
+        same_as_candidate = self.same_part_type[:count] | np.eye(count, len(self.option_ids), dtype=bool)
+
+        # Selección resultante: las seleccionadas de otros tipos de parte con sus cierres,
+        # más la candidata y su cierre
+        kept = selected[None, :] & ~same_as_candidate
+        final = _product(kept[:, selected_positions], self.closure[selected_positions]) | added
+        valid = ~(
+            (final & ~self.available).any(axis=1)
+            | (_product(final, self.conflicts) & final).any(axis=1)
+            | (final.astype(np.float32) @ self.part_types.astype(np.float32) > 1).any(axis=1)
+        )
+
+        # Seleccionadas que no caben: aquellas cuyo cierre requires choca con lo añadido, por
+        # compartir tipo de parte o por una exclusión en cualquier sentido
+        blocked = _product(added, self.same_part_type) | _product(added, self.conflicts)
+        displaced = np.zeros((count, len(self.option_ids)), dtype=bool)
+        displaced[:, selected_positions] = _product(blocked, self.closure[selected_positions].T)
+
+        auto_selects = added & ~selected[None, :]
+        auto_selects[np.arange(count), np.arange(count)] = False
+
+        result = {}
+        for position in np.flatnonzero(~selected[:count]):
+            result[self.option_ids[position]] = {
+                "valid_if_selected": bool(valid[position]),
+                "auto_selects": [self.option_ids[i] for i in np.flatnonzero(auto_selects[position])],
+                "deselects": [self.option_ids[i] for i in np.flatnonzero(displaced[position])]
+            }
+        return result
+
+def _product(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Producto booleano de matrices: hay camino si alguna posición intermedia está en ambas.
+    Se calcula en coma flotante para aprovechar BLAS; los recuentos son exactos.
+    """
+    return (left.astype(np.float32) @ right.astype(np.float32)) > 0
+
+def get_what_if_evaluator(index: ProductRuleIndex) -> WhatIfEvaluator:
+    """
+    Obtiene el evaluador de escenarios del índice, construyéndolo la primera vez.
+    """
+    return index.derived("what_if", WhatIfEvaluator)
@@ -1,19 +1,32 @@
 import pytest
+from contextlib import contextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from app.db.database import Base
+from sqlalchemy.pool import NullPool
+from fastapi.testclient import TestClient
+from decimal import Decimal
+from app.db.database import Base, ReadOnlySession, get_async_db, get_primary_read_db, get_read_db
+from app.db.query_stats import instrument_engine, track_queries
+from app.models.product import Product, PartType, PartOption, OptionDependency, DependencyType, ConditionalPrice
+from app.services import rule_index, result_cache, catalog_version
 
-# Usar una base de datos SQLite en memoria para los tests
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+@pytest.fixture
+def database_path(tmp_path):
+    """
+    Fichero SQLite de cada test. Se usa un fichero en lugar de una base de datos en memoria
+    para que la sesión síncrona y la asíncrona de las rutas vean los mismos datos.
+    """
+    return tmp_path / "test.db"
 
 @pytest.fixture(scope="function")
-def db():
+def db(database_path):
     """Fixture que proporciona una sesión de base de datos para los tests"""
     # Crear el motor de base de datos
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL,
+    engine = instrument_engine(create_engine(
+        f"sqlite:///{database_path}",
         connect_args={"check_same_thread": False}
-    )
+    ))
     
     # Crear todas las tablas
     Base.metadata.create_all(bind=engine)
@@ -27,4 +40,124 @@ def db():
     finally:
         db.close()
         # Limpiar la base de datos después de cada test
-        Base.metadata.drop_all(bind=engine) 
\ No newline at end of file
+        Base.metadata.drop_all(bind=engine) 
+
+@pytest.fixture
+def async_session_factory(db, database_path):
+    """
+    Fixture que devuelve una fábrica de sesiones asíncronas sobre la misma base de datos
+    que la sesión síncrona. Sin pool, para no dejar conexiones abiertas al terminar.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}", poolclass=NullPool)
+    instrument_engine(engine.sync_engine)
+    return async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+@pytest.fixture
+def client(async_session_factory):
+    """
+    Fixture que devuelve un cliente de la API cuyas rutas usan la base de datos del test,
+    con sesiones de solo lectura en las rutas de lectura
+    """
+    from app.main import app
+    read_only_factory = async_sessionmaker(
+        bind=async_session_factory.kw["bind"], sync_session_class=ReadOnlySession,
+        autoflush=False, expire_on_commit=False
+    )
+
+    async def override_get_async_db():
+        async with async_session_factory() as session:
+            yield session
+
+    async def override_get_read_db():
+        async with read_only_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    app.dependency_overrides[get_primary_read_db] = override_get_read_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+@pytest.fixture
+def anyio_backend():
+    """Los tests asíncronos se ejecutan solo sobre asyncio"""
+    return "asyncio"
+
+@pytest.fixture(autouse=True)
+def clear_rule_cache():
+    """Fixture que vacía los índices de reglas, las versiones y los resultados en caché entre tests"""
+    rule_index.clear_rule_indexes()
+    catalog_version.clear_catalog_versions()
+    result_cache.clear()
+    yield
+    rule_index.clear_rule_indexes()
+    catalog_version.clear_catalog_versions()
+    result_cache.clear()
+
+
+@pytest.fixture
+def bike(db):
+    """
+    Fixture que crea una bicicleta con cuadro y ruedas, donde las ruedas de montaña
+    requieren el cuadro de doble suspensión y las de carretera son más baratas con el
+    cuadro diamante. Devuelve el producto y un diccionario con los IDs de las opciones.
+    """
+    product = Product(name="Bicicleta", category="bikes", base_price=Decimal("500"))
+    db.add(product)
+    db.flush()
+
+    frame = PartType(name="Cuadro", product_id=product.id)
+    wheels = PartType(name="Ruedas", product_id=product.id)
+    db.add_all([frame, wheels])
+    db.flush()
+
+    full_suspension = PartOption(name="Doble suspensión", part_type_id=frame.id, base_price=Decimal("130"))
+    diamond = PartOption(name="Diamante", part_type_id=frame.id, base_price=Decimal("100"))
+    mountain = PartOption(name="Montaña", part_type_id=wheels.id, base_price=Decimal("90"))
+    road = PartOption(name="Carretera", part_type_id=wheels.id, base_price=Decimal("80"))
+    db.add_all([full_suspension, diamond, mountain, road])
+    db.flush()
+
+    db.add(OptionDependency(option_id=mountain.id, depends_on_option_id=full_suspension.id, type=DependencyType.requires))
+    db.add(ConditionalPrice(option_id=road.id, condition_option_id=diamond.id, conditional_price=Decimal("70")))
+    db.commit()
+
+    return product, {
+        "frame": frame.id,
+        "wheels": wheels.id,
+        "full_suspension": full_suspension.id,
+        "diamond": diamond.id,
+        "mountain": mountain.id,
+        "road": road.id,
+    }
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Fixture que comprueba que un bloque no ejecuta más sentencias SQL que las indicadas,
+    para que las regresiones N+1 hagan fallar los tests
+    """
+    @contextmanager
+    def budget(max_queries):
+        with track_queries() as stats:
+            yield stats
+        assert stats.count <= max_queries, f"Se ejecutaron {stats.count} sentencias SQL (máximo {max_queries})"
+    return budget
+
+
+@pytest.fixture
+def find_option():
+    """
+    Fixture que devuelve una función para buscar una opción por ID en el resultado de
+    validate_compatibility con formato de producto
+    """
+    def find(result, option_id):
+        for component in result["product"]["components"]:
+            for option in component["options"]:
+                if option["id"] == option_id:
+                    return option
+        return None
+    return find
@@ -0,0 +1,121 @@
+import pytest
+import threading
+from decimal import Decimal
+from fastapi import HTTPException
+from app.schemas.product import ProductCreate
+from app.services import product_service, product_service_async, cart_service_async
+
+
+class TestAsyncServices:
+    """
+    Pruebas para los servicios asíncronos que usan las rutas de la API
+    """
+
+    @pytest.mark.anyio
+    async def test_product_reads(self, async_session_factory, bike):
+        """
+        Prueba que los servicios asíncronos devuelven los mismos resultados que los síncronos
+        y que los productos se devuelven ya convertidos, con sus relaciones cargadas
+        """
+        product, ids = bike
+        product_id = product.id
+
+        async with async_session_factory() as session:
+            page = await product_service_async.get_products_page(session)
+            [verdict] = await product_service_async.validate_selections(
+                session, [(product_id, [ids["mountain"], ids["diamond"]])]
+            )
+            total, applied = await product_service_async.price_options(session, [ids["diamond"], ids["road"]])
+            created = await product_service_async.create_product(
+                session, ProductCreate(name="Patinete", category="scooters")
+            )
+
+        assert page["total"] == 1 and page["items"][0]["name"] == "Bicicleta"
+        assert verdict["valid"] is False
+        assert total == Decimal("170")
+        assert applied[ids["road"]]["conditional_price"] == 70.0
+        assert created.name == "Patinete" and created.part_types == []
+
+    @pytest.mark.anyio
+    async def test_rule_evaluation_runs_off_the_event_loop(self, async_session_factory, bike, monkeypatch):
+        """
+        Prueba que la evaluación de reglas se hace en el pool de hilos y no en el hilo del bucle de eventos
+        """
+        product, ids = bike
+        threads = []
+        for name in ("evaluate_selections", "configure_selection", "options_with_consequences"):
+            function = getattr(product_service, name)
+            monkeypatch.setattr(product_service, name, lambda *args, function=function: threads.append(threading.get_ident()) or function(*args))
+
+        async with async_session_factory() as session:
+            await product_service_async.validate_selections(session, [(product.id, [ids["diamond"]])])
+            await product_service_async.configure_product(session, product.id, [ids["diamond"]])
+            await product_service_async.get_available_options(session, product.id, [ids["diamond"]])
+            assert await product_service_async.count_configurations(session, product.id) == 3
+            with pytest.raises(HTTPException):
+                await product_service_async.configure_product(session, 999)
+
+        assert len(threads) >= 3 and threading.get_ident() not in threads
+
+    @pytest.mark.anyio
+    async def test_missing_product(self, async_session_factory, bike):
+        """
+        Prueba que las opciones de un producto inexistente se devuelven como None
+        """
+        async with async_session_factory() as session:
+            assert await product_service_async.get_available_options(session, 999) is None
+            assert await product_service_async.product_exists(session, 999) is False
+
+    @pytest.mark.anyio
+    async def test_cart_is_returned_with_items(self, async_session_factory, bike):
+        """
+        Prueba que el carrito se devuelve convertido a su esquema, con los ítems y sus opciones
+        """
+        product, ids = bike
+        product_id = product.id
+
+        async with async_session_factory() as session:
+            cart_id, cart_item_id = await cart_service_async.add_to_cart(
+                session, None, "usuario-1", product_id, [ids["diamond"], ids["road"]]
+            )
+            cart = await cart_service_async.get_cart(session, cart_id)
+
+        [cart_item] = cart.items
+        assert cart.user_id == "usuario-1"
+        assert cart_item.id == cart_item_id
+        assert cart_item.price_snapshot == Decimal("670")
+        assert sorted(option.part_option_id for option in cart_item.options) == sorted([ids["diamond"], ids["road"]])
+
+
+class TestAsyncRoutes:
+    """
+    Pruebas de las rutas asíncronas de productos y carrito
+    """
+
+    def test_cart_routes(self, client, bike):
+        """
+        Prueba el flujo completo de añadir al carrito y leerlo a través de la API
+        """
+        product, ids = bike
+
+        added = client.post(
+            "/api/v1/cart/items",
+            json={"product_id": product.id, "selected_options": [ids["full_suspension"], ids["mountain"]]}
+        )
+        cart = client.get("/api/v1/cart", params={"query_cart_id": added.json()["cart_id"]})
+
+        assert added.status_code == 201
+        assert cart.status_code == 200
+        [item] = cart.json()["items"]
+        assert item["id"] == added.json()["cart_item_id"]
+
+    def test_product_routes(self, client, bike):
+        """
+        Prueba que las rutas de productos devuelven 404 para productos inexistentes
+        """
+        product, _ = bike
+
+        assert client.get(f"/api/v1/products/{product.id}/options").status_code == 200
+        assert client.get("/api/v1/products/999/options").status_code == 404
+        assert client.put("/api/v1/products/999", json={"name": "X", "category": "y"}).status_code == 400
+        assert client.get("/api/v1/products/").json()["total"] == 1
@@ -0,0 +1,77 @@
+import pytest
+from decimal import Decimal
+from app.services.product_service import validate_selections, update_option_stock
+
+
+class TestBatchValidation:
+    """
+    Pruebas para la validación en lote de selecciones
+    """
+
+    def test_valid_selection_with_auto_added_options(self, db, bike):
+        """
+        Prueba que una selección válida incluye las opciones auto-añadidas en el precio
+        """
+        product, ids = bike
+
+        verdict, = validate_selections(db, [(product.id, [ids["mountain"]])])
+
+        assert verdict == {
+            "product_id": product.id,
+            "selected_options": [ids["mountain"]],
+            "valid": True,
+            "auto_added": [ids["full_suspension"]],
+            "first_conflict": None,
+            "price": Decimal("220")
+        }
+
+    def test_conflicts(self, db, bike):
+        """
+        Prueba el primer conflicto de selecciones inválidas
+        """
+        product, ids = bike
+        update_option_stock(db, ids["full_suspension"], False)
+
+        verdicts = validate_selections(db, [
+            (product.id, [ids["diamond"], ids["road"]]),
+            (product.id, [ids["diamond"], ids["full_suspension"]]),
+            (product.id, [ids["mountain"]]),
+            (product.id, [ids["road"], 999])
+        ])
+
+        assert [verdict["valid"] for verdict in verdicts] == [True, False, False, False]
+        assert verdicts[0]["price"] == Decimal("170")
+        assert verdicts[1]["first_conflict"]["reason"] == "out_of_stock"
+        assert verdicts[1]["price"] is None
+        assert verdicts[2]["first_conflict"]["chain_conflict"]["reason"] == "out_of_stock"
+        assert verdicts[3]["first_conflict"]["reason"] == "not_in_product"
+
+    def test_same_part_type_is_a_conflict(self, db, bike):
+        """
+        Prueba que dos opciones del mismo tipo de parte invalidan la selección
+        """
+        product, ids = bike
+
+        verdict, = validate_selections(db, [(product.id, [ids["mountain"], ids["road"]])])
+
+        assert verdict["first_conflict"] == {
+            "option_id": ids["mountain"],
+            "option_name": "Montaña",
+            "reason": "another_option_selected",
+            "dependency_id": ids["road"],
+            "dependency_name": "Carretera"
+        }
+
+    def test_rules_loaded_once_per_batch(self, db, bike, query_budget):
+        """
+        Prueba que el número de consultas no depende del número de selecciones
+        """
+        product, ids = bike
+        selections = [(product.id, [ids["diamond"], ids["road"]])] * 50 + [(999, [])]
+
+        with query_budget(10) as stats:
+            verdicts = validate_selections(db, selections)
+
+        assert len(verdicts) == 51
+        assert verdicts[-1]["first_conflict"] == {"reason": "product_not_found"}
+        assert stats.count <= 10
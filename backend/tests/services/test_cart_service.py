@@ -0,0 +1,272 @@
+import json
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from app import cli, metrics
+from app.models.cart import Cart, CartItemOption
+from app.models.product import PartOption, DependencyType
+from app.services import cart_service
+from app.services.cart_service import IncompatibleConfigurationError
+from app.services.cart_sweeper import database_now, sweep_abandoned_carts
+
+
+@pytest.fixture
+def cart_id(db):
+    cart = Cart()
+    db.add(cart)
+    db.commit()
+    return cart.id
+
+
+class TestAddToCart:
+    """
+    Pruebas para añadir al carrito una configuración validada y valorada en una sola pasada
+    """
+
+    def test_item_and_options_are_stored(self, db, bike, cart_id):
+        """
+        Prueba que el ítem guarda el precio base más las opciones y todas sus opciones
+        """
+        product, ids = bike
+
+        cart_item = cart_service.add_to_cart(db, cart_id, product.id, [ids["diamond"], ids["road"]], quantity=2)
+
+        assert cart_item.price_snapshot == Decimal("670")
+        assert cart_item.quantity == 2
+        assert sorted(option.part_option_id for option in cart_item.options) == sorted([ids["diamond"], ids["road"]])
+
+    def test_incompatible_selection(self, db, bike, cart_id):
+        """
+        Prueba que una selección con exclusiones lanza el error con los detalles del conflicto
+        """
+        product, ids = bike
+        db.get(PartOption, ids["mountain"]).dependencies[0].type = DependencyType.excludes
+        db.commit()
+
+        with pytest.raises(IncompatibleConfigurationError) as error:
+            cart_service.add_to_cart(db, cart_id, product.id, [ids["full_suspension"], ids["mountain"]])
+
+        assert error.value.details["type"] == "excludes"
+        assert error.value.details["excluded_option_id"] == ids["full_suspension"]
+        assert db.get(Cart, cart_id).items == []
+
+    def test_out_of_stock_option(self, db, bike, cart_id):
+        """
+        Prueba que una opción sin stock no se puede añadir
+        """
+        product, ids = bike
+        db.get(PartOption, ids["road"]).in_stock = False
+        db.commit()
+
+        with pytest.raises(ValueError, match="no está disponible"):
+            cart_service.add_to_cart(db, cart_id, product.id, [ids["road"]])
+
+    def test_unknown_product(self, db, cart_id):
+        """
+        Prueba que un producto inexistente devuelve 404
+        """
+        with pytest.raises(HTTPException) as error:
+            cart_service.add_to_cart(db, cart_id, 999, [])
+
+        assert error.value.status_code == 404
+
+    def test_incompatible_selection_does_not_create_cart(self, client, db, bike):
+        """
+        Prueba que la ruta responde 400 a una selección incompatible sin crear un carrito
+        """
+        product, ids = bike
+
+        response = client.post(
+            "/api/v1/cart/items",
+            json={"product_id": product.id, "selected_options": [ids["full_suspension"], ids["diamond"]]}
+        )
+
+        assert response.status_code == 400
+        assert response.json()["detail"].startswith("Incompatibility: ")
+        assert db.query(Cart).count() == 0
+
+
+class TestCartReads:
+    """
+    Pruebas para la lectura del carrito con sus ítems y totales
+    """
+
+    def test_cart_tree_in_fixed_queries(self, db, bike, cart_id, query_budget):
+        """
+        Prueba que un carrito con muchos ítems se carga en tres consultas con los totales calculados en SQL
+        """
+        product, ids = bike
+        product_id = product.id
+        for quantity in range(1, 31):
+            cart_service.add_to_cart(db, cart_id, product_id, [ids["diamond"], ids["road"]], quantity=quantity)
+        db.expunge_all()
+
+        with query_budget(3):
+            cart = cart_service.get_cart(db, cart_id)
+            items = [(item.subtotal, len(item.options)) for item in cart.items]
+
+        assert cart.item_count == sum(range(1, 31))
+        assert cart.subtotal == Decimal("670") * sum(range(1, 31))
+        assert items[2] == (Decimal("2010"), 2)
+
+    def test_get_cart_route_returns_totals(self, client, bike):
+        """
+        Prueba que la ruta del carrito devuelve los subtotales calculados por el servidor
+        """
+        product, ids = bike
+        added = client.post(
+            "/api/v1/cart/items",
+            json={"product_id": product.id, "selected_options": [ids["diamond"], ids["road"]], "quantity": 2}
+        ).json()
+
+        cart = client.get("/api/v1/cart", params={"query_cart_id": added["cart_id"]}).json()
+        empty = client.get("/api/v1/cart").json()
+
+        assert cart["item_count"] == 2
+        assert Decimal(cart["subtotal"]) == Decimal("1340")
+        assert Decimal(cart["items"][0]["subtotal"]) == Decimal("1340")
+        assert empty["items"] == [] and empty["item_count"] == 0 and Decimal(empty["subtotal"]) == 0
+
+
+class TestLazyCart:
+    """
+    Pruebas para la creación perezosa del carrito
+    """
+
+    def test_get_without_cart_does_not_touch_database(self, client, db, query_budget):
+        """
+        Prueba que pedir el carrito sin cookie devuelve un carrito vacío sin ID, sin
+        consultas y sin crear filas ni cookie
+        """
+        with query_budget(0):
+            response = client.get("/api/v1/cart")
+
+        assert response.status_code == 200
+        assert response.json()["id"] is None and response.json()["items"] == []
+        assert "cart_id" not in response.headers.get("set-cookie", "")
+        assert db.query(Cart).count() == 0
+
+    def test_unknown_cart_id_is_virtual(self, client, db):
+        """
+        Prueba que un ID de carrito inexistente devuelve un carrito vacío sin crearlo
+        """
+        response = client.get("/api/v1/cart", params={"query_cart_id": 999})
+
+        assert response.json()["id"] is None
+        assert db.query(Cart).count() == 0
+
+    def test_first_item_creates_cart(self, client, db, bike):
+        """
+        Prueba que el carrito se crea al añadir el primer ítem y que después se devuelve el del usuario
+        """
+        product, ids = bike
+
+        added = client.post(
+            "/api/v1/cart/items",
+            params={"user_id": "usuario-1"},
+            json={"product_id": product.id, "selected_options": [ids["diamond"], ids["road"]]}
+        ).json()
+        response = client.get("/api/v1/cart", params={"user_id": "usuario-1"})
+
+        assert db.query(Cart).count() == 1
+        assert response.json()["id"] == added["cart_id"]
+        assert "cart_id" in response.headers["set-cookie"]
+
+
+class TestGetOrCreateCart:
+    """
+    Pruebas para obtener o crear el carrito de un usuario con un upsert
+    """
+
+    def test_one_cart_per_user_in_one_statement(self, db, query_budget):
+        """
+        Prueba que el carrito del usuario se obtiene o se crea con una sola sentencia y sin duplicados
+        """
+        with query_budget(1):
+            created = cart_service.get_or_create_cart_id(db, "usuario-1")
+        with query_budget(1):
+            existing = cart_service.get_or_create_cart_id(db, "usuario-1")
+
+        assert created == existing
+        assert db.query(Cart).filter(Cart.user_id == "usuario-1").count() == 1
+
+    def test_anonymous_carts_are_not_merged(self, db):
+        """
+        Prueba que sin usuario cada llamada crea un carrito distinto
+        """
+        assert cart_service.get_or_create_cart_id(db) != cart_service.get_or_create_cart_id(db)
+
+    def test_unique_user_index(self, db):
+        """
+        Prueba que la base de datos rechaza un segundo carrito para el mismo usuario
+        """
+        cart_service.get_or_create_cart_id(db, "usuario-1")
+        db.add(Cart(user_id="usuario-1"))
+
+        with pytest.raises(IntegrityError):
+            db.commit()
+        db.rollback()
+
+
+class TestCartSweeper:
+    """
+    Pruebas para el barrido de carritos abandonados
+    """
+
+    def test_abandoned_carts_are_deleted_in_batches(self, db, bike):
+        """
+        Prueba que se borran en lotes los carritos sin actividad, con sus ítems y opciones,
+        y que se conservan los recientes
+        """
+        product, ids = bike
+        old = database_now(db) - timedelta(days=60)
+        cart_ids = []
+        for _ in range(5):
+            cart = Cart(last_activity=old)
+            db.add(cart)
+            db.commit()
+            cart_ids.append(cart.id)
+            cart_service.insert_cart_item(db, cart.id, product.id, [ids["diamond"], ids["road"]], Decimal("570"))
+        recent = Cart()
+        db.add(recent)
+        db.commit()
+        # Añadir un ítem actualiza la última actividad, así que el primer carrito deja de estar abandonado
+        db.execute(update(Cart).where(Cart.id.in_(cart_ids)).values(last_activity=old))
+        db.commit()
+        cart_service.add_to_cart(db, cart_ids[0], product.id, [ids["diamond"]])
+
+        result = sweep_abandoned_carts(db, ttl=timedelta(days=30), batch_size=2)
+
+        assert result.deleted == {"carts": 4, "cart_items": 4, "cart_item_options": 8}
+        assert result.batches == 2
+        assert sorted(cart.id for cart in db.query(Cart).all()) == [cart_ids[0], recent.id]
+        assert db.query(CartItemOption).count() == 3
+
+    def test_sweep_metrics(self, db):
+        """
+        Prueba que el barrido publica las filas borradas y su duración
+        """
+        db.add(Cart(last_activity=database_now(db) - timedelta(days=60)))
+        db.commit()
+        metrics.registry.clear()
+
+        sweep_abandoned_carts(db, ttl=timedelta(days=30))
+        text = metrics.registry.render()
+
+        assert 'cart_sweep_deleted_rows_total{table="carts"} 1' in text
+        assert "cart_sweep_duration_seconds_count 1" in text
+
+    def test_cli(self, db, monkeypatch, capsys):
+        """
+        Prueba el comando sweep-carts
+        """
+        db.add(Cart(last_activity=database_now(db) - timedelta(hours=3)))
+        db.commit()
+        monkeypatch.setattr(cli, "SessionLocal", sessionmaker(bind=db.get_bind()))
+
+        assert cli.main(["sweep-carts", "--ttl-hours", "2"]) == 0
+        assert json.loads(capsys.readouterr().out)["deleted"]["carts"] == 1
@@ -0,0 +1,214 @@
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from app.models.cart import Cart, CartItem, CartItemOption
+from app.services import cart_store
+from app.services.cart_sweeper import sweep_abandoned_carts
+from app.services.cart_store import CartStore, MemoryCartStore, SqlCartStore, create_cart_store
+
+
+@pytest.fixture
+def memory_store(async_session_factory):
+    """Fixture que crea un almacén de carritos en memoria sobre la base de datos del test"""
+    return MemoryCartStore(async_session_factory, maxsize=2, flush_interval=0)
+
+
+async def add_road_bike(store, session_factory, ids, product_id, cart_id=None, quantity=1):
+    async with session_factory() as session:
+        return await store.add_item(session, cart_id, None, product_id, [ids["diamond"], ids["road"]], quantity)
+
+
+class TestMemoryCartStore:
+    """
+    Pruebas para el almacén de carritos en memoria con escritura diferida
+    """
+
+    @pytest.mark.anyio
+    async def test_reads_are_served_from_memory(self, memory_store, async_session_factory, bike, query_budget):
+        """
+        Prueba que tras añadir un ítem el carrito se lee de memoria sin consultas
+        """
+        product, ids = bike
+        cart_id, item_id = await add_road_bike(memory_store, async_session_factory, ids, product.id, quantity=2)
+
+        with query_budget(0):
+            async with async_session_factory() as session:
+                cart = await memory_store.find_cart(session, cart_id)
+
+        assert cart.item_count == 2 and cart.subtotal == Decimal("1340")
+        assert [item.id for item in cart.items] == [item_id]
+        assert len(cart.items[0].options) == 2
+
+    @pytest.mark.anyio
+    async def test_changes_are_written_behind_in_batches(self, memory_store, async_session_factory, db, bike, query_budget):
+        """
+        Prueba que los cambios de cantidad y los borrados se aplican en memoria y se escriben
+        en la base de datos en un solo lote
+        """
+        product, ids = bike
+        cart_id, first_id = await add_road_bike(memory_store, async_session_factory, ids, product.id)
+        _, second_id = await add_road_bike(memory_store, async_session_factory, ids, product.id, cart_id=cart_id)
+
+        with query_budget(0):
+            async with async_session_factory() as session:
+                item = await memory_store.update_item_quantity(session, first_id, 3)
+                await memory_store.remove_item(session, second_id)
+                cart = await memory_store.find_cart(session, cart_id)
+
+        assert item.quantity == 3 and item.subtotal == Decimal("2010")
+        assert cart.item_count == 3 and cart.subtotal == Decimal("2010")
+        assert db.query(CartItem).count() == 2
+
+        with query_budget(4):
+            assert await memory_store.flush() == 1
+
+        db.expire_all()
+        assert [(item.id, item.quantity) for item in db.query(CartItem).all()] == [(first_id, 3)]
+        assert db.query(CartItemOption).count() == 2
+        assert await memory_store.flush() == 0
+
+    @pytest.mark.anyio
+    async def test_add_writes_pending_changes_of_the_cart(self, memory_store, async_session_factory, db, bike):
+        """
+        Prueba que añadir un ítem escribe antes los cambios pendientes del carrito
+        """
+        product, ids = bike
+        cart_id, item_id = await add_road_bike(memory_store, async_session_factory, ids, product.id)
+        async with async_session_factory() as session:
+            await memory_store.update_item_quantity(session, item_id, 4)
+
+        await add_road_bike(memory_store, async_session_factory, ids, product.id, cart_id=cart_id)
+        async with async_session_factory() as session:
+            cart = await memory_store.find_cart(session, cart_id)
+
+        db.expire_all()
+        assert db.get(CartItem, item_id).quantity == 4
+        assert cart.item_count == 5
+        assert memory_store.stats()["dirty"] == 0
+
+    @pytest.mark.anyio
+    async def test_lru_eviction_keeps_dirty_carts(self, memory_store, async_session_factory, bike):
+        """
+        Prueba que se expulsan los carritos menos usados salvo los que tienen cambios pendientes
+        """
+        product, ids = bike
+        first_cart, first_item = await add_road_bike(memory_store, async_session_factory, ids, product.id)
+        async with async_session_factory() as session:
+            await memory_store.update_item_quantity(session, first_item, 2)
+        for _ in range(2):
+            await add_road_bike(memory_store, async_session_factory, ids, product.id)
+
+        assert memory_store.stats() == {"size": 2, "maxsize": 2, "dirty": 1}
+        async with async_session_factory() as session:
+            assert (await memory_store.find_cart(session, first_cart)).item_count == 2
+
+        await memory_store.flush()
+        await add_road_bike(memory_store, async_session_factory, ids, product.id)
+        assert memory_store.stats()["size"] == 2
+
+    @pytest.mark.anyio
+    async def test_swept_carts_are_dropped_on_flush(self, memory_store, async_session_factory, db, bike):
+        """
+        Prueba que un carrito con cambios pendientes borrado por el barrido se descarta de
+        memoria al escribir los cambios, en lugar de seguir sirviéndose
+        """
+        product, ids = bike
+        swept_id, swept_item = await add_road_bike(memory_store, async_session_factory, ids, product.id)
+        kept_id, kept_item = await add_road_bike(memory_store, async_session_factory, ids, product.id)
+        async with async_session_factory() as session:
+            await memory_store.update_item_quantity(session, swept_item, 2)
+            await memory_store.update_item_quantity(session, kept_item, 3)
+
+        db.query(Cart).filter(Cart.id == swept_id).update({"last_activity": Cart.last_activity - timedelta(days=2)})
+        db.commit()
+        sweep_abandoned_carts(db, ttl=timedelta(days=1))
+
+        assert await memory_store.flush() == 1
+        assert memory_store.stats() == {"size": 1, "maxsize": 2, "dirty": 0}
+        async with async_session_factory() as session:
+            assert await memory_store.find_cart(session, swept_id) is None
+            with pytest.raises(ValueError):
+                await memory_store.update_item_quantity(session, swept_item, 4)
+        db.expire_all()
+        assert db.get(CartItem, kept_item).quantity == 3
+
+    @pytest.mark.anyio
+    async def test_add_to_swept_cart_drops_it(self, async_session_factory, db, bike):
+        """
+        Prueba que añadir un ítem a un carrito en memoria que el barrido ha borrado crea
+        otro carrito y descarta el borrado
+        """
+        product, ids = bike
+        memory_store = MemoryCartStore(async_session_factory, maxsize=10, flush_interval=0)
+        swept_id, _ = await add_road_bike(memory_store, async_session_factory, ids, product.id)
+        await add_road_bike(memory_store, async_session_factory, ids, product.id)
+        db.query(Cart).filter(Cart.id == swept_id).update({"last_activity": Cart.last_activity - timedelta(days=2)})
+        db.commit()
+        sweep_abandoned_carts(db, ttl=timedelta(days=1))
+
+        cart_id, _ = await add_road_bike(memory_store, async_session_factory, ids, product.id, cart_id=swept_id)
+
+        assert cart_id != swept_id
+        assert memory_store.stats()["size"] == 2
+        async with async_session_factory() as session:
+            assert await memory_store.find_cart(session, swept_id) is None
+
+    @pytest.mark.anyio
+    async def test_item_outside_memory_is_written_through(self, memory_store, async_session_factory, db, bike):
+        """
+        Prueba que los cambios de ítems cuyo carrito no está en memoria se escriben directamente
+        """
+        product, ids = bike
+        cart = Cart()
+        db.add(cart)
+        db.commit()
+        item_id = db.execute(
+            CartItem.__table__.insert().values(cart_id=cart.id, product_id=product.id, price_snapshot=500, quantity=1)
+        ).inserted_primary_key[0]
+        db.commit()
+
+        async with async_session_factory() as session:
+            await memory_store.update_item_quantity(session, item_id, 5)
+            with pytest.raises(ValueError):
+                await memory_store.remove_item(session, 999)
+
+        db.expire_all()
+        assert db.get(CartItem, item_id).quantity == 5
+
+    def test_cart_routes_with_memory_store(self, client, db, bike, memory_store, monkeypatch):
+        """
+        Prueba las rutas del carrito con el almacén en memoria
+        """
+        product, ids = bike
+        monkeypatch.setattr(cart_store, "store", memory_store)
+
+        added = client.post(
+            "/api/v1/cart/items",
+            json={"product_id": product.id, "selected_options": [ids["diamond"], ids["road"]]}
+        ).json()
+        client.put(f"/api/v1/cart/items/{added['cart_item_id']}", params={"quantity": 2})
+        response = client.get("/api/v1/cart", params={"query_cart_id": added["cart_id"]})
+
+        assert response.headers["X-DB-Queries"] == "0"
+        assert response.json()["item_count"] == 2
+        assert db.get(CartItem, added["cart_item_id"]).quantity == 1
+
+    def test_backend_selection(self, async_session_factory):
+        """
+        Prueba que el almacén se elige por configuración
+        """
+        assert isinstance(create_cart_store("sql"), SqlCartStore)
+        assert isinstance(create_cart_store("memory", async_session_factory), MemoryCartStore)
+        with pytest.raises(ValueError):
+            create_cart_store("redis")
+
+    def test_store_must_implement_every_operation(self):
+        """
+        Prueba que un almacén que no implementa todas las operaciones no se puede crear
+        """
+        class ReadOnlyCartStore(CartStore):
+            async def find_cart(self, db, cart_id, user_id=None):
+                return None
+
+        with pytest.raises(TypeError):
+            ReadOnlyCartStore()
@@ -0,0 +1,65 @@
+import pytest
+from app.services import rule_index
+from app.services.product_service import update_option_stock
+from app.services.compatibility_engine import CompatibilityEngine, get_engine
+
+
+class TestCompatibilityEngine:
+    """
+    Pruebas para el motor de compatibilidad basado en máscaras de bits
+    """
+
+    def test_masks(self, db, bike):
+        """
+        Prueba que las dependencias se compilan como máscaras por opción y tipo de parte
+        """
+        product, ids = bike
+        engine = CompatibilityEngine(rule_index.load_rule_index(db, product.id))
+
+        assert engine.requires_mask[ids["mountain"]] == engine.bits[ids["full_suspension"]]
+        assert engine.required_by_mask[ids["full_suspension"]] == engine.bits[ids["mountain"]]
+        assert engine.part_type_mask[ids["frame"]] == engine.mask_of([ids["full_suspension"], ids["diamond"]])
+
+    def test_validate_requires_other(self, db, bike, find_option):
+        """
+        Prueba que las opciones del tipo requerido distintas de la requerida son incompatibles
+        cuando la requerida no se puede auto-seleccionar
+        """
+        product, ids = bike
+        update_option_stock(db, ids["full_suspension"], False)
+        engine = CompatibilityEngine(rule_index.load_rule_index(db, product.id))
+
+        result = engine.validate([ids["mountain"]])
+
+        diamond = find_option(result, ids["diamond"])
+        assert diamond["is_compatible"] is False
+        assert diamond["compatibility_details"] == {
+            "reason": "requires_other",
+            "requiring_id": ids["mountain"],
+            "requiring_name": "Montaña",
+            "required_id": ids["full_suspension"],
+            "required_name": "Doble suspensión"
+        }
+        assert find_option(result, ids["full_suspension"])["availability_reason"] == "out_of_stock"
+        assert find_option(result, ids["road"])["availability_reason"] == "another_option_selected"
+
+    def test_available_options(self, db, bike):
+        """
+        Prueba que una opción cuyo requisito no está seleccionado no está disponible
+        """
+        product, ids = bike
+        engine = CompatibilityEngine(rule_index.load_rule_index(db, product.id))
+
+        wheels = engine.available_options([ids["diamond"]])[1]
+
+        compatibility = {option["id"]: option["is_compatible"] for option in wheels["options"]}
+        assert compatibility == {ids["mountain"]: False, ids["road"]: True}
+
+    def test_engine_is_cached_on_index(self, db, bike):
+        """
+        Prueba que el motor se compila una sola vez por índice
+        """
+        product, _ = bike
+        index = rule_index.get_rule_index(db, product.id)
+
+        assert get_engine(index) is get_engine(index)
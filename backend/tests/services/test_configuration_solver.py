@@ -0,0 +1,206 @@
+import pytest
+import random
+from itertools import product as cartesian_product
+from decimal import Decimal
+from fastapi import HTTPException
+from app.models.product import Product, PartType, PartOption, OptionDependency, ConditionalPrice, DependencyType
+from app.services import rule_index
+from app.services.configuration_solver import ConfigurationSolver, count_configurations, iter_configurations
+from app.services.product_service import update_option_stock, complete_configuration, price_selection
+
+
+def brute_force_configurations(index):
+    """
+    Enumera todas las combinaciones de una opción por tipo de parte y filtra las válidas
+    """
+    option_lists = [index.options_by_part_type[part_type_id] for part_type_id, _ in index.part_types]
+    option_lists = [option_ids for option_ids in option_lists if option_ids]
+    valid = []
+    for configuration in cartesian_product(*option_lists):
+        chosen = set(configuration)
+        if not all(index.options[option_id].in_stock for option_id in chosen):
+            continue
+        if any(target not in chosen for option_id in chosen for target in index.requires.get(option_id, ())):
+            continue
+        if any(target in chosen for option_id in chosen for target in index.excludes.get(option_id, ())):
+            continue
+        valid.append(list(configuration))
+    return valid
+
+
+class TestConfigurationSolver:
+    """
+    Pruebas para el recuento y la enumeración de configuraciones válidas
+    """
+
+    def test_count_and_enumerate(self, db, bike):
+        """
+        Prueba el recuento y la enumeración de la bicicleta
+        """
+        product, ids = bike
+
+        assert count_configurations(db, product.id) == 3
+        assert list(iter_configurations(db, product.id)) == [
+            [ids["full_suspension"], ids["mountain"]],
+            [ids["full_suspension"], ids["road"]],
+            [ids["diamond"], ids["road"]]
+        ]
+
+    def test_out_of_stock_options_are_skipped(self, db, bike):
+        """
+        Prueba que una opción sin stock elimina también las opciones que la requieren
+        """
+        product, ids = bike
+        update_option_stock(db, ids["full_suspension"], False)
+
+        assert list(iter_configurations(db, product.id)) == [[ids["diamond"], ids["road"]]]
+
+    def test_unknown_product(self, db):
+        """
+        Prueba que un producto inexistente no tiene solver
+        """
+        assert count_configurations(db, 999) is None
+        assert iter_configurations(db, 999) is None
+
+    def test_enumeration_is_lazy(self, db, bike):
+        """
+        Prueba que la enumeración no materializa todas las configuraciones
+        """
+        product, ids = bike
+
+        configurations = iter_configurations(db, product.id)
+
+        assert next(configurations) == [ids["full_suspension"], ids["mountain"]]
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_matches_brute_force(self, db, seed):
+        """
+        Prueba que el solver coincide con la enumeración exhaustiva en catálogos aleatorios
+        """
+        rnd = random.Random(seed)
+        product = Product(name="Aleatorio", category="test", base_price=Decimal("0"))
+        db.add(product)
+        db.flush()
+        options = []
+        for part_type_number in range(5):
+            part_type = PartType(name=f"Tipo {part_type_number}", product_id=product.id)
+            db.add(part_type)
+            db.flush()
+            for option_number in range(rnd.randint(1, 4)):
+                option = PartOption(
+                    name=f"Opción {part_type_number}.{option_number}",
+                    part_type_id=part_type.id,
+                    base_price=Decimal("10"),
+                    in_stock=rnd.random() > 0.1
+                )
+                db.add(option)
+                db.flush()
+                options.append(option)
+        for _ in range(len(options)):
+            source, target = rnd.sample(options, 2)
+            dependency_type = rnd.choice([DependencyType.requires, DependencyType.excludes])
+            db.add(OptionDependency(option_id=source.id, depends_on_option_id=target.id, type=dependency_type))
+        db.commit()
+
+        index = rule_index.load_rule_index(db, product.id)
+        solver = ConfigurationSolver(index)
+        expected = brute_force_configurations(index)
+
+        assert solver.count() == len(expected)
+        assert list(solver.configurations()) == expected
+
+
+class TestCheapestCompletion:
+    """
+    Pruebas para la configuración válida más barata que completa una selección
+    """
+
+    def test_cheapest_completion(self, db, bike):
+        """
+        Prueba que se elige la combinación más barata teniendo en cuenta los precios condicionales
+        """
+        product, ids = bike
+
+        result = complete_configuration(db, product.id)
+
+        assert result["options"] == [ids["diamond"], ids["road"]]
+        assert result["options_price"] == Decimal("170")
+        assert result["total_price"] == Decimal("670")
+        assert result["conditional_prices"][ids["road"]]["conditional_price"] == 70.0
+
+    def test_completion_keeps_selected_options(self, db, bike):
+        """
+        Prueba que la selección parcial se respeta y se completa con sus requisitos
+        """
+        product, ids = bike
+
+        result = complete_configuration(db, product.id, [ids["mountain"]])
+
+        assert result["options"] == [ids["full_suspension"], ids["mountain"]]
+        assert result["added_options"] == [ids["full_suspension"]]
+        assert result["total_price"] == Decimal("720")
+
+    def test_option_without_price_counts_as_free(self, db, bike):
+        """
+        Prueba que una opción sin precio base (NULL) cuenta como 0 al contar y completar
+        """
+        product, ids = bike
+        db.get(PartOption, ids["diamond"]).base_price = None
+        db.commit()
+
+        result = complete_configuration(db, product.id)
+
+        assert count_configurations(db, product.id) == 3
+        assert result["options"] == [ids["diamond"], ids["road"]]
+        assert result["options_price"] == Decimal("70")
+
+    def test_completion_without_valid_configuration(self, db, bike):
+        """
+        Prueba que una selección imposible de completar devuelve 400
+        """
+        product, ids = bike
+
+        with pytest.raises(HTTPException) as exc_info:
+            complete_configuration(db, product.id, [ids["mountain"], ids["diamond"]])
+
+        assert exc_info.value.status_code == 400
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_matches_brute_force(self, db, seed):
+        """
+        Prueba que el precio coincide con el de la mejor configuración de la enumeración exhaustiva
+        """
+        rnd = random.Random(seed)
+        product = Product(name="Aleatorio", category="test", base_price=Decimal("0"))
+        db.add(product)
+        db.flush()
+        options = []
+        for part_type_number in range(5):
+            part_type = PartType(name=f"Tipo {part_type_number}", product_id=product.id)
+            db.add(part_type)
+            db.flush()
+            for option_number in range(rnd.randint(1, 4)):
+                option = PartOption(
+                    name=f"Opción {part_type_number}.{option_number}",
+                    part_type_id=part_type.id,
+                    base_price=Decimal(rnd.randint(10, 200))
+                )
+                db.add(option)
+                db.flush()
+                options.append(option)
+        for _ in range(len(options)):
+            source, target = rnd.sample(options, 2)
+            dependency_type = rnd.choice([DependencyType.requires, DependencyType.excludes])
+            db.add(OptionDependency(option_id=source.id, depends_on_option_id=target.id, type=dependency_type))
+            source, condition = rnd.sample(options, 2)
+            db.add(ConditionalPrice(option_id=source.id, condition_option_id=condition.id, conditional_price=Decimal(rnd.randint(1, 200))))
+        db.commit()
+
+        index = rule_index.load_rule_index(db, product.id)
+        cheapest = ConfigurationSolver(index).cheapest_completion([])
+        prices = [price_selection(index, configuration)[0] for configuration in brute_force_configurations(index)]
+
+        if prices:
+            assert price_selection(index, cheapest)[0] == min(prices)
+        else:
+            assert cheapest is None
@@ -0,0 +1,113 @@
+import pytest
+import io
+import json
+import logging
+import threading
+from app.logging_config import configure_logging, shutdown_logging, get_logger, DebugSampler, APP_LOGGER
+
+
+@pytest.fixture
+def log_stream():
+    """Fixture que dirige los logs de la aplicación a un buffer y restaura la configuración al terminar"""
+    stream = io.StringIO()
+    yield stream
+    shutdown_logging()
+    app_logger = logging.getLogger(APP_LOGGER)
+    for handler in list(app_logger.handlers):
+        app_logger.removeHandler(handler)
+    app_logger.setLevel(logging.NOTSET)
+    app_logger.propagate = True
+
+
+def read_events(stream):
+    shutdown_logging()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestStructuredLogging:
+    """
+    Pruebas para el registro estructurado de la aplicación
+    """
+
+    def test_json_event_with_fields(self, log_stream):
+        """
+        Prueba que cada evento se escribe como una línea JSON con sus campos
+        """
+        configure_logging(level="INFO", log_format="json", stream=log_stream)
+
+        get_logger("app.services.cart_service").info("cart.item_added", cart_id=7, product_id=3)
+
+        [event] = read_events(log_stream)
+        assert event["event"] == "cart.item_added"
+        assert event["level"] == "INFO"
+        assert event["logger"] == "app.services.cart_service"
+        assert event["cart_id"] == 7 and event["product_id"] == 3
+
+    def test_debug_events_are_gated_by_level(self, log_stream):
+        """
+        Prueba que con nivel INFO los eventos de depuración no llegan a crearse
+        """
+        configure_logging(level="INFO", stream=log_stream)
+        logger = get_logger("app.services.product_service")
+
+        logger.debug("compatibility.validated", product_id=1)
+
+        assert not logger.is_enabled_for(logging.DEBUG)
+        assert read_events(log_stream) == []
+
+    def test_debug_events_are_sampled(self, log_stream):
+        """
+        Prueba que solo se escribe una fracción de los eventos de depuración
+        """
+        configure_logging(level="DEBUG", debug_sample_rate=0.25, stream=log_stream)
+        logger = get_logger("app.services.product_service")
+
+        for i in range(8):
+            logger.debug("compatibility.validated", product_id=i)
+        logger.warning("cart.invalid_cart_id", cart_id="abc")
+
+        events = read_events(log_stream)
+        assert [event["product_id"] for event in events if event["level"] == "DEBUG"] == [0, 4]
+        assert events[-1]["event"] == "cart.invalid_cart_id"
+
+    def test_exception_includes_traceback(self, log_stream):
+        """
+        Prueba que los errores registrados con exception incluyen la traza
+        """
+        configure_logging(level="INFO", stream=log_stream)
+
+        try:
+            raise ValueError("fallo")
+        except ValueError:
+            get_logger("app.api.routes.v1.products").exception("product.update_failed", product_id=1)
+
+        [event] = read_events(log_stream)
+        assert "ValueError: fallo" in event["exception"]
+
+    def test_sampler_disabled(self):
+        """
+        Prueba que una tasa cero descarta todos los eventos de depuración
+        """
+        sampler = DebugSampler(0)
+        record = logging.LogRecord("app", logging.DEBUG, __file__, 1, "evento", None, None)
+
+        assert sampler.filter(record) is False
+
+    def test_sampler_is_thread_safe(self):
+        """
+        Prueba que el muestreo deja pasar exactamente uno de cada intervalo con varios hilos
+        """
+        sampler = DebugSampler(0.1)
+        record = logging.LogRecord("app", logging.DEBUG, __file__, 1, "evento", None, None)
+        passed = []
+
+        def emit():
+            passed.append(sum(sampler.filter(record) for _ in range(10000)))
+
+        threads = [threading.Thread(target=emit) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sum(passed) == 8000
@@ -0,0 +1,62 @@
+import pytest
+from app import metrics
+from app.metrics import Histogram, MetricsRegistry
+
+
+class TestMetricsRegistry:
+    """
+    Pruebas para el registro de métricas en formato Prometheus
+    """
+
+    def test_histogram_buckets_are_cumulative(self):
+        """
+        Prueba que los buckets acumulan las observaciones e incluyen +Inf
+        """
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 20):
+            histogram.observe(value)
+
+        assert histogram.cumulative() == [("0.1", 1), ("1.0", 3), ("+Inf", 4)]
+        assert histogram.sum == pytest.approx(21.25)
+
+    def test_render_prometheus_text(self):
+        """
+        Prueba el formato de texto de las series por ruta y código de estado
+        """
+        registry = MetricsRegistry()
+        registry.request_started("POST", "/api/v1/products/calculate-price")
+        registry.request_finished("POST", "/api/v1/products/calculate-price", 200, 0.02, 3, 0.004)
+        registry.request_started("GET", "/api/v1/cart/items")
+
+        text = registry.render()
+
+        assert 'http_requests_in_flight{method="GET",route="/api/v1/cart/items"} 1' in text
+        assert 'http_requests_total{method="POST",route="/api/v1/products/calculate-price",status="200"} 1' in text
+        assert 'http_request_duration_seconds_bucket{method="POST",route="/api/v1/products/calculate-price",le="0.025"} 1' in text
+        assert 'http_request_duration_seconds_bucket{method="POST",route="/api/v1/products/calculate-price",le="0.01"} 0' in text
+        assert 'db_queries_total{method="POST",route="/api/v1/products/calculate-price"} 3' in text
+        assert "# TYPE http_request_duration_seconds histogram" in text
+
+
+class TestMetricsEndpoint:
+    """
+    Pruebas del endpoint /metrics
+    """
+
+    def test_metrics_per_route_template(self, client, bike):
+        """
+        Prueba que las peticiones se agrupan por plantilla de ruta y código de estado
+        """
+        product, _ = bike
+        metrics.registry.clear()
+        client.get(f"/api/v1/products/{product.id}")
+        client.get("/api/v1/products/999")
+        response = client.get("/metrics")
+
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+        assert 'http_requests_total{method="GET",route="/api/v1/products/{product_id}",status="200"} 1' in text
+        assert 'http_requests_total{method="GET",route="/api/v1/products/{product_id}",status="404"} 1' in text
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/v1/products/{product_id}"} 2' in text
+        assert 'http_requests_in_flight{method="GET",route="/metrics"} 1' in text
+        assert "db_pool_checked_out" in text
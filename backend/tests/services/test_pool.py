@@ -0,0 +1,87 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc
+from app.db.database import pool_options
+from app.db.pool import InstrumentedQueuePool, pool_health
+from app.main import app
+from app.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def small_pool(tmp_path):
+    """Fixture que crea un engine con un pool instrumentado de una sola conexión"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05
+    )
+    yield engine
+    engine.dispose()
+
+
+class TestInstrumentedPool:
+    """
+    Pruebas para las métricas y el estado del pool de conexiones
+    """
+
+    def test_exhaustion_and_timeout(self, small_pool):
+        """
+        Prueba que una petición con el pool agotado cuenta como agotamiento y timeout
+        y que mientras la conexión está en uso el pool no está listo
+        """
+        connection = small_pool.connect()
+        try:
+            with pytest.raises(exc.TimeoutError):
+                small_pool.connect()
+            health = pool_health(small_pool.pool)
+        finally:
+            connection.close()
+
+        stats = small_pool.pool.stats
+        assert stats.exhausted == 1 and stats.timeouts == 1 and stats.waiting == 0
+        assert stats.checkout_wait.count == 2
+        assert health == {"ready": False, "checked_out": 1, "capacity": 1, "saturation": 1.0, "waiting": 0}
+        assert pool_health(small_pool.pool)["ready"] is True
+
+    def test_stats_survive_dispose(self, small_pool):
+        """
+        Prueba que los contadores se conservan cuando el engine sustituye el pool
+        """
+        small_pool.connect().close()
+        small_pool.dispose()
+
+        assert small_pool.pool.stats.checkout_wait.count == 1
+
+    def test_metrics_include_pool_waits(self, small_pool):
+        """
+        Prueba que las métricas incluyen el histograma de espera y los agotamientos del pool
+        """
+        small_pool.connect().close()
+
+        text = MetricsRegistry().render(small_pool.pool)
+
+        assert "db_pool_checkout_wait_seconds_count 1" in text
+        assert 'db_pool_checkout_wait_seconds_bucket{le="+Inf"} 1' in text
+        assert "# TYPE db_pool_exhausted_total counter" in text
+        assert "db_pool_timeouts_total 0" in text
+
+    def test_pool_options(self):
+        """
+        Prueba que los parámetros del pool se aplican a Postgres y no a SQLite
+        """
+        assert pool_options("sqlite:///:memory:", InstrumentedQueuePool) == {}
+        options = pool_options("postgresql://user:pass@db:5432/marcusbikes", InstrumentedQueuePool)
+        assert options["poolclass"] is InstrumentedQueuePool
+        assert options["pool_size"] == 5 and options["max_overflow"] == 10 and options["pool_pre_ping"] is True
+
+    def test_readiness_endpoint(self):
+        """
+        Prueba que el endpoint de disponibilidad informa del estado del pool de la API
+        """
+        response = TestClient(app).get("/ready")
+
+        assert response.status_code == 200
+        assert response.json()["ready"] is True
+        assert response.json()["saturation"] == 0.0
@@ -0,0 +1,106 @@
+import pytest
+import random
+from decimal import Decimal
+from types import SimpleNamespace
+from app.models.product import PartOption
+from app.services.rule_index import ProductRuleIndex
+from app.services.pricing_engine import get_pricing_engine
+from app.services.price_matrix import get_price_matrix
+from app.services.product_service import get_available_options, configure_product
+
+
+def option_prices(options):
+    return {
+        option["id"]: (option["marginal_price"], option["price_delta"])
+        for part_type in options
+        for option in part_type["options"]
+    }
+
+
+class TestPriceMatrix:
+    """
+    Pruebas para los precios marginales de las opciones dada una selección
+    """
+
+    def test_marginal_prices_with_conditional_price(self, db, bike):
+        """
+        Prueba que el precio marginal aplica el precio condicional de la selección
+        """
+        product, ids = bike
+
+        prices = option_prices(get_available_options(db, product.id, [ids["diamond"]]))
+
+        assert prices[ids["road"]] == (Decimal("70"), Decimal("70"))
+        assert prices[ids["mountain"]] == (Decimal("90"), Decimal("90"))
+        assert prices[ids["full_suspension"]] == (Decimal("130"), Decimal("30"))
+        assert prices[ids["diamond"]] == (Decimal("100"), Decimal("0"))
+
+    def test_option_without_price_counts_as_free(self, db, bike):
+        """
+        Prueba que una opción sin precio base (NULL) tiene precio marginal 0
+        """
+        product, ids = bike
+        db.get(PartOption, ids["diamond"]).base_price = None
+        db.commit()
+
+        prices = option_prices(get_available_options(db, product.id, [ids["diamond"]]))
+
+        assert prices[ids["diamond"]] == (Decimal("0"), Decimal("0"))
+        assert prices[ids["full_suspension"]] == (Decimal("130"), Decimal("130"))
+
+    def test_swap_removes_conditional_price(self, db, bike):
+        """
+        Prueba que sustituir la condición de un precio condicional se refleja en la variación
+        """
+        product, ids = bike
+
+        result = configure_product(db, product.id, [ids["diamond"], ids["road"]])
+        prices = option_prices(result["options"])
+
+        # Doble suspensión cuesta 30 más que Diamante y Carretera pierde su descuento de 10
+        assert prices[ids["full_suspension"]] == (Decimal("130"), Decimal("40"))
+        assert prices[ids["mountain"]] == (Decimal("90"), Decimal("20"))
+        assert prices[ids["road"]] == (Decimal("70"), Decimal("0"))
+
+    def test_marginal_prices_match_pricing_engine(self):
+        """
+        Prueba con catálogos aleatorios que la variación coincide con recalcular el precio
+        """
+        for seed in range(50):
+            rnd = random.Random(seed)
+            part_types = [SimpleNamespace(id=10 + i, name=f"Tipo {i}") for i in range(rnd.randint(1, 4))]
+            options = []
+            for part_type in part_types:
+                for _ in range(rnd.randint(1, 4)):
+                    option_id = 100 + len(options)
+                    options.append(SimpleNamespace(
+                        id=option_id, name=f"Opción {option_id}", base_price=Decimal(rnd.randint(0, 200)),
+                        in_stock=True, part_type_id=part_type.id
+                    ))
+            option_ids = [option.id for option in options]
+            conditional_prices = [
+                SimpleNamespace(
+                    option_id=rnd.choice(option_ids), condition_option_id=rnd.choice(option_ids),
+                    conditional_price=Decimal(rnd.randint(0, 200))
+                )
+                for _ in range(rnd.randint(0, 20))
+            ]
+            index = ProductRuleIndex(
+                SimpleNamespace(id=1, name="Producto", base_price=Decimal("0"), catalog_version=0),
+                part_types, options, [], conditional_prices
+            )
+            pricing = get_pricing_engine(index)
+            selection = set(rnd.sample(option_ids, rnd.randint(0, len(part_types))))
+            total, _ = pricing.price(selection)
+
+            marginal_prices = get_price_matrix(index).marginal_prices(list(selection))
+
+            for option in options:
+                if option.id in selection:
+                    continue
+                swapped = {
+                    option_id for option_id in selection
+                    if index.options[option_id].part_type_id != option.part_type_id
+                } | {option.id}
+                swapped_total, _ = pricing.price(swapped)
+                assert marginal_prices[option.id] == (pricing.condition_for(option.id, swapped)[1], swapped_total - total)
@@ -0,0 +1,96 @@
+import pytest
+from decimal import Decimal
+from app.models.product import Product, PartType, PartOption, ConditionalPrice
+from app.services import rule_index, pricing_engine
+from app.services.pricing_engine import PricingEngine, get_pricing_engine
+from app.services.product_service import calculate_price, price_options
+
+
+class TestPricingEngine:
+    """
+    Pruebas para la tabla de precios base y condicionales
+    """
+
+    def test_lowest_conditional_price_id_wins(self, db, bike):
+        """
+        Prueba que con varias condiciones seleccionadas gana la regla de ID más bajo
+        """
+        product, ids = bike
+        db.add(ConditionalPrice(option_id=ids["road"], condition_option_id=ids["full_suspension"], conditional_price=Decimal("50")))
+        db.commit()
+
+        engine = get_pricing_engine(rule_index.get_rule_index(db, product.id))
+        total, applied = engine.price([ids["full_suspension"], ids["diamond"], ids["road"]])
+
+        assert total == Decimal("300")
+        assert applied[ids["road"]]["condition_option_id"] == ids["diamond"]
+
+    def test_duplicate_condition_keeps_first_rule(self):
+        """
+        Prueba que un par (opción, condición) repetido conserva la primera regla
+        """
+        engine = PricingEngine(
+            [(1, "Carretera", Decimal("80")), (2, "Diamante", Decimal("100"))],
+            [(1, 2, Decimal("70")), (1, 2, Decimal("10"))]
+        )
+
+        assert engine.price([1, 2]) == (Decimal("170"), {
+            1: {
+                "option_id": 1,
+                "option_name": "Carretera",
+                "base_price": 80.0,
+                "conditional_price": 70.0,
+                "condition_option_id": 2,
+                "condition_option_name": "Diamante"
+            }
+        })
+
+    def test_cached_product_prices_without_sql(self, db, bike, query_budget):
+        """
+        Prueba que con el índice en caché el precio se calcula sin consultas
+        """
+        product, ids = bike
+        rule_index.get_rule_index(db, product.id)
+
+        with query_budget(0) as stats:
+            total, applied = price_options(db, [ids["diamond"], ids["road"]])
+
+        assert stats.count == 0
+        assert total == Decimal("170")
+        assert applied[ids["road"]]["conditional_price"] == 70.0
+
+    def test_mixed_products_use_fixed_queries(self, db, bike, query_budget):
+        """
+        Prueba que una selección de varios productos se calcula con un número fijo de consultas
+        """
+        product, ids = bike
+        helmet = Product(name="Casco", category="helmets", base_price=Decimal("40"))
+        db.add(helmet)
+        db.flush()
+        size = PartType(name="Talla", product_id=helmet.id)
+        db.add(size)
+        db.flush()
+        sizes = [PartOption(name=f"Talla {i}", part_type_id=size.id, base_price=Decimal("10")) for i in range(5)]
+        db.add_all(sizes)
+        db.flush()
+        db.add(ConditionalPrice(option_id=sizes[0].id, condition_option_id=ids["road"], conditional_price=Decimal("5")))
+        db.commit()
+        selection = [ids["diamond"], ids["road"]] + [option.id for option in sizes]
+        rule_index.get_rule_index(db, product.id)
+
+        with query_budget(2) as stats:
+            total = calculate_price(db, selection)
+
+        assert stats.count == 2
+        assert total == Decimal("100") + Decimal("70") + Decimal("5") + 4 * Decimal("10")
+
+    def test_pricing_errors_are_not_priced_as_free(self, db, monkeypatch):
+        """
+        Prueba que un error al cargar la tabla de precios se propaga en lugar de devolver un precio de 0
+        """
+        def broken_pricing_engine(db, option_ids):
+            raise RuntimeError("tabla de precios inválida")
+        monkeypatch.setattr(pricing_engine, "load_pricing_engine", broken_pricing_engine)
+
+        with pytest.raises(RuntimeError):
+            price_options(db, [999])
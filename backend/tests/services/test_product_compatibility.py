@@ -39,9 +39,11 @@ class TestProductCompatibility:
         
         # Configurar comportamiento del mock
         mock_db.query.return_value.filter.return_value.first.return_value = mock_product
-        mock_db.query.return_value.filter.return_value.all.side_effect = [
+        mock_db.query.return_value.filter.return_value.order_by.return_value.all.side_effect = [
             [mock_part_type],  # part_types
-            [mock_option]      # options
+            [mock_option],     # options
+            [],                # dependencies
+            []                 # conditional_prices
         ]
         
         # Ejecutar función
@@ -108,42 +110,20 @@ class TestProductCompatibility:
         """
         # Configurar mocks
         mock_db = MagicMock()
-        mock_part_type = MagicMock()
-        mock_part_type.id = 1
-        mock_part_type.name = "CPU"
-        mock_part_type.product_id = 1
-        
-        mock_option1 = MagicMock()
-        mock_option1.id = 1
-        mock_option1.name = "Intel i7"
-        mock_option1.part_type_id = 1
-        
-        mock_option2 = MagicMock()
-        mock_option2.id = 2
-        mock_option2.name = "32GB RAM"
-        mock_option2.part_type_id = 2
-        
         mock_dependency = MagicMock()
         mock_dependency.option_id = 1
         mock_dependency.depends_on_option_id = 2
         mock_dependency.type = DependencyType.requires
         
-        # Configurar comportamiento de los mocks
-        mock_db.query.return_value.filter.return_value.all.side_effect = [
-            [mock_part_type],  # part_types
-            [mock_option1],    # options for part_type
-            [mock_dependency]  # dependencies
-        ]
-        
-        mock_db.query.return_value.filter.return_value.first.side_effect = [
-            mock_option1,  # option
-            mock_option2   # depends_on
-        ]
+        # Configurar comportamiento de los mocks: una sola consulta con join a opciones y tipos de parte
+        dependencies_query = mock_db.query.return_value.join.return_value.join.return_value.filter.return_value
+        dependencies_query.order_by.return_value.all.return_value = [mock_dependency]
         
         # Ejecutar función
         result = get_product_dependencies(mock_db, 1)
         
         # Verificaciones
+        mock_db.query.assert_called_once_with(OptionDependency)
         assert len(result) == 1
         assert result[0].option_id == 1
         assert result[0].depends_on_option_id == 2 
\ No newline at end of file
@@ -0,0 +1,79 @@
+import pytest
+from decimal import Decimal
+from fastapi import HTTPException
+from app.services import result_cache
+from app.services.product_service import configure_product, calculate_price, validate_compatibility, get_available_options
+
+
+class TestProductConfiguration:
+    """
+    Pruebas para la configuración de productos en una sola llamada
+    """
+
+    def test_configure_product_matches_individual_calls(self, db, bike):
+        """
+        Prueba que configure_product devuelve lo mismo que las llamadas por separado
+        """
+        product, ids = bike
+        selection = [ids["diamond"], ids["road"]]
+
+        result = configure_product(db, product.id, selection)
+
+        assert result["product_id"] == product.id
+        assert result["options"] == get_available_options(db, product.id, selection)
+        assert result["compatibility"] == validate_compatibility(db, product.id, selection)
+        assert result["total_price"] == calculate_price(db, selection) == Decimal("170")
+
+    def test_configure_product_uses_validation_cache(self, db, bike):
+        """
+        Prueba que configure_product valida igual que validate_compatibility sin depender del
+        orden de la selección y reutiliza su caché de resultados
+        """
+        product, ids = bike
+        result_cache.clear()
+
+        compatibility = validate_compatibility(db, product.id, [ids["full_suspension"], ids["mountain"], ids["diamond"]])
+        result = configure_product(db, product.id, [ids["diamond"], ids["mountain"], ids["full_suspension"], ids["diamond"]])
+
+        assert result["compatibility"] is compatibility
+        assert result_cache.validation_cache.stats()["hits"] == 1
+
+    def test_configure_product_conditional_prices(self, db, bike):
+        """
+        Prueba que se informan los precios condicionales aplicados
+        """
+        product, ids = bike
+
+        result = configure_product(db, product.id, [ids["diamond"], ids["road"]])
+
+        assert result["conditional_prices"] == {
+            ids["road"]: {
+                "option_id": ids["road"],
+                "option_name": "Carretera",
+                "base_price": 80.0,
+                "conditional_price": 70.0,
+                "condition_option_id": ids["diamond"],
+                "condition_option_name": "Diamante"
+            }
+        }
+
+    def test_configure_product_without_selection(self, db, bike):
+        """
+        Prueba la configuración sin opciones seleccionadas
+        """
+        product, _ = bike
+
+        result = configure_product(db, product.id)
+
+        assert result["total_price"] == Decimal("0")
+        assert result["conditional_prices"] == {}
+        assert len(result["compatibility"]["product"]["components"]) == 2
+
+    def test_configure_unknown_product(self, db):
+        """
+        Prueba que un producto inexistente devuelve 404
+        """
+        with pytest.raises(HTTPException) as exc_info:
+            configure_product(db, 999, [])
+
+        assert exc_info.value.status_code == 404
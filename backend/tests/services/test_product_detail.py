@@ -0,0 +1,88 @@
+import pytest
+import json
+from decimal import Decimal
+from app.models.product import PartType, PartOption, OptionDependency, DependencyType
+from app.schemas.product import ProductCreate
+from app.services.product_service import get_product, get_product_detail_json, update_product
+
+
+class TestProductDetail:
+    """
+    Pruebas para la carga y serialización del detalle de producto
+    """
+
+    def test_get_product_query_count_is_fixed(self, db, bike, query_budget):
+        """
+        Prueba que el número de consultas no depende del tamaño del catálogo
+        """
+        product, ids = bike
+        product_id = product.id
+        db.expunge_all()
+        with query_budget(5) as stats:
+            get_product(db, product_id)
+        small_catalog_queries = stats.count
+        db.expunge_all()
+
+        saddle = PartType(name="Sillín", product_id=product_id)
+        db.add(saddle)
+        db.flush()
+        for i in range(5):
+            option = PartOption(name=f"Sillín {i}", part_type_id=saddle.id, base_price=Decimal("20"))
+            db.add(option)
+            db.flush()
+            db.add(OptionDependency(option_id=option.id, depends_on_option_id=ids["diamond"], type=DependencyType.excludes))
+        db.commit()
+        db.expunge_all()
+
+        with query_budget(5) as stats:
+            loaded = get_product(db, product_id)
+            [dep.type for pt in loaded.part_types for option in pt.options for dep in option.dependencies]
+
+        assert stats.count == small_catalog_queries
+
+    def test_get_product_does_not_dirty_session(self, db, bike):
+        """
+        Prueba que cargar el detalle no modifica los objetos ORM
+        """
+        product, _ = bike
+
+        loaded = get_product(db, product.id)
+
+        dependencies = [dep for pt in loaded.part_types for option in pt.options for dep in option.dependencies]
+        assert dependencies[0].type == DependencyType.requires
+        assert not db.dirty
+
+    def test_product_detail_json(self, db, bike):
+        """
+        Prueba que el detalle serializado incluye dependencias con el tipo como texto
+        """
+        product, ids = bike
+
+        detail = json.loads(get_product_detail_json(db, product.id))
+
+        wheels = detail["part_types"][1]
+        mountain = next(option for option in wheels["options"] if option["id"] == ids["mountain"])
+        assert mountain["dependencies"][0]["type"] == "requires"
+        assert detail["base_price"] == "500.00"
+
+    def test_product_detail_json_cached_per_version(self, db, bike, query_budget):
+        """
+        Prueba que las lecturas repetidas no consultan la base de datos hasta que cambia el producto
+        """
+        product, _ = bike
+        first = get_product_detail_json(db, product.id)
+
+        with query_budget(0) as stats:
+            second = get_product_detail_json(db, product.id)
+
+        assert second is first
+        assert stats.count == 0
+
+        update_product(db, product.id, ProductCreate(name="Bicicleta Pro", category="bikes"))
+        assert json.loads(get_product_detail_json(db, product.id))["name"] == "Bicicleta Pro"
+
+    def test_product_detail_json_unknown_product(self, db):
+        """
+        Prueba que un producto inexistente no devuelve detalle
+        """
+        assert get_product_detail_json(db, 999) is None
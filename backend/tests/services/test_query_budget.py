@@ -0,0 +1,119 @@
+import pytest
+from decimal import Decimal
+from app.db import query_stats
+from app.models.cart import Cart
+from app.models.product import PartType, PartOption, OptionDependency, DependencyType, ConditionalPrice
+from app.services import product_service, cart_service
+
+
+@pytest.fixture
+def large_bike(db, bike):
+    """
+    Fixture que amplía la bicicleta con un tipo de parte de veinte sillines, cada uno con
+    una exclusión y un precio condicional, para que un patrón N+1 supere el presupuesto
+    """
+    product, ids = bike
+    product_id = product.id
+    saddle = PartType(name="Sillín", product_id=product_id)
+    db.add(saddle)
+    db.flush()
+    saddles = []
+    for i in range(20):
+        option = PartOption(name=f"Sillín {i}", part_type_id=saddle.id, base_price=Decimal("20"))
+        db.add(option)
+        db.flush()
+        db.add(OptionDependency(option_id=option.id, depends_on_option_id=ids["mountain"], type=DependencyType.excludes))
+        db.add(ConditionalPrice(option_id=option.id, condition_option_id=ids["diamond"], conditional_price=Decimal("15")))
+        saddles.append(option.id)
+    db.commit()
+    ids = {**ids, "saddles": saddles}
+    db.expunge_all()
+    return product_id, ids
+
+
+class TestQueryBudget:
+    """
+    Pruebas del número máximo de sentencias SQL de las funciones de servicio principales
+    """
+
+    def test_product_reads(self, db, large_bike, query_budget):
+        """
+        Prueba que leer el producto y validar una selección no depende del tamaño del catálogo
+        """
+        product_id, ids = large_bike
+        selection = [ids["diamond"], ids["road"], ids["saddles"][0]]
+
+        with query_budget(5):
+            product_service.get_product(db, product_id)
+        with query_budget(5):
+            product_service.validate_compatibility(db, product_id, selection)
+        with query_budget(1):
+            product_service.get_product_dependencies(db, product_id)
+        with query_budget(0):
+            product_service.get_available_options(db, product_id, selection)
+            product_service.configure_product(db, product_id, selection)
+            product_service.validate_selections(db, [(product_id, selection), (product_id, [ids["mountain"]])])
+
+    def test_price_without_cached_index(self, db, large_bike, query_budget):
+        """
+        Prueba que calcular el precio sin índice en caché usa un número fijo de sentencias
+        """
+        _, ids = large_bike
+
+        with query_budget(7):
+            total = product_service.calculate_price(db, [ids["diamond"], ids["road"]] + ids["saddles"])
+
+        assert total == Decimal("170") + 20 * Decimal("15")
+
+    def test_add_to_cart(self, db, large_bike, query_budget):
+        """
+        Prueba que añadir al carrito una configuración grande usa un número acotado de sentencias
+        """
+        product_id, ids = large_bike
+        cart = Cart()
+        db.add(cart)
+        db.commit()
+        cart_id = cart.id
+
+        with query_budget(8):
+            cart_service.add_to_cart(db, cart_id, product_id, [ids["diamond"], ids["road"], ids["saddles"][0]])
+        # Con el índice en caché solo quedan el INSERT del ítem, el de sus opciones y la
+        # actualización de la última actividad del carrito
+        with query_budget(3):
+            cart_service.add_to_cart(db, cart_id, product_id, [ids["diamond"], ids["road"], ids["saddles"][1]])
+
+
+class TestQueryStatsMiddleware:
+    """
+    Pruebas de las cabeceras y métricas de sentencias SQL por petición
+    """
+
+    def test_response_headers_and_route_stats(self, client, bike):
+        """
+        Prueba que cada respuesta informa de sus sentencias SQL y se acumulan por ruta
+        """
+        product, _ = bike
+        query_stats.route_stats.clear()
+        response = client.get(f"/api/v1/products/{product.id}")
+        stats = client.get("/api/v1/admin/db/stats").json()
+
+        assert response.status_code == 200
+        assert int(response.headers["X-DB-Queries"]) > 0
+        assert float(response.headers["X-DB-Time-ms"]) >= 0
+        route = stats["GET /api/v1/products/{product_id}"]
+        assert route["requests"] == 1
+        assert route["queries"] == int(response.headers["X-DB-Queries"])
+
+    def test_warm_option_routes_run_no_queries(self, client, bike):
+        """
+        Prueba que con el índice de reglas en caché las rutas de opciones y configuración no consultan la base de datos
+        """
+        product, ids = bike
+        client.get(f"/api/v1/products/{product.id}/options")
+
+        options = client.get(f"/api/v1/products/{product.id}/options", params={"current_selection": [ids["diamond"]]})
+        configure = client.post(f"/api/v1/products/{product.id}/configure", json={"selected_options": [ids["diamond"]]})
+
+        assert options.status_code == 200 and options.headers["X-DB-Queries"] == "0"
+        assert configure.status_code == 200 and configure.headers["X-DB-Queries"] == "0"
+        assert client.get("/api/v1/products/999/options").status_code == 404
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.database import ReadOnlySession, read_only_bind
+from app.models.product import Product
+from app.schemas.product import OptionDependency as OptionDependencySchema
+from app.services import product_service
+
+
+class TestReadOnlySession:
+    """
+    Pruebas para las sesiones de solo lectura de las rutas GET
+    """
+
+    def test_dependencies_do_not_dirty_the_session(self, db, bike):
+        """
+        Prueba que leer las dependencias no modifica los objetos cargados y que el tipo
+        se convierte a string al serializar
+        """
+        product, _ = bike
+
+        dependencies = product_service.get_product_dependencies(db, product.id)
+
+        assert not db.dirty
+        assert OptionDependencySchema.model_validate(dependencies[0], from_attributes=True).model_dump(mode="json")["type"] == "requires"
+
+    def test_flush_is_rejected(self, db, bike):
+        """
+        Prueba que una sesión de solo lectura no llega a escribir un objeto modificado
+        """
+        product, _ = bike
+        session = sessionmaker(bind=db.get_bind(), class_=ReadOnlySession, autoflush=False)()
+        try:
+            loaded = session.get(Product, product.id)
+            loaded.name = "Otro nombre"
+
+            with pytest.raises(exc.InvalidRequestError):
+                session.commit()
+        finally:
+            session.close()
+
+        db.expire_all()
+        assert db.get(Product, product.id).name == "Bicicleta"
+
+    def test_read_only_transactions_on_postgres(self):
+        """
+        Prueba que en Postgres las transacciones de solo lectura se abren como READ ONLY
+        """
+        postgres = create_async_engine("postgresql+asyncpg://user:pass@db:5432/marcusbikes")
+        sqlite = create_async_engine("sqlite+aiosqlite://")
+
+        assert read_only_bind(postgres).sync_engine.get_execution_options()["postgresql_readonly"] is True
+        assert read_only_bind(sqlite) is sqlite
+
+    def test_admin_dependencies_route(self, client, bike):
+        """
+        Prueba que la ruta de dependencias devuelve el tipo como string con una sesión de solo lectura
+        """
+        product, ids = bike
+
+        response = client.get(f"/api/v1/admin/products/{product.id}/dependencies")
+
+        assert response.status_code == 200
+        assert response.json() == [{
+            "depends_on_option_id": ids["full_suspension"],
+            "type": "requires",
+            "id": response.json()[0]["id"],
+            "option_id": ids["mountain"]
+        }]
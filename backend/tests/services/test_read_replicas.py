@@ -0,0 +1,148 @@
+import pytest
+from sqlalchemy import create_engine, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from app.db import database
+from app.db.database import Base, ReadReplicaRouter, get_read_db
+from app.models.product import Product
+from app.services import catalog_version, result_cache, rule_index
+from app.services.product_service import get_product_detail_json
+
+
+def sqlite_factory(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    return async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+@pytest.fixture
+def replica_files(tmp_path):
+    """
+    Fixture que crea una base de datos principal y dos réplicas en ficheros SQLite, cada
+    una con un producto cuyo nombre identifica la base de datos
+    """
+    paths = {}
+    for name in ("principal", "replica-1", "replica-2"):
+        path = tmp_path / f"{name}.db"
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO products (name, category) VALUES (:name, 'bikes')"), {"name": name})
+        engine.dispose()
+        paths[name] = path
+    return paths
+
+
+async def database_name(session):
+    return (await session.execute(text("SELECT name FROM products"))).scalar_one()
+
+
+class TestReadReplicaRouter:
+    """
+    Pruebas para el reparto de las lecturas entre réplicas
+    """
+
+    @pytest.mark.anyio
+    async def test_round_robin(self, replica_files):
+        """
+        Prueba que las lecturas se reparten entre las réplicas por turnos
+        """
+        router = ReadReplicaRouter(
+            sqlite_factory(replica_files["principal"]),
+            [sqlite_factory(replica_files["replica-1"]), sqlite_factory(replica_files["replica-2"])]
+        )
+
+        names = []
+        for _ in range(4):
+            session = await router.open_session()
+            names.append(await database_name(session))
+            await session.close()
+
+        assert names == ["replica-1", "replica-2", "replica-1", "replica-2"]
+
+    @pytest.mark.anyio
+    async def test_fallback_when_replica_is_down(self, replica_files, tmp_path):
+        """
+        Prueba que una réplica caída se aparta y que sin réplicas disponibles se lee de la principal
+        """
+        router = ReadReplicaRouter(
+            sqlite_factory(replica_files["principal"]),
+            [sqlite_factory(tmp_path / "no-existe" / "replica.db"), sqlite_factory(replica_files["replica-2"])]
+        )
+
+        first = await router.open_session()
+        second = await router.open_session()
+        assert await database_name(first) == "replica-2"
+        assert await database_name(second) == "replica-2"
+        await first.close()
+        await second.close()
+
+        router.mark_unavailable(1)
+        session = await router.open_session()
+        assert await database_name(session) == "principal"
+        await session.close()
+
+    @pytest.mark.anyio
+    async def test_reads_pinned_to_primary_after_write(self, replica_files):
+        """
+        Prueba que tras una escritura del catálogo las lecturas van a la principal
+        """
+        router = ReadReplicaRouter(
+            sqlite_factory(replica_files["principal"]),
+            [sqlite_factory(replica_files["replica-1"])],
+            pin_after_write=60
+        )
+
+        router.pin_to_primary()
+        session = await router.open_session()
+
+        assert await database_name(session) == "principal"
+        await session.close()
+
+    def test_catalog_reads_use_replica(self, client, bike, replica_files, monkeypatch):
+        """
+        Prueba que las rutas de lectura del catálogo usan la réplica, que las escrituras usan
+        la principal y que las lecturas posteriores a una escritura van a la principal
+        """
+        client.app.dependency_overrides.pop(get_read_db)
+        monkeypatch.setattr(database, "read_router", ReadReplicaRouter(
+            sqlite_factory(replica_files["principal"]),
+            [sqlite_factory(replica_files["replica-1"])]
+        ))
+
+        products = client.get("/api/v1/products/").json()
+        created = client.post("/api/v1/products/", json={"name": "Patinete", "category": "scooters"})
+        after_write = client.get("/api/v1/products/").json()
+
+        assert [product["name"] for product in products["items"]] == ["replica-1"]
+        assert created.status_code == 200 and created.json()["name"] == "Patinete"
+        assert [product["name"] for product in after_write["items"]] == ["principal"]
+
+
+class TestLaggingReplica:
+    """
+    Pruebas de las lecturas de una réplica que aún no ha recibido la última escritura
+    """
+
+    def test_stale_reads_are_not_cached(self, db, bike, query_budget):
+        """
+        Prueba que lo leído con una versión anterior a la conocida no se guarda en caché
+        y que se guarda en cuanto la réplica se pone al día
+        """
+        product, _ = bike
+        # Este proceso ya conoce la versión siguiente, escrita en la principal
+        catalog_version.record_catalog_version(product.id, product.catalog_version + 1)
+
+        stale = rule_index.get_rule_index(db, product.id)
+        assert stale.version == product.catalog_version
+        assert rule_index.get_rule_index(db, product.id) is not stale
+        assert get_product_detail_json(db, product.id) is not None
+        assert result_cache.product_detail_cache.stats()["size"] == 0
+
+        db.execute(update(Product).where(Product.id == product.id).values(catalog_version=Product.catalog_version + 1))
+        db.commit()
+        current = rule_index.get_rule_index(db, product.id)
+        get_product_detail_json(db, product.id)
+
+        with query_budget(0):
+            assert rule_index.get_rule_index(db, product.id) is current
+            get_product_detail_json(db, product.id)
@@ -0,0 +1,142 @@
+import pytest
+from decimal import Decimal
+from app.models.product import PartType, PartOption, OptionDependency, DependencyType
+from app.services import rule_index
+from app.services.compatibility_engine import CompatibilityEngine
+from app.models.cart import Cart
+from app.services.product_service import validate_compatibility, update_option_stock, configure_product
+from app.services.cart_service import add_to_cart
+
+
+@pytest.fixture
+def saddle_chain(db, bike):
+    """
+    Fixture que añade un sillín a la bicicleta de modo que la doble suspensión requiere
+    el sillín de gel, formando la cadena montaña -> doble suspensión -> gel.
+    """
+    product, ids = bike
+    saddle = PartType(name="Sillín", product_id=product.id)
+    db.add(saddle)
+    db.flush()
+
+    gel = PartOption(name="Gel", part_type_id=saddle.id, base_price=Decimal("40"))
+    racing = PartOption(name="Carreras", part_type_id=saddle.id, base_price=Decimal("30"))
+    db.add_all([gel, racing])
+    db.flush()
+
+    db.add(OptionDependency(option_id=ids["full_suspension"], depends_on_option_id=gel.id, type=DependencyType.requires))
+    db.commit()
+
+    return product, dict(ids, gel=gel.id, racing=racing.id)
+
+
+class TestRequiresClosure:
+    """
+    Pruebas para el cierre transitivo de dependencias requires
+    """
+
+    def test_closure_is_precomputed(self, db, saddle_chain):
+        """
+        Prueba que el cierre de cada opción se calcula al compilar el motor
+        """
+        product, ids = saddle_chain
+        engine = CompatibilityEngine(rule_index.load_rule_index(db, product.id))
+
+        assert engine.closure_order[ids["mountain"]] == [ids["full_suspension"], ids["gel"]]
+        assert engine.closure_mask[ids["full_suspension"]] == engine.bits[ids["gel"]]
+        assert ids["gel"] not in engine.closure_order
+
+    def test_closure_with_cycle(self, db, saddle_chain):
+        """
+        Prueba que los ciclos de requires no incluyen a la propia opción en su cierre
+        """
+        product, ids = saddle_chain
+        db.add(OptionDependency(option_id=ids["gel"], depends_on_option_id=ids["mountain"], type=DependencyType.requires))
+        db.commit()
+
+        engine = CompatibilityEngine(rule_index.load_rule_index(db, product.id))
+
+        assert engine.closure_order[ids["gel"]] == [ids["mountain"], ids["full_suspension"]]
+
+    def test_validate_auto_selects_full_chain(self, db, saddle_chain, find_option):
+        """
+        Prueba que una sola validación auto-selecciona toda la cadena de requires
+        """
+        product, ids = saddle_chain
+
+        result = validate_compatibility(db, product.id, [ids["mountain"]])
+
+        assert result["auto_selected_options"] == [ids["full_suspension"], ids["gel"]]
+        mountain = find_option(result, ids["mountain"])
+        assert "requires_additional_selection" not in mountain
+        gel = find_option(result, ids["gel"])
+        assert gel["selected"] is True
+        assert gel["auto_selected"] is True
+        assert gel["required_by"] == [{"option_id": ids["full_suspension"], "option_name": "Doble suspensión"}]
+        assert find_option(result, ids["racing"])["availability_reason"] == "another_option_selected"
+
+    def test_validate_reports_conflict_in_chain(self, db, saddle_chain, find_option):
+        """
+        Prueba que un conflicto al final de la cadena se informa en la opción seleccionada
+        """
+        product, ids = saddle_chain
+        update_option_stock(db, ids["gel"], False)
+
+        result = validate_compatibility(db, product.id, [ids["mountain"]])
+
+        assert result["auto_selected_options"] == []
+        mountain = find_option(result, ids["mountain"])
+        assert mountain["requires_additional_selection"] is True
+        assert mountain["compatibility_details"] == {
+            "reason": "requires",
+            "dependency_id": ids["full_suspension"],
+            "dependency_name": "Doble suspensión",
+            "chain_conflict": {
+                "option_id": ids["gel"],
+                "option_name": "Gel",
+                "reason": "out_of_stock"
+            }
+        }
+
+    def test_validate_reports_part_type_conflict_in_chain(self, db, saddle_chain, find_option):
+        """
+        Prueba que una opción de la cadena cuyo tipo de parte ya está seleccionado es un conflicto
+        """
+        product, ids = saddle_chain
+
+        result = validate_compatibility(db, product.id, [ids["mountain"], ids["racing"]])
+
+        chain_conflict = find_option(result, ids["mountain"])["compatibility_details"]["chain_conflict"]
+        assert chain_conflict == {
+            "option_id": ids["gel"],
+            "option_name": "Gel",
+            "reason": "another_option_selected",
+            "dependency_id": ids["racing"],
+            "dependency_name": "Carreras"
+        }
+
+    def test_configure_prices_auto_selected_options(self, db, saddle_chain):
+        """
+        Prueba que el precio de la configuración incluye las opciones auto-seleccionadas
+        """
+        product, ids = saddle_chain
+
+        result = configure_product(db, product.id, [ids["mountain"]])
+
+        assert result["total_price"] == Decimal("260")
+
+    def test_add_to_cart_stores_auto_selected_options(self, db, saddle_chain):
+        """
+        Prueba que el ítem del carrito guarda la configuración completa
+        """
+        product, ids = saddle_chain
+        cart = Cart()
+        db.add(cart)
+        db.commit()
+
+        cart_item = add_to_cart(db, cart.id, product.id, [ids["mountain"]])
+
+        assert sorted(option.part_option_id for option in cart_item.options) == sorted(
+            [ids["mountain"], ids["full_suspension"], ids["gel"]]
+        )
+        assert cart_item.price_snapshot == Decimal("760")
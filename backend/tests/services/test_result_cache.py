@@ -0,0 +1,81 @@
+import pytest
+from decimal import Decimal
+from app.schemas.product import ConditionalPriceCreate
+from app.services import result_cache, catalog_version
+from app.services.result_cache import LRUCache
+from app.services.product_service import (
+    validate_compatibility,
+    calculate_price,
+    update_option_stock,
+    create_conditional_price
+)
+
+
+class TestLRUCache:
+    """
+    Pruebas para la caché LRU de resultados
+    """
+
+    def test_eviction_order_and_counters(self):
+        """
+        Prueba que se expulsa la entrada menos usada y se cuentan aciertos, fallos y expulsiones
+        """
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+        assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1, "evictions": 1}
+
+
+class TestResultCache:
+    """
+    Pruebas para la caché de validate_compatibility y calculate_price
+    """
+
+    def test_validation_is_cached_per_selection_set(self, db, bike):
+        """
+        Prueba que la misma selección en otro orden reutiliza el resultado en caché
+        """
+        product, ids = bike
+
+        first = validate_compatibility(db, product.id, [ids["diamond"], ids["road"]])
+        second = validate_compatibility(db, product.id, [ids["road"], ids["diamond"]])
+
+        assert second is first
+        assert result_cache.validation_cache.stats()["hits"] == 1
+
+    def test_stock_update_bumps_catalog_version(self, db, bike):
+        """
+        Prueba que actualizar el stock invalida la validación en caché del producto
+        """
+        product, ids = bike
+        version = catalog_version.get_catalog_version(db, product.id)
+        validate_compatibility(db, product.id, [ids["diamond"]])
+
+        update_option_stock(db, ids["mountain"], False)
+        result = validate_compatibility(db, product.id, [ids["diamond"]])
+
+        assert catalog_version.get_catalog_version(db, product.id) > version
+        wheels = result["product"]["components"][1]
+        mountain = next(option for option in wheels["options"] if option["id"] == ids["mountain"])
+        assert mountain["availability_reason"] == "out_of_stock"
+
+    def test_conditional_price_bumps_catalog_version(self, db, bike):
+        """
+        Prueba que crear un precio condicional invalida el precio en caché
+        """
+        product, ids = bike
+        assert calculate_price(db, [ids["full_suspension"], ids["road"]]) == Decimal("210")
+
+        create_conditional_price(
+            db,
+            ConditionalPriceCreate(condition_option_id=ids["full_suspension"], conditional_price=Decimal("60")),
+            option_id=ids["road"]
+        )
+
+        assert calculate_price(db, [ids["full_suspension"], ids["road"]]) == Decimal("190")
+        assert result_cache.price_cache.stats()["hits"] == 0
@@ -0,0 +1,84 @@
+import pytest
+from decimal import Decimal
+from sqlalchemy import update
+from app.models.product import Product, PartOption, DependencyType
+from app.schemas.product import OptionDependencyCreate
+from app.services import rule_index, catalog_version
+from app.services.product_service import validate_compatibility, create_option_dependency
+
+
+class TestRuleIndex:
+    """
+    Pruebas para el índice compilado de reglas por producto
+    """
+
+    def test_load_rule_index(self, db, bike):
+        """
+        Prueba que el índice contiene opciones, adyacencia y precios condicionales
+        """
+        product, ids = bike
+
+        index = rule_index.load_rule_index(db, product.id)
+
+        assert index.product_name == "Bicicleta"
+        assert [name for _, name in index.part_types] == ["Cuadro", "Ruedas"]
+        assert index.requires[ids["mountain"]] == [ids["full_suspension"]]
+        assert index.dependents[ids["full_suspension"]] == [(ids["mountain"], DependencyType.requires)]
+        assert index.conditional_prices[ids["road"]] == [(ids["diamond"], Decimal("70"))]
+
+    def test_load_rule_index_unknown_product(self, db):
+        """
+        Prueba que un producto inexistente no genera índice
+        """
+        assert rule_index.load_rule_index(db, 999) is None
+
+    def test_validate_compatibility_uses_cached_index(self, db, bike, query_budget):
+        """
+        Prueba que una validación con el índice en caché no ejecuta SQL
+        """
+        product, ids = bike
+        validate_compatibility(db, product.id, [ids["mountain"]])
+
+        with query_budget(0) as stats:
+            result = validate_compatibility(db, product.id, [ids["mountain"]])
+
+        assert stats.count == 0
+        assert result["auto_selected_options"] == [ids["full_suspension"]]
+
+    def test_write_invalidates_index(self, db, bike):
+        """
+        Prueba que crear una dependencia descarta el índice compilado del producto
+        """
+        product, ids = bike
+        validate_compatibility(db, product.id, [ids["road"]])
+
+        create_option_dependency(
+            db,
+            OptionDependencyCreate(depends_on_option_id=ids["diamond"], type="excludes"),
+            option_id=ids["road"]
+        )
+        result = validate_compatibility(db, product.id, [ids["road"], ids["diamond"]])
+
+        frame = result["product"]["components"][0]
+        diamond = next(option for option in frame["options"] if option["id"] == ids["diamond"])
+        assert diamond["compatibility_details"]["reason"] == "excluded_by"
+
+    def test_write_from_another_process_is_seen_after_ttl(self, db, bike, monkeypatch):
+        """
+        Prueba que la versión del catálogo se lee de la base de datos, de modo que una
+        escritura de otro proceso invalida el índice en caché pasado el tiempo de vida
+        """
+        product, ids = bike
+        first = rule_index.get_rule_index(db, product.id)
+
+        # Otro worker desactiva una opción e incrementa la versión sin pasar por este proceso
+        db.execute(update(PartOption).where(PartOption.id == ids["road"]).values(in_stock=False))
+        db.execute(update(Product).where(Product.id == product.id).values(catalog_version=Product.catalog_version + 1))
+        db.commit()
+        assert rule_index.get_rule_index(db, product.id) is first
+
+        monkeypatch.setattr(catalog_version, "CATALOG_VERSION_TTL_SECONDS", 0)
+        index = rule_index.get_rule_index(db, product.id)
+
+        assert index is not first and index.version == first.version + 1
+        assert index.options[ids["road"]].in_stock is False
@@ -0,0 +1,104 @@
+import pytest
+import random
+from decimal import Decimal
+from types import SimpleNamespace
+from app.models.product import DependencyType
+from app.services.rule_index import ProductRuleIndex
+from app.services.compatibility_engine import get_engine
+from app.services.what_if import get_what_if_evaluator
+from app.services.product_service import get_available_options
+
+
+def option_consequences(options):
+    return {
+        option["id"]: option
+        for part_type in options
+        for option in part_type["options"]
+    }
+
+
+class TestWhatIf:
+    """
+    Pruebas para las consecuencias de elegir cada opción no seleccionada
+    """
+
+    def test_requires_chain_is_auto_selected(self, db, bike):
+        """
+        Prueba que una opción con requires informa de las opciones que arrastra
+        """
+        product, ids = bike
+
+        options = option_consequences(get_available_options(db, product.id, []))
+
+        assert options[ids["mountain"]]["valid_if_selected"] is True
+        assert options[ids["mountain"]]["auto_selects"] == [ids["full_suspension"]]
+        assert options[ids["mountain"]]["deselects"] == []
+
+    def test_chain_displaces_selected_option(self, db, bike):
+        """
+        Prueba que la cadena requires desplaza a la opción seleccionada de su tipo de parte
+        """
+        product, ids = bike
+
+        options = option_consequences(get_available_options(db, product.id, [ids["diamond"]]))
+
+        assert options[ids["mountain"]]["valid_if_selected"] is False
+        assert options[ids["mountain"]]["deselects"] == [ids["diamond"]]
+        assert options[ids["full_suspension"]]["valid_if_selected"] is True
+        assert options[ids["full_suspension"]]["deselects"] == [ids["diamond"]]
+        assert "valid_if_selected" not in options[ids["diamond"]]
+
+    def test_replacing_required_option_deselects_dependents(self, db, bike):
+        """
+        Prueba que sustituir una opción requerida obliga a quitar las que dependen de ella
+        """
+        product, ids = bike
+
+        options = option_consequences(get_available_options(db, product.id, [ids["full_suspension"], ids["mountain"]]))
+
+        assert options[ids["diamond"]]["valid_if_selected"] is False
+        assert options[ids["diamond"]]["deselects"] == [ids["full_suspension"], ids["mountain"]]
+        assert options[ids["road"]]["valid_if_selected"] is True
+
+    def test_matches_compatibility_check(self):
+        """
+        Prueba con catálogos aleatorios que el veredicto coincide con comprobar cada selección
+        """
+        for seed in range(100):
+            rnd = random.Random(seed)
+            part_types = [SimpleNamespace(id=10 + i, name=f"Tipo {i}") for i in range(rnd.randint(1, 4))]
+            options = []
+            for part_type in part_types:
+                for _ in range(rnd.randint(1, 4)):
+                    option_id = 100 + len(options)
+                    options.append(SimpleNamespace(
+                        id=option_id, name=f"Opción {option_id}", base_price=Decimal("10"),
+                        in_stock=rnd.random() < 0.9, part_type_id=part_type.id
+                    ))
+            option_ids = [option.id for option in options]
+            dependencies = [
+                SimpleNamespace(
+                    option_id=rnd.choice(option_ids), depends_on_option_id=rnd.choice(option_ids),
+                    type=rnd.choice([DependencyType.requires, DependencyType.excludes])
+                )
+                for _ in range(rnd.randint(0, 10))
+            ]
+            dependencies = [dep for dep in dependencies if dep.option_id != dep.depends_on_option_id]
+            index = ProductRuleIndex(
+                SimpleNamespace(id=1, name="Producto", base_price=Decimal("0"), catalog_version=0),
+                part_types, options, dependencies, []
+            )
+            engine = get_engine(index)
+            selection = rnd.sample(option_ids, rnd.randint(0, len(part_types)))
+
+            consequences = get_what_if_evaluator(index).evaluate(selection)
+
+            assert set(consequences) == set(option_ids) - set(selection)
+            for option in options:
+                if option.id in selection:
+                    continue
+                kept = [option_id for option_id in selection if index.options[option_id].part_type_id != option.part_type_id]
+                _, conflict = engine.check(kept + [option.id])
+                assert consequences[option.id]["valid_if_selected"] == (conflict is None)
+                if conflict is None:
+                    assert set(consequences[option.id]["deselects"]) == set(selection) - set(kept)
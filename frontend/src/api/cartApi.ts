@@ -6,6 +6,7 @@ export interface CartItem {
   id: number;
   product_id: number;
   price_snapshot: number | string; // Can come as string from the API
+  subtotal: number; // price_snapshot * quantity, computed by the server
   quantity: number;
   options: {
     id: number;
@@ -17,6 +18,8 @@ export interface Cart {
   id: number;
   user_id: string | null;
   created_at: string;
+  subtotal: number; // Sum of the item subtotals, computed by the server
+  item_count: number; // Total units in the cart
   items: CartItem[];
 }
 
@@ -54,6 +57,8 @@ const normalizeCartData = (cartData: any): Cart => {
       id: 0,
       user_id: null,
       created_at: new Date().toISOString(),
+      subtotal: 0,
+      item_count: 0,
       items: []
     };
   }
@@ -65,7 +70,8 @@ const normalizeCartData = (cartData: any): Cart => {
         // Ensure price_snapshot is a number
         price_snapshot: typeof item.price_snapshot === 'number' 
           ? item.price_snapshot 
-          : parseFloat(String(item.price_snapshot)) || 0
+          : parseFloat(String(item.price_snapshot)) || 0,
+        subtotal: parseFloat(String(item.subtotal)) || 0
       }))
     : [];
   
@@ -73,6 +79,8 @@ const normalizeCartData = (cartData: any): Cart => {
     id: cartData.id || 0,
     user_id: cartData.user_id || null,
     created_at: cartData.created_at || new Date().toISOString(),
+    subtotal: parseFloat(String(cartData.subtotal)) || 0,
+    item_count: cartData.item_count || 0,
     items: normalizedItems
   };
 };
@@ -51,6 +51,12 @@ interface PriceResponse {
   conditional_prices?: Record<string, any>;
 }
 
+interface ConfigurationResponse {
+  options: AvailablePartType[];
+  compatibility: any;
+  price: PriceResponse;
+}
+
 export const ProductsApi = {
   /**
    * Gets the list of all products
@@ -230,6 +236,33 @@ export const ProductsApi = {
     }
   },
 
+  /**
+   * Gets the available options, compatibility and price of a selection in a single request
+   */
+  configureProduct: async (productId: number, selectedOptions: number[]): Promise<ConfigurationResponse> => {
+    try {
+      const response = await apiClient.post(getApiUrl(`products/${productId}/configure`), {
+        selected_options: selectedOptions
+      });
+
+      const priceResponse: PriceResponse = {
+        total_price: Number(response.data.total_price) || 0
+      };
+      if (response.data.conditional_prices && Object.keys(response.data.conditional_prices).length > 0) {
+        priceResponse.conditional_prices = response.data.conditional_prices;
+      }
+
+      return {
+        options: Array.isArray(response.data.options) ? response.data.options : [],
+        compatibility: response.data.compatibility,
+        price: priceResponse
+      };
+    } catch (error) {
+      console.error('Error al configurar el producto:', error);
+      throw error;
+    }
+  },
+
   /**
    * Calculates the price of a product with selected options
    */
@@ -181,15 +181,8 @@ export default function CartPage() {
 
   // Calculate the total of the cart
   const calculateTotal = () => {
-    if (!cart || cart.items.length === 0) return 0;
-    return cart.items.reduce((total, item) => {
-      // Ensure price_snapshot is a number
-      const price = typeof item.price_snapshot === 'number' 
-        ? item.price_snapshot 
-        : parseFloat(String(item.price_snapshot)) || 0;
-      
-      return total + (price * item.quantity);
-    }, 0);
+    // The subtotal is computed by the server
+    return cart ? cart.subtotal : 0;
   };
 
   // Get product name
@@ -86,14 +86,8 @@ export default function CheckoutPage() {
 
   // Calculate cart total
   const calculateTotal = () => {
-    if (!cart || cart.items.length === 0) return 0;
-    return cart.items.reduce((total, item) => {
-      const price = typeof item.price_snapshot === 'number' 
-        ? item.price_snapshot 
-        : parseFloat(String(item.price_snapshot)) || 0;
-      
-      return total + (price * item.quantity);
-    }, 0);
+    // The subtotal is computed by the server
+    return cart ? cart.subtotal : 0;
   };
 
   // Calculate shipping cost (example)
@@ -305,9 +299,7 @@ export default function CheckoutPage() {
                       <span className="text-gray-800">{`Producto #${item.product_id}`}</span>
                     </div>
                     <span className="font-medium">
-                      €{((typeof item.price_snapshot === 'number' 
-                        ? item.price_snapshot 
-                        : parseFloat(String(item.price_snapshot)) || 0) * item.quantity).toFixed(2)}
+                      €{item.subtotal.toFixed(2)}
                     </span>
                   </div>
                 ))}
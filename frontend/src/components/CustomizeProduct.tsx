@@ -95,8 +95,9 @@ const CustomizeProduct: React.FC<CustomizeProductProps> = ({ product }) => {
         console.log('Product ID for options:', product.id);
         console.log('Selected options:', selectedOptionIds);
         
-        // Get available options from the API
-        const options = await ProductsApi.getProductOptions(product.id, selectedOptionIds);
+        // Get available options, compatibility and price from the API in a single request
+        const configuration = await ProductsApi.configureProduct(product.id, selectedOptionIds);
+        const options = configuration.options;
         console.log('Available options received:', options);
         
         // Detailed log of options for debugging
@@ -111,7 +112,7 @@ const CustomizeProduct: React.FC<CustomizeProductProps> = ({ product }) => {
           // Verify compatibility of selected options
           if (selectedOptionIds.length > 0) {
             try {
-              const compatibilityResult = await ProductsApi.validateCompatibility(selectedOptionIds, product.id);
+              const compatibilityResult = configuration.compatibility;
               console.log('Compatibility result:', compatibilityResult);
               
               // Update options with the compatibility result from the backend
@@ -139,7 +140,7 @@ const CustomizeProduct: React.FC<CustomizeProductProps> = ({ product }) => {
                 
                 // A continuación, calcular el precio y obtener los precios condicionales
                 try {
-                  const priceResponse = await ProductsApi.calculatePrice(selectedOptionIds);
+                  const priceResponse = configuration.price;
                   
                   if (priceResponse.total_price !== undefined) {
                     const basePrice = convertToValidPrice(product.basePrice, 0);
@@ -239,11 +240,12 @@ const CustomizeProduct: React.FC<CustomizeProductProps> = ({ product }) => {
             setAvailableOptions(options);
           }
           
-          // Process auto-selected options from the backend
+          // Process auto-selected options from the backend (requires chains completed by the validation)
           const newSelections = { ...selectedOptions };
           let selectionUpdated = false;
+          const validatedComponents: AvailablePartType[] = configuration.compatibility?.product?.components || options;
           
-          options.forEach(partType => {
+          validatedComponents.forEach(partType => {
             partType.options.forEach(option => {
               if (option.selected && (!newSelections[partType.id] || newSelections[partType.id] !== option.id)) {
                 console.log(`Auto-selecting option: ${option.name} (ID: ${option.id}) of type ${partType.name}`);
@@ -261,7 +263,7 @@ const CustomizeProduct: React.FC<CustomizeProductProps> = ({ product }) => {
           // Calculate total price
           if (selectedOptionIds.length > 0) {
             try {
-              const priceResponse = await ProductsApi.calculatePrice(selectedOptionIds);
+              const priceResponse = configuration.price;
               if (typeof priceResponse.total_price === 'number' && !isNaN(priceResponse.total_price)) {
                 const basePrice = typeof product.basePrice === 'number' && !isNaN(product.basePrice) ? product.basePrice : 0;
                 const optionsPrice = priceResponse.total_price;
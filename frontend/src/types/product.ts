@@ -64,6 +64,11 @@ export interface AvailableOption {
   available_for_selection?: boolean;
   selected?: boolean;
   availability_reason?: string;
+  marginal_price?: number;
+  price_delta?: number;
+  valid_if_selected?: boolean;
+  auto_selects?: number[];
+  deselects?: number[];
   conditional_price?: {
     originalPrice: number;
     conditionalPrice: number;